@@ -1,97 +1,213 @@
+import asyncio
+import time
 from telegram import Update
+from telegram.error import BadRequest, NetworkError, RetryAfter
 from telegram.ext import ContextTypes
 import logging
 from datetime import datetime
+from assistant_memory import build_messages, record_turn, reset_memory, fold_history
+from i18n import DEFAULT_LANG, t
+from metrics import observe_dependency, track_dependency
+from tracing import trace
 
-# Системные промпты по языкам
-assistant_system_prompts = {
-    "🇷🇺 Русский": (
-        "Ты — профессиональный автомобильный диагност. \n"
-        "Твоя задача — помочь пользователю определить неисправность машины по его описанию.\n"
-        "Уточняй симптомы, задавай наводящие вопросы, исключай причины.\n"
-        "Давай советы, какие элементы автомобиля проверить. Отвечай на русском языке."
-    ),
-    "🇵🇱 Polski": (
-        "Jesteś profesjonalnym diagnostą samochodowym.\n"
-        "Twoim zadaniem jest pomóc użytkownikowi zidentyfikować awarię auta na podstawie jego opisu.\n"
-        "Zadawaj pytania uzupełniające, wykluczaj możliwe przyczyny, doradzaj co sprawdzić.\n"
-        "Odpowiadaj po polsku."
-    ),
-    "🇬🇧 English": (
-        "You are a professional car diagnostic assistant.\n"
-        "Your goal is to help the user identify the car issue based on their description.\n"
-        "Ask follow-up questions, rule out possible causes, suggest what to check.\n"
-        "Respond in English."
-    )
-}
+# Не чаще одного редактирования в секунду на сообщение (лимиты Telegram)
+STREAM_EDIT_INTERVAL = 1.0
+REQUEST_TIMEOUT = 60
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Попытки отредактировать сообщение готовым ответом, прежде чем отправить его заново
+FINAL_EDIT_ATTEMPTS = 3
+
+# Незавершённые запросы к ИИ по user_id
+_active_requests = {}
 
 # Обработчик запуска помощника
 async def handle_assistant(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     context.user_data["awaiting_question"] = True
-    context.user_data["assistant_history"] = []
+    reset_memory(context.user_data)
 
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-    intro = {
-        "🇷🇺 Русский": "✍️ Опишите вашу проблему с автомобилем. Я помогу диагностировать.",
-        "🇵🇱 Polski": "✍️ Opisz problem z samochodem. Postaram się pomóc.",
-        "🇬🇧 English": "✍️ Describe your car issue. I will help you diagnose it."
-    }.get(lang, "✍️ Опишите вашу проблему.")
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+    await query.message.reply_text(t(lang, "assistant_intro"))
 
-    await query.message.reply_text(intro)
+# Отмена текущего запроса к ИИ (например, по /reset)
+def cancel_assistant_request(user_id) -> bool:
+    task = _active_requests.pop(user_id, None)
+    if task and not task.done():
+        task.cancel()
+        return True
+    return False
 
 # Обработчик сообщений от пользователя в режиме ассистента
-async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, openai_client, sheet_client=None, sheet_name=None):
+async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, openai_client, journal=None, response_cache=None):
     if not context.user_data.get("awaiting_question"):
         return
 
     user_input = update.message.text.strip()
+    user_id = update.effective_user.id
+    lang = context.user_data.get("lang", DEFAULT_LANG)
 
     if user_input.lower() in ["сброс", "reset", "новая проблема", "нова проблема"]:
-        context.user_data["assistant_history"] = []
-        await update.message.reply_text("🔁 История сброшена. Опишите новую проблему.")
+        cancel_assistant_request(user_id)
+        reset_memory(context.user_data)
+        await update.message.reply_text(t(lang, "assistant_reset"))
         return
 
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-    system_prompt = assistant_system_prompts.get(lang, assistant_system_prompts["🇷🇺 Русский"])
+    # Новый вопрос заменяет незавершённый ответ
+    cancel_assistant_request(user_id)
+
+    # Первый вопрос диалога — сначала ищем готовый ответ в кэше
+    first_turn = not context.user_data.get("assistant_history") and not context.user_data.get("assistant_summary")
+    if response_cache and first_turn:
+        system_prompt = t(lang, "assistant_system_prompt")
+        cached = response_cache.get(user_input, lang, system_prompt)
+        if cached:
+            record_turn(context.user_data, user_input, cached)
+            try:
+                await update.message.reply_text(cached[:TELEGRAM_MESSAGE_LIMIT], parse_mode="Markdown")
+            except BadRequest:
+                await update.message.reply_text(cached[:TELEGRAM_MESSAGE_LIMIT])
+            _log_dialog(journal, update, lang, user_input, cached)
+            return
 
-    history = context.user_data.get("assistant_history", [])
+    # Ответ генерируется в фоне, чтобы не задерживать обработку других обновлений
+    task = context.application.create_task(
+        _answer(update, context, openai_client, journal, user_input, response_cache if first_turn else None)
+    )
+    _active_requests[user_id] = task
+    task.add_done_callback(
+        lambda t: _active_requests.pop(user_id, None) if _active_requests.get(user_id) is t else None
+    )
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        *history,
-        {"role": "user", "content": user_input}
-    ]
+async def _answer(update: Update, context: ContextTypes.DEFAULT_TYPE, openai_client, journal, user_input: str, response_cache=None):
+    # Ответ идёт дольше обработчика, поэтому у него своё дерево трассировки
+    with trace("assistant_answer", detached=True):
+        await _stream_answer(update, context, openai_client, journal, user_input, response_cache)
+
+async def _stream_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, openai_client, journal, user_input: str, response_cache=None):
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+    system_prompt = t(lang, "assistant_system_prompt")
+
+    # Системный промпт + сводка + последние реплики в пределах бюджета токенов
+    messages, prompt_tokens, overflow = build_messages(context.user_data, system_prompt, user_input, lang)
+    logging.info("🧮 Токенов в запросе к ИИ: ~%d (сообщений: %d)", prompt_tokens, len(messages))
+
+    started = time.monotonic()
+    message = await update.message.reply_text("⏳")
+    reply = ""
 
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=0.7
-        )
-        reply = response.choices[0].message.content
+        async with asyncio.timeout(REQUEST_TIMEOUT):
+            with track_dependency("openai", "chat_stream"):
+                stream = await openai_client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    temperature=0.7,
+                    stream=True
+                )
+                try:
+                    last_edit = 0.0
+                    first_token = True
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        reply += chunk.choices[0].delta.content or ""
 
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": reply})
-        context.user_data["assistant_history"] = history
+                        # Редактируем сообщение не чаще STREAM_EDIT_INTERVAL секунд,
+                        # после RetryAfter — не раньше, чем разрешит Telegram
+                        now = time.monotonic()
+                        if reply.strip() and now - last_edit >= STREAM_EDIT_INTERVAL:
+                            if first_token:
+                                first_token = False
+                                logging.info("⚡ Первый токен ИИ через %.2f с", now - started)
+                                observe_dependency("openai", "first_token", now - started)
+                            last_edit = now + await _progress_edit(message, reply[:TELEGRAM_MESSAGE_LIMIT] + " ▌")
+                finally:
+                    await stream.close()
 
-        await update.message.reply_text(reply, parse_mode="Markdown")
+        if not reply.strip():
+            raise ValueError("пустой ответ модели")
 
-        # Логирование в Google Таблицу, если доступна
-        if sheet_client and sheet_name:
-            try:
-                sheet = sheet_client.open(sheet_name).worksheet("Диалоги")
-                sheet.append_row([
-                    str(update.effective_user.id),
-                    lang,
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    user_input,
-                    reply
-                ])
-            except Exception as log_err:
-                logging.warning("⚠️ Не удалось записать диалог в таблицу: %s", log_err)
+        record_turn(context.user_data, user_input, reply)
+        if response_cache:
+            response_cache.put(user_input, lang, system_prompt, reply)
+        if overflow:
+            # Старые реплики сворачиваются в сводку в фоне
+            context.application.create_task(
+                fold_history(context.user_data, update.effective_user.id, openai_client, overflow)
+            )
+
+        await _final_edit(update, message, reply[:TELEGRAM_MESSAGE_LIMIT], parse_mode="Markdown")
+        for offset in range(TELEGRAM_MESSAGE_LIMIT, len(reply), TELEGRAM_MESSAGE_LIMIT):
+            await update.message.reply_text(reply[offset:offset + TELEGRAM_MESSAGE_LIMIT])
+        logging.info("🤖 Ответ ИИ за %.2f с", time.monotonic() - started)
 
+    except asyncio.CancelledError:
+        await _progress_edit(message, (reply[:TELEGRAM_MESSAGE_LIMIT - 40] + "\n\n" if reply else "") + t(lang, "assistant_cancelled"))
+        raise
+    except TimeoutError:
+        logging.error("OpenAI timeout после %d с", REQUEST_TIMEOUT)
+        await _final_edit(update, message, t(lang, "assistant_timeout"))
+        return
     except Exception as e:
         logging.error("OpenAI error: %s", e)
-        await update.message.reply_text("⚠️ Ошибка при обращении к ИИ. Попробуйте позже.")
\ No newline at end of file
+        await _final_edit(update, message, t(lang, "assistant_error"))
+        return
+
+    _log_dialog(journal, update, lang, user_input, reply)
+
+# Журнал диалогов: строка уходит в лист «Диалоги» через журнал записи,
+# пачкой и с фоновым приоритетом, не задерживая ответ
+def _log_dialog(journal, update: Update, lang: str, user_input: str, reply: str):
+    if not journal:
+        return
+    try:
+        journal.enqueue("Диалоги", [
+            str(update.effective_user.id),
+            lang,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            user_input,
+            reply
+        ])
+    except Exception as log_err:
+        logging.warning("⚠️ Не удалось записать диалог в журнал: %s", log_err)
+
+# Редактирование сообщения; Markdown может не разобраться — тогда без разметки
+async def _edit(message, text: str, parse_mode=None):
+    try:
+        await message.edit_text(text, parse_mode=parse_mode)
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            return
+        if parse_mode:
+            await _edit(message, text)
+        else:
+            logging.warning("⚠️ Не удалось обновить ответ ИИ: %s", e)
+
+# Промежуточная правка при потоковом ответе: флуд-контроль и сетевые сбои её
+# только пропускают, ответ продолжает набираться. Возвращает, на сколько секунд
+# отложить следующую правку.
+async def _progress_edit(message, text: str) -> float:
+    try:
+        await _edit(message, text)
+    except RetryAfter as e:
+        logging.warning("⏳ RetryAfter %s с при обновлении ответа ИИ", e.retry_after)
+        return float(e.retry_after)
+    except NetworkError as e:
+        logging.warning("⚠️ Промежуточное обновление ответа ИИ пропущено: %s", e)
+    return 0.0
+
+# Итоговая правка: повторяем после RetryAfter и сетевых сбоев,
+# а если так и не вышло — отправляем текст новым сообщением
+async def _final_edit(update: Update, message, text: str, parse_mode=None):
+    for attempt in range(1, FINAL_EDIT_ATTEMPTS + 1):
+        try:
+            await _edit(message, text, parse_mode=parse_mode)
+            return
+        except RetryAfter as e:
+            logging.warning("⏳ RetryAfter %s с при итоговом обновлении ответа ИИ", e.retry_after)
+            if attempt < FINAL_EDIT_ATTEMPTS:
+                await asyncio.sleep(float(e.retry_after))
+        except NetworkError as e:
+            logging.warning("⚠️ Итоговое обновление ответа ИИ, попытка %d: %s", attempt, e)
+    await update.message.reply_text(text)
@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter, TimedOut
+
+import ai_diagnostic_agent
+
+
+# Сообщение бота: errors — исключения для очередных правок (None — правка проходит)
+class Message:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.edits = []
+        self.replies = []
+
+    async def edit_text(self, text, parse_mode=None):
+        error = self.errors.pop(0) if self.errors else None
+        if error:
+            raise error
+        self.edits.append(text)
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+class Stream:
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for part in self.parts:
+            await asyncio.sleep(0)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+
+    async def close(self):
+        pass
+
+
+def openai_client(parts):
+    async def create(**kwargs):
+        return Stream(parts)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+class Journal:
+    def __init__(self):
+        self.rows = []
+
+    def enqueue(self, tab, row):
+        self.rows.append((tab, row))
+
+
+def answer(bot_message, parts):
+    chat = Message()
+    chat.reply_text = lambda text, **kwargs: _first_reply(chat, bot_message, text)
+    update = SimpleNamespace(message=chat, effective_user=SimpleNamespace(id=42))
+    context = SimpleNamespace(user_data={}, application=SimpleNamespace(create_task=asyncio.ensure_future))
+    journal = Journal()
+    asyncio.run(ai_diagnostic_agent._stream_answer(update, context, openai_client(parts), journal, "Стучит подвеска"))
+    return chat, context, journal
+
+
+# Первое сообщение пользователю — заготовка «⏳», дальше — обычные ответы в чат
+async def _first_reply(chat, bot_message, text):
+    if text == "⏳":
+        return bot_message
+    chat.replies.append(text)
+    return chat
+
+
+# Флуд-контроль на промежуточной правке не теряет ответ
+def test_retry_after_on_progress_edit_keeps_answer(monkeypatch):
+    monkeypatch.setattr(ai_diagnostic_agent, "STREAM_EDIT_INTERVAL", 0)
+    message = Message([None, RetryAfter(3)])
+    chat, context, journal = answer(message, ["Проверьте ", "сайлентблоки ", "и стойки."])
+    assert message.edits[-1] == "Проверьте сайлентблоки и стойки."
+    assert context.user_data["assistant_history"][-1]["content"] == "Проверьте сайлентблоки и стойки."
+    assert journal.rows and journal.rows[0][0] == "Диалоги"
+    assert chat.replies == []
+    # После RetryAfter(3) промежуточные правки пропускаются до конца потока
+    assert len(message.edits) == 2
+
+
+# Итоговая правка не удалась — ответ приходит новым сообщением
+def test_final_edit_falls_back_to_new_message(monkeypatch):
+    monkeypatch.setattr(ai_diagnostic_agent, "STREAM_EDIT_INTERVAL", 60)
+    message = Message([None] + [TimedOut()] * ai_diagnostic_agent.FINAL_EDIT_ATTEMPTS * 2)
+    chat, context, journal = answer(message, ["Замените ", "свечи."])
+    assert chat.replies == ["Замените свечи."]
+    assert context.user_data["assistant_history"][-1]["content"] == "Замените свечи."
@@ -0,0 +1,103 @@
+import logging
+
+from i18n import LANGUAGES, t
+from metrics import track_dependency
+
+# Бюджет токенов на историю в запросе; кириллица и польский токенизируются
+# хуже английского, поэтому бюджет задаётся по языку
+TOKEN_BUDGETS = {
+    LANGUAGES["ru"]: 1800,
+    LANGUAGES["pl"]: 1800,
+    LANGUAGES["en"]: 1500
+}
+DEFAULT_TOKEN_BUDGET = 1500
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation between a car owner and a diagnostic assistant. "
+    "Keep the car make/model, symptoms, error codes, checks already done and advice given. "
+    "Be brief (up to 120 words) and write in the language of the conversation."
+)
+
+# Пользователи, для которых сейчас строится сводка
+_summarizing = set()
+
+
+# Оценка числа токенов без токенизатора: ~3 символа на токен плюс служебные
+def estimate_tokens(text: str) -> int:
+    return len(text) // 3 + 1
+
+def messages_tokens(messages) -> int:
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages) + 2
+
+def reset_memory(user_data: dict):
+    user_data["assistant_history"] = []
+    user_data.pop("assistant_summary", None)
+
+
+# Сборка запроса: системный промпт, сводка и последние реплики в пределах бюджета.
+# Возвращает сообщения, оценку токенов и число старых реплик, не попавших в запрос.
+def build_messages(user_data: dict, system_prompt: str, user_input: str, lang: str):
+    history = user_data.get("assistant_history", [])
+    summary = user_data.get("assistant_summary")
+    budget = TOKEN_BUDGETS.get(lang, DEFAULT_TOKEN_BUDGET)
+
+    head = [{"role": "system", "content": system_prompt}]
+    if summary:
+        prefix = t(lang, "assistant_summary_prefix")
+        head.append({"role": "system", "content": f"{prefix}\n{summary}"})
+    tail = [{"role": "user", "content": user_input}]
+
+    used = messages_tokens(head + tail)
+    keep_from = len(history)
+    # Берём реплики с конца парами (вопрос + ответ), пока влезают в бюджет
+    while keep_from >= 2:
+        pair_tokens = messages_tokens(history[keep_from - 2:keep_from]) - 2
+        if used + pair_tokens > budget:
+            break
+        used += pair_tokens
+        keep_from -= 2
+
+    messages = head + history[keep_from:] + tail
+    return messages, used, keep_from
+
+def record_turn(user_data: dict, user_input: str, reply: str):
+    history = user_data.setdefault("assistant_history", [])
+    history.append({"role": "user", "content": user_input})
+    history.append({"role": "assistant", "content": reply})
+
+
+# Свернуть старые реплики в сводку (вызывается в фоне, вне пути ответа)
+async def fold_history(user_data: dict, user_id, openai_client, count: int):
+    if count <= 0 or user_id in _summarizing:
+        return
+    _summarizing.add(user_id)
+    try:
+        history = user_data.get("assistant_history", [])
+        old_turns = history[:count]
+        previous = user_data.get("assistant_summary")
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in old_turns)
+        if previous:
+            transcript = f"Previous summary:\n{previous}\n\n{transcript}"
+
+        with track_dependency("openai", "summary"):
+            response = await openai_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ],
+                temperature=0.2
+            )
+        summary = response.choices[0].message.content.strip()
+
+        # История могла быть сброшена, пока строилась сводка
+        if user_data.get("assistant_history") is not history or history[:count] != old_turns:
+            return
+        del history[:count]
+        user_data["assistant_summary"] = summary
+        logging.info("🗜️ История ассистента свёрнута: %d сообщений → сводка", count)
+    except Exception as e:
+        logging.warning("⚠️ Не удалось свернуть историю ассистента: %s", e)
+    finally:
+        _summarizing.discard(user_id)
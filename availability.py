@@ -0,0 +1,322 @@
+import copy
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, time
+from itertools import islice
+
+from dateutil.parser import isoparse
+
+DEFAULT_WORK_START = time(8, 0)
+DEFAULT_WORK_END = time(18, 0)
+DEFAULT_WORKDAYS = (0, 1, 2, 3, 4)  # Пн–Пт
+
+
+# Сортировка и слияние занятых интервалов (epoch-секунды) за один проход
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+# Разбор ответа freebusy в интервалы epoch-секунд
+def parse_busy(busy_times, tz):
+    intervals = []
+    for b in busy_times:
+        start = isoparse(b["start"])
+        end = isoparse(b["end"])
+        if start.tzinfo is None:
+            start = tz.localize(start)
+        if end.tzinfo is None:
+            end = tz.localize(end)
+        intervals.append((start.timestamp(), end.timestamp()))
+    return intervals
+
+
+# Индекс свободных промежутков: промежутки (начало, длина в ячейках, смещение от начала дня)
+# отсортированы по началу, над длинами — дерево отрезков с максимумом. Первый промежуток
+# не левее заданного, в который помещается работа длиной D, находится за O(log n)
+# без перебора всех слотов.
+class GapIndex:
+    def __init__(self, gaps):
+        self.gaps = gaps
+        self.starts = [start for start, _, _ in gaps]
+        size = 1
+        while size < len(gaps):
+            size *= 2
+        self._size = size
+        tree = [0] * (2 * size)
+        tree[size:size + len(gaps)] = [length for _, length, _ in gaps]
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self._tree = tree
+
+    def __len__(self):
+        return len(self.gaps)
+
+    # Номер промежутка, который может содержать момент ts (или первого после него)
+    def position(self, ts: float) -> int:
+        return max(bisect_right(self.starts, ts) - 1, 0)
+
+    # Номер последнего промежутка, начинающегося раньше ts (-1 — таких нет)
+    def position_before(self, ts: float) -> int:
+        return bisect_left(self.starts, ts) - 1
+
+    # Первый промежуток с номером >= first длиной не меньше cells; None — такого нет
+    def find(self, first: int, cells: int):
+        if first >= len(self.gaps):
+            return None
+        node = first + self._size
+        if self._tree[node] >= cells:
+            return first
+        # Вверх, пока у левого потомка не найдётся подходящий правый сосед
+        while node > 1:
+            if node % 2 == 0 and self._tree[node + 1] >= cells:
+                node += 1
+                break
+            node //= 2
+        else:
+            return None
+        # Вниз к самому левому подходящему листу
+        while node < self._size:
+            node = 2 * node if self._tree[2 * node] >= cells else 2 * node + 1
+        return node - self._size
+
+    # Последний промежуток с номером <= last длиной не меньше cells (зеркально find)
+    def find_last(self, last: int, cells: int):
+        if last < 0:
+            return None
+        node = min(last, len(self.gaps) - 1) + self._size
+        if self._tree[node] >= cells:
+            return node - self._size
+        while node > 1:
+            if node % 2 == 1 and self._tree[node - 1] >= cells:
+                node -= 1
+                break
+            node //= 2
+        else:
+            return None
+        while node < self._size:
+            node = 2 * node + 1 if self._tree[2 * node + 1] >= cells else 2 * node
+        return node - self._size
+
+
+# Движок свободного времени: занятость каждого рабочего дня хранится
+# битовой маской (бит = минимальный шаг сетки), поэтому проверка
+# "свободен ли слот" — O(1), а поиск слотов — один линейный проход.
+class AvailabilityEngine:
+    def __init__(self, busy_intervals, tz, start_date, days: int,
+                 work_start: time = DEFAULT_WORK_START, work_end: time = DEFAULT_WORK_END,
+                 workdays=DEFAULT_WORKDAYS, granularity: timedelta = timedelta(minutes=30)):
+        self.tz = tz
+        self.granularity = int(granularity.total_seconds())
+        self.busy = merge_intervals(busy_intervals)
+
+        # Рабочие окна дней: (дата, начало в epoch, число ячеек сетки)
+        self._days = []
+        self._day_index = {}
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            if day.weekday() not in workdays:
+                continue
+            day_start = tz.localize(datetime.combine(day, work_start)).timestamp()
+            day_end = tz.localize(datetime.combine(day, work_end)).timestamp()
+            cells = int(day_end - day_start) // self.granularity
+            self._day_index[day] = len(self._days)
+            self._days.append((day, day_start, cells))
+
+        self._bitmaps = self._build_bitmaps()
+        self._gaps = None
+
+    # Два указателя: интервалы и дни отсортированы, каждый просматривается один раз
+    def _build_bitmaps(self):
+        bitmaps = [0] * len(self._days)
+        first_interval = 0
+        for i, (_, day_start, cells) in enumerate(self._days):
+            day_end = day_start + cells * self.granularity
+            while first_interval < len(self.busy) and self.busy[first_interval][1] <= day_start:
+                first_interval += 1
+            j = first_interval
+            bitmap = 0
+            while j < len(self.busy) and self.busy[j][0] < day_end:
+                start, end = self.busy[j]
+                first = max(int(start - day_start) // self.granularity, 0)
+                last = min(-(-int(end - day_start) // self.granularity), cells)
+                if last > first:
+                    bitmap |= ((1 << (last - first)) - 1) << first
+                j += 1
+            bitmaps[i] = bitmap
+        return bitmaps
+
+    # Те же рабочие дни с другой занятостью: окна дней не пересчитываются
+    def with_busy(self, busy_intervals):
+        engine = copy.copy(self)
+        engine.busy = merge_intervals(busy_intervals)
+        engine._bitmaps = engine._build_bitmaps()
+        engine._gaps = None
+        return engine
+
+    # Свободные промежутки всех дней; строится один раз при первом поиске
+    @property
+    def gaps(self) -> GapIndex:
+        if self._gaps is None:
+            gaps = []
+            for index, (_, day_start, cells) in enumerate(self._days):
+                free = ~self._bitmaps[index] & ((1 << cells) - 1)
+                while free:
+                    first = (free & -free).bit_length() - 1
+                    run = free >> first
+                    length = (~run & (run + 1)).bit_length() - 1
+                    gaps.append((day_start + first * self.granularity, length, first))
+                    free &= ~(((1 << length) - 1) << first)
+            self._gaps = GapIndex(gaps)
+        return self._gaps
+
+    def _cells(self, duration: timedelta) -> int:
+        return max(-(-int(duration.total_seconds()) // self.granularity), 1)
+
+    # Свободен ли интервал [start, end) — O(1) по битовой маске дня
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        local_start = start.astimezone(self.tz)
+        index = self._day_index.get(local_start.date())
+        if index is None:
+            return False
+        _, day_start, cells = self._days[index]
+        offset = start.timestamp() - day_start
+        if offset < 0 or offset % self.granularity:
+            return False
+        first = int(offset) // self.granularity
+        count = self._cells(end - start)
+        if first + count > cells:
+            return False
+        mask = ((1 << count) - 1) << first
+        return not self._bitmaps[index] & mask
+
+    # Генератор свободных слотов заданной длины (шаг — длина слота по умолчанию).
+    # Промежутки короче работы пропускаются спуском по индексу, а не перебором.
+    def iter_free_slots(self, duration: timedelta = timedelta(minutes=30), step: timedelta = None, not_before: datetime = None):
+        count = self._cells(duration)
+        step_cells = self._cells(step or duration)
+        threshold = not_before.timestamp() if not_before else None
+        index = self.gaps
+        position = index.position(threshold) if threshold is not None else 0
+        while True:
+            position = index.find(position, count)
+            if position is None:
+                return
+            gap_start, length, offset = index.gaps[position]
+            day_start = gap_start - offset * self.granularity
+            # Начала слотов — на сетке шага от начала рабочего дня
+            first = -(-offset // step_cells) * step_cells
+            if threshold is not None and gap_start < threshold:
+                passed = -(-int(threshold - day_start) // self.granularity)
+                first = max(first, -(-passed // step_cells) * step_cells)
+            while first + count <= offset + length:
+                start = datetime.fromtimestamp(day_start + first * self.granularity, self.tz)
+                yield start, start + duration
+                first += step_cells
+            position += 1
+
+    # Те же слоты в обратном порядке, строго раньше before — для листания назад
+    def iter_free_slots_reverse(self, duration: timedelta, step: timedelta = None, before: datetime = None):
+        count = self._cells(duration)
+        step_cells = self._cells(step or duration)
+        index = self.gaps
+        threshold = before.timestamp() if before else float("inf")
+        position = index.position_before(threshold) if before else len(index) - 1
+        while True:
+            position = index.find_last(position, count)
+            if position is None:
+                return
+            gap_start, length, offset = index.gaps[position]
+            day_start = gap_start - offset * self.granularity
+            last = offset + length - count
+            if threshold < gap_start + length * self.granularity:
+                last = min(last, -(-int(threshold - day_start) // self.granularity) - 1)
+            cell = last // step_cells * step_cells
+            lowest = -(-offset // step_cells) * step_cells
+            while cell >= lowest:
+                start = datetime.fromtimestamp(day_start + cell * self.granularity, self.tz)
+                yield start, start + duration
+                cell -= step_cells
+            position -= 1
+
+    def free_slots(self, duration: timedelta = timedelta(minutes=30), limit: int = None, **kwargs):
+        return list(islice(self.iter_free_slots(duration, **kwargs), limit))
+
+
+# Несколько постов (подъёмников), у каждого свой календарь. Слот свободен, если хотя бы
+# на одном посту свободен весь интервал работы: слоты постов сливаются по времени начала.
+class BayAvailability:
+    def __init__(self, busy_by_bay: dict, tz, start_date, days: int, **kwargs):
+        if not busy_by_bay:
+            raise ValueError("Нужен хотя бы один пост")
+        bays = iter(busy_by_bay.items())
+        first_bay, first_busy = next(bays)
+        # Окна дней считаются один раз и общие для всех постов
+        self._first = AvailabilityEngine(first_busy, tz, start_date, days, **kwargs)
+        self.bays = {first_bay: self._first}
+        for bay, intervals in bays:
+            self.bays[bay] = self._first.with_busy(intervals)
+        self.tz = tz
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        return any(engine.is_free(start, end) for engine in self.bays.values())
+
+    def iter_free_slots(self, duration: timedelta = timedelta(minutes=30), step: timedelta = None, not_before: datetime = None):
+        streams = [engine.iter_free_slots(duration, step, not_before) for engine in self.bays.values()]
+        if len(streams) == 1:
+            yield from streams[0]
+            return
+        previous = None
+        for start, end in heapq.merge(*streams):
+            if start != previous:
+                previous = start
+                yield start, end
+
+    def iter_free_slots_reverse(self, duration: timedelta, step: timedelta = None, before: datetime = None):
+        streams = [engine.iter_free_slots_reverse(duration, step, before) for engine in self.bays.values()]
+        if len(streams) == 1:
+            yield from streams[0]
+            return
+        previous = None
+        for start, end in heapq.merge(*streams, reverse=True):
+            if start != previous:
+                previous = start
+                yield start, end
+
+    def free_slots(self, duration: timedelta = timedelta(minutes=30), limit: int = None, **kwargs):
+        return list(islice(self.iter_free_slots(duration, **kwargs), limit))
+
+    # Дни, в которые помещается работа: по одному поиску в индексе на день
+    def free_days(self, duration: timedelta, step: timedelta = None, limit: int = None):
+        table = self._first._days
+        days = []
+        not_before = None
+        while limit is None or len(days) < limit:
+            slot = next(self.iter_free_slots(duration, step, not_before), None)
+            if slot is None:
+                break
+            day = slot[0].date()
+            days.append(day)
+            # Следующий поиск — с открытия следующего рабочего дня
+            index = self._first._day_index[day] + 1
+            if index >= len(table):
+                break
+            not_before = datetime.fromtimestamp(table[index][1], self.tz)
+        return days
+
+    # Посты, свободные в [start, end): сначала наименее загруженные в этот день,
+    # при равенстве — в порядке настройки
+    def free_bays(self, start: datetime, end: datetime):
+        index = self._first._day_index.get(start.astimezone(self.tz).date())
+        if index is None:
+            return []
+        free = [bay for bay, engine in self.bays.items() if engine.is_free(start, end)]
+        return sorted(free, key=lambda bay: bin(self.bays[bay]._bitmaps[index]).count("1"))
@@ -0,0 +1,206 @@
+# Бенчмарки основных путей бота на синтетических данных, без сети:
+#   slots       — get_free_slots: 0–5000 занятых интервалов, горизонт 14–180 дней;
+#                 поиск по готовому индексу (30 мин и 4 ч), с перестройкой индекса
+#                 и листание страниц слотов вперёд/назад, список дней
+#   subscribers — загрузка индекса и поиск подписчика, как в start/back_to_menu (100–100k строк)
+#   sheets      — разбор листов «Акции» и «Контакты» (load_promos/load_contacts_from_sheet)
+#   history     — сборка запроса к ИИ и сериализация сессии при росте истории помощника
+#
+#   python benchmarks/bench_hot_paths.py                    # замер и сравнение с базой
+#   python benchmarks/bench_hot_paths.py --group slots
+#   python benchmarks/bench_hot_paths.py --save-baseline
+#   python benchmarks/bench_hot_paths.py --json /tmp/new.json --compare /tmp/old.json
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from harness import ROOT, Suite, main
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+BUSY_COUNTS = (0, 100, 1000, 5000)
+HORIZONS = (14, 60, 180)
+SUBSCRIBER_COUNTS = (100, 1000, 10_000, 100_000)
+SHEET_ROWS = (10, 1000, 10_000)
+HISTORY_TURNS = (10, 100, 1000)
+
+
+def import_bot(data_dir: str):
+    for name, value in {
+        "BOT_TOKEN": "123456:BENCH",
+        "ADMIN_ID": "1",
+        "CALENDAR_ID": "bench-calendar",
+        "GOOGLE_SHEET_NAME": "bench",
+        "GOOGLE_SHEET_TAB": "Zlecenia",
+        "BOT_DATA_DIR": data_dir,
+        "METRICS_PORT": "0",
+    }.items():
+        os.environ.setdefault(name, value)
+    import bot
+    logging.getLogger().setLevel(logging.WARNING)
+    return bot
+
+
+# Занятые интервалы в рабочие часы на горизонте days дней
+def busy_events(tz, count: int, days: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    today = datetime.now(tz).date()
+    events = {}
+    for number in range(count):
+        day = today + timedelta(days=rng.randint(1, days))
+        start = tz.localize(datetime.combine(day, datetime.min.time()).replace(hour=rng.randint(8, 17)))
+        start += timedelta(minutes=30 * rng.randint(0, 1))
+        end = start + timedelta(minutes=30 * rng.randint(1, 3))
+        events[f"e{number}"] = (start.timestamp(), end.timestamp())
+    return events
+
+
+def add_slot_cases(suite: Suite, bot):
+    tz = bot.pytz.timezone("Europe/Warsaw")
+    for count in BUSY_COUNTS:
+        for days in HORIZONS:
+            events = busy_events(tz, count, days)
+
+            # Зеркала календарей получают свою выборку перед замером
+            def use_events(events=events):
+                for mirror in bot.calendar_mirrors.values():
+                    mirror._events = events
+                    mirror.ready = True
+                    mirror.last_sync = time.time()
+                    mirror.version += 1
+
+            async def first_page(days=days):
+                return await bot.get_free_slots(days=days, limit=10)
+
+            async def all_slots(days=days):
+                return await bot.get_free_slots(days=days, limit=None)
+
+            async def long_job(days=days):
+                return await bot.get_free_slots(days=days, limit=10, duration=timedelta(hours=4))
+
+            # Календарь изменился: индекс строится заново
+            async def rebuild(days=days):
+                for mirror in bot.calendar_mirrors.values():
+                    mirror.version += 1
+                return await bot.get_free_slots(days=days, limit=10)
+
+            suite.add("slots", f"busy={count},days={days},limit=10", first_page, use_events)
+            suite.add("slots", f"busy={count},days={days},all", all_slots, use_events)
+            suite.add("slots", f"busy={count},days={days},4h,limit=10", long_job, use_events)
+            suite.add("slots", f"busy={count},days={days},rebuild", rebuild, use_events)
+
+        # Листание страниц от курсора в середине горизонта по закэшированному индексу
+        middle = tz.localize(datetime.combine(datetime.now(tz).date() + timedelta(days=90), datetime.min.time()))
+
+        async def page_later():
+            engine = await bot.get_availability(180)
+            return bot.slot_page(engine, bot.SLOT_DURATION, after=middle)
+
+        async def page_earlier():
+            engine = await bot.get_availability(180)
+            return bot.slot_page(engine, bot.SLOT_DURATION, before=middle)
+
+        async def day_list():
+            engine = await bot.get_availability(180)
+            return engine.free_days(bot.SLOT_DURATION, bot.SLOT_STEP, limit=30)
+
+        # use_events после цикла — выборка для горизонта 180 дней
+        suite.add("slots", f"busy={count},days=180,page_later", page_later, use_events)
+        suite.add("slots", f"busy={count},days=180,page_earlier", page_earlier, use_events)
+        suite.add("slots", f"busy={count},days=180,day_list", day_list, use_events)
+
+
+# Таблица для SheetMirror: подписчики, акции и контакты заданного размера
+def spreadsheet(bot, subscribers: int = 0, rows: int = 3):
+    from fake_services import FakeSheetsClient, FakeSpreadsheet
+    langs = ["Русский", "Polski", "English"]
+    return FakeSheetsClient(FakeSpreadsheet({
+        bot.SHEET_TAB: [["ID"]],
+        "Подписчики": [["user_id", "lang"]] + [[str(1_000_000 + i), langs[i % 3]] for i in range(subscribers)],
+        "Акции": [["lang", "text"]] + [[langs[i % 3], f"🔧 Акция {i}: скидка на диагностику"] for i in range(rows)],
+        "Контакты": [["key", "value"]] + [[f"key{i}", f" value {i} "] for i in range(rows)],
+        "Диалоги": [["user_id"]],
+    }))
+
+
+# Локальная копия таблицы перезагружается, только когда меняется набор данных
+def sheet_loader(bot):
+    current = {}
+
+    async def load(subscribers: int = 0, rows: int = 3):
+        if current.get("key") == (subscribers, rows):
+            return
+        bot._clients["sheets"] = spreadsheet(bot, subscribers, rows)
+        bot.sheets._spreadsheet = None
+        bot.sheets._worksheets = {}
+        await bot.sheet_mirror.pull()
+        await bot.subscriber_index.load()
+        current["key"] = (subscribers, rows)
+    return load
+
+
+def add_subscriber_cases(suite: Suite, bot, load_sheets):
+    for count in SUBSCRIBER_COUNTS:
+        async def prepare(count=count):
+            await load_sheets(subscribers=count)
+
+        async def load():
+            await bot.subscriber_index.load()
+
+        async def lookup_hit(user_id=str(1_000_000 + count // 2)):
+            return await bot.subscriber_index.get(user_id)
+
+        async def lookup_miss():
+            return await bot.subscriber_index.is_subscribed("42")
+
+        suite.add("subscribers", f"rows={count},load", load, prepare)
+        suite.add("subscribers", f"rows={count},lookup_hit", lookup_hit, prepare)
+        suite.add("subscribers", f"rows={count},lookup_miss", lookup_miss, prepare)
+
+
+def add_sheet_cases(suite: Suite, bot, load_sheets):
+    for rows in SHEET_ROWS:
+        async def prepare(rows=rows):
+            await load_sheets(rows=rows)
+
+        suite.add("sheets", f"rows={rows},load_promos", bot.load_promos_from_sheet, prepare)
+        suite.add("sheets", f"rows={rows},load_contacts", bot.load_contacts_from_sheet, prepare)
+
+
+def add_history_cases(suite: Suite):
+    from assistant_memory import build_messages, record_turn
+    lang = "🇷🇺 Русский"
+    prompt = "Ты — помощник автосервиса. " * 20
+    for turns in HISTORY_TURNS:
+        user_data = {"lang": lang, "assistant_history": []}
+        for number in range(turns):
+            record_turn(user_data, f"Вопрос {number}: стук в подвеске на кочках " * 3,
+                        f"Ответ {number}: проверьте стойки стабилизатора и сайлентблоки. " * 8)
+
+        def build(user_data=user_data):
+            return build_messages(user_data, prompt, "Что ещё проверить?", lang)
+
+        # Сессия целиком пишется в SQLite при каждом сохранении
+        def serialize(user_data=user_data):
+            return json.dumps(user_data, ensure_ascii=False, default=str)
+
+        suite.add("history", f"turns={turns},build_messages", build)
+        suite.add("history", f"turns={turns},serialize_session", serialize)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory(prefix="bench-") as data_dir:
+        bot = import_bot(data_dir)
+        load_sheets = sheet_loader(bot)
+        suite = Suite("hot_paths")
+        add_slot_cases(suite, bot)
+        add_subscriber_cases(suite, bot, load_sheets)
+        add_sheet_cases(suite, bot, load_sheets)
+        add_history_cases(suite)
+        main(suite)
@@ -0,0 +1,90 @@
+# Замер времени запуска bot.py без сети: импорт модуля, сборка Application
+# и проверка, что тяжёлые модули Google/OpenAI не загружаются при старте.
+#
+#   python benchmarks/bench_startup.py               # замер и сравнение с базой
+#   python benchmarks/bench_startup.py --save-baseline
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from harness import git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "startup.json")
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import bot
+elapsed = time.perf_counter() - started
+lazy = [name for name in ("gspread", "googleapiclient", "openai") if name in sys.modules]
+print(elapsed, ",".join(lazy))
+"""
+
+
+def run_once(data_dir: str):
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123456:TEST",
+        "ADMIN_ID": "1",
+        "CALENDAR_ID": "test-calendar",
+        "GOOGLE_SHEET_NAME": "test",
+        "GOOGLE_SHEET_TAB": "Zlecenia",
+        "BOT_DATA_DIR": data_dir,
+        "PYTHONWARNINGS": "ignore",
+    })
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    elapsed, loaded = (output.split(" ", 1) + [""])[:2]
+    return float(elapsed), [name for name in loaded.split(",") if name]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=1.25, help="допустимое замедление относительно базы")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    timings = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for _ in range(args.runs):
+            elapsed, loaded = run_once(data_dir)
+            timings.append(elapsed)
+            if loaded:
+                print(f"❌ При запуске загружены тяжёлые модули: {', '.join(loaded)}")
+                sys.exit(1)
+
+    result = {
+        "commit": git_commit(),
+        "median": statistics.median(timings),
+        "p95": sorted(timings)[max(int(len(timings) * 0.95) - 1, 0)],
+        "runs": args.runs,
+    }
+    print(f"🚀 Импорт bot.py: медиана {result['median'] * 1000:.0f} мс, p95 {result['p95'] * 1000:.0f} мс")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE), exist_ok=True)
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 База сохранена: {BASELINE}")
+        return
+
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as f:
+            baseline = json.load(f)
+        ratio = result["median"] / baseline["median"]
+        print(f"📊 Относительно базы: x{ratio:.2f}")
+        if ratio > args.threshold:
+            print("❌ Запуск стал медленнее допустимого")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
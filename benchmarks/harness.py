@@ -0,0 +1,160 @@
+# Общая часть бенчмарков: калибровка числа повторов, статистика по раундам,
+# сохранение результатов в JSON и сравнение с базой (или с результатом другого коммита).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, "benchmarks", "baselines")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class Suite:
+    def __init__(self, name: str):
+        self.name = name
+        self.cases = []  # (группа, имя, функция без аргументов — обычная или async, подготовка)
+        self._loop = None
+
+    # setup() (обычная или async) выполняется один раз перед замером и в него не входит
+    def add(self, group: str, name: str, func, setup=None):
+        self.cases.append((group, name, func, setup))
+
+    def groups(self):
+        return sorted({case[0] for case in self.cases})
+
+    # Время n вызовов; async-функции вызываются внутри одной корутины,
+    # чтобы не мерить запуск цикла событий
+    def _timer(self, func):
+        if asyncio.iscoroutinefunction(func):
+            async def batch(n):
+                started = time.perf_counter()
+                for _ in range(n):
+                    await func()
+                return time.perf_counter() - started
+            return lambda n: self._loop.run_until_complete(batch(n))
+
+        def run(n):
+            started = time.perf_counter()
+            for _ in range(n):
+                func()
+            return time.perf_counter() - started
+        return run
+
+    # Как в pytest-benchmark: подбираем число вызовов на раунд, чтобы раунд длился не меньше min_time
+    def measure(self, func, rounds: int, min_time: float) -> dict:
+        timer = self._timer(func)
+        timer(1)  # прогрев
+        number = 1
+        elapsed = timer(number)
+        while elapsed < min_time and number < 1 << 20:
+            number = number * 10 if elapsed <= 0 else max(number * 2, int(number * min_time / elapsed * 1.1))
+            elapsed = timer(number)
+        samples = [timer(number) / number for _ in range(rounds)]
+        return {
+            "min": min(samples),
+            "median": statistics.median(samples),
+            "mean": statistics.fmean(samples),
+            "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            "rounds": rounds,
+            "iterations": number,
+        }
+
+    def run(self, groups=None, rounds: int = 5, min_time: float = 0.05) -> dict:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        results = {}
+        try:
+            for group, name, func, setup in self.cases:
+                if groups and group not in groups:
+                    continue
+                if setup is not None:
+                    prepared = setup()
+                    if asyncio.iscoroutine(prepared):
+                        self._loop.run_until_complete(prepared)
+                key = f"{group}/{name}"
+                results[key] = self.measure(func, rounds, min_time)
+                print(f"{key:<58}{format_seconds(results[key]['median']):>12}  ±{format_seconds(results[key]['stddev'])}")
+        finally:
+            self._loop.close()
+        return {
+            "suite": self.name,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": results,
+        }
+
+
+def format_seconds(value: float) -> str:
+    if value >= 1:
+        return f"{value:.2f} с"
+    if value >= 1e-3:
+        return f"{value * 1e3:.2f} мс"
+    return f"{value * 1e6:.1f} мкс"
+
+
+# Сравнение медиан; True — регрессий сверх порога нет
+def compare(report: dict, baseline: dict, threshold: float) -> bool:
+    print(f"\n📊 Сравнение с {baseline.get('commit') or 'базой'} ({baseline.get('created', '?')}):")
+    ok = True
+    for key, result in report["results"].items():
+        previous = baseline["results"].get(key)
+        if not previous:
+            continue
+        ratio = result["median"] / previous["median"]
+        mark = "❌" if ratio > threshold else ("✅" if ratio < 1 / threshold else "  ")
+        print(f"{mark} {key:<56}{format_seconds(previous['median']):>12} → {format_seconds(result['median']):>12}  x{ratio:.2f}")
+        ok = ok and ratio <= threshold
+    return ok
+
+
+def main(suite: Suite):
+    baseline_path = os.path.join(BASELINES, f"{suite.name}.json")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--group", action="append", choices=suite.groups(), help="только эти группы")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="минимальная длительность раунда, с")
+    parser.add_argument("--threshold", type=float, default=1.25, help="допустимое замедление медианы")
+    parser.add_argument("--compare", default=baseline_path, help="JSON для сравнения (база или результат другого коммита)")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    report = suite.run(args.group, args.rounds, args.min_time)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        if args.group and os.path.exists(baseline_path):
+            # Частичный прогон обновляет только свои группы
+            with open(baseline_path, encoding="utf-8") as f:
+                merged = json.load(f)
+            merged["results"].update(report["results"])
+            report = dict(report, results=merged["results"])
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 База сохранена: {baseline_path}")
+        return
+
+    if os.path.exists(args.compare):
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.threshold):
+            print("❌ Есть замедления сверх допустимого")
+            sys.exit(1)
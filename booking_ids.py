@@ -0,0 +1,53 @@
+import logging
+import os
+import sqlite3
+
+
+# Монотонный счётчик номеров заявок в локальном файле SQLite.
+# Номер выдаётся одним атомарным UPDATE, поэтому два одновременных
+# бронирования (в том числе из разных процессов бота) не получат один номер.
+class BookingIdAllocator:
+    def __init__(self, path: str, name: str = "bookings"):
+        self.name = name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None — каждая команда сама по себе транзакция
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS counters ("
+            " name TEXT PRIMARY KEY,"
+            " value INTEGER NOT NULL)"
+        )
+
+    def is_seeded(self) -> bool:
+        cursor = self._db.execute("SELECT 1 FROM counters WHERE name = ?", (self.name,))
+        return cursor.fetchone() is not None
+
+    # Начальное значение — последний номер из таблицы; счётчик никогда не уменьшается
+    def seed(self, last_id: int):
+        self._db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+            (self.name, last_id)
+        )
+        logging.info("🔢 Счётчик заявок: последний номер %d", last_id)
+
+    def next_id(self) -> int:
+        row = self._db.execute(
+            "UPDATE counters SET value = value + 1 WHERE name = ? RETURNING value",
+            (self.name,)
+        ).fetchone()
+        if row is None:
+            raise RuntimeError("Счётчик заявок не инициализирован")
+        return row[0]
+
+
+# Последний номер заявки по строкам листа (без заголовка)
+def last_booking_id(rows) -> int:
+    last_id = max(len(rows) - 1, 0)
+    for row in rows[1:]:
+        if row and row[0].strip().isdigit():
+            last_id = max(last_id, int(row[0].strip()))
+    return last_id
@@ -1,20 +1,39 @@
 import os
+import asyncio
 import logging
+import threading
+import time as time_module
 import re
+import secrets
+from itertools import islice
 from datetime import datetime, timedelta, time
 from dateutil.parser import parse as parse_datetime
 from dateutil.parser import isoparse
 import pytz
-from openai import OpenAI
 from telegram import BotCommand, BotCommandScopeDefault, BotCommandScopeChatMember, BotCommandScopeChatAdministrators
 from collections import defaultdict
 from telegram import ReplyKeyboardMarkup
-from ai_diagnostic_agent import handle_assistant, handle_user_message
+from ai_diagnostic_agent import handle_assistant, handle_user_message, cancel_assistant_request
+from subscriber_index import SubscriberIndex, SUBSCRIBERS_TAB
+from sheets_async import AsyncSheets
+from sheets_quota import BACKGROUND, BOOKING, QuotaScheduler, sheets_priority
+from write_queue import WriteBehindQueue
+from booking_ids import BookingIdAllocator, last_booking_id
+from reservations import ReservationLedger
+from jobs import BackgroundJobs, StageTimer
+from metrics import InstrumentedRequest, gauge_callback, start_metrics_server, timed, track_dependency
+import tracing
+from availability import BayAvailability, parse_busy
+from calendar_mirror import CalendarMirror
+from assistant_memory import reset_memory
+from response_cache import ResponseCache
+from broadcast import Broadcaster, BroadcastCheckpoint
+from sqlite_persistence import SQLitePersistence
+from sheet_mirror import SheetMirror
+from i18n import DEFAULT_LANG, LANGUAGES, normalize_lang, t
+from keyboards import language_menu, main_menu
 
 from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 
 from telegram import (
     Update, ReplyKeyboardMarkup, KeyboardButton,
@@ -25,25 +44,13 @@ from telegram.ext import (
     ConversationHandler, CallbackQueryHandler, ContextTypes, filters
 )
 from telegram.ext import ConversationHandler
-LANGUAGE, AUTO, YEAR, VIN, TELEFON, OPIS, SLOT_SELECT = range(7)
+LANGUAGE, AUTO, YEAR, VIN, TELEFON, OPIS, SLOT_SELECT, SERVICE = range(8)
 
 import nest_asyncio
 nest_asyncio.apply()
 
 logging.basicConfig(level=logging.INFO)
 
-assistant_system_prompts = {
-    "🇷🇺 Русский": "Ты — опытный автоэлектрик и механик. Помогаешь определить неисправности автомобиля по описанию. Уточняешь симптомы, даешь советы. Отвечай на русском.",
-    "🇵🇱 Polski": "Jesteś doświadczonym mechanikiem samochodowym. Pomagasz zidentyfikować problemy na podstawie opisu. Zadawaj pytania, dawaj porady. Odpowiadaj po polsku.",
-    "🇬🇧 English": "You are an experienced car mechanic. You help diagnose vehicle issues based on user input. Ask clarifying questions and provide suggestions. Answer in English."
-}
-
-admin_button_text = {
-    "🇷🇺 Русский": "♻️ Обновить данные",
-    "🇵🇱 Polski": "♻️ Odśwież dane",
-    "🇬🇧 English": "♻️ Reload data"
-}
-
 # Загрузка .env
 load_dotenv(dotenv_path=".env")
 
@@ -55,262 +62,236 @@ SHEET_TAB = os.getenv("GOOGLE_SHEET_TAB")
 CREDENTIALS_SHEET = os.getenv("GOOGLE_CREDENTIALS_PATH")
 CREDENTIALS_CALENDAR = os.getenv("GOOGLE_CREDENTIALS_CALENDAR")
 CALENDAR_ID = os.getenv("CALENDAR_ID")
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+DATA_DIR = os.getenv("BOT_DATA_DIR", "data")
+SLOT_HORIZON_DAYS = int(os.getenv("SLOT_HORIZON_DAYS", "14"))
+# Рабочие часы и сетка записи: начала слотов идут с шагом SLOT_STEP_MINUTES от открытия.
+# WORKDAYS — номера дней недели (0 — понедельник).
+WORK_START = time.fromisoformat(os.getenv("WORK_START", "08:00"))
+WORK_END = time.fromisoformat(os.getenv("WORK_END", "18:00"))
+WORKDAYS = tuple(int(day) for day in os.getenv("WORKDAYS", "0,1,2,3,4").split(","))
+SLOT_STEP = timedelta(minutes=int(os.getenv("SLOT_STEP_MINUTES", "30")))
+# Длительность записи, если услуга не выбрана (лист «Услуги» пуст)
+SLOT_DURATION = timedelta(minutes=int(os.getenv("SLOT_DURATION_MINUTES", "30")))
+WORK_HOURS = {"work_start": WORK_START, "work_end": WORK_END, "workdays": WORKDAYS, "granularity": SLOT_STEP}
+# Сколько живёт индекс свободного времени, если календари и брони не менялись
+AVAILABILITY_CACHE_SECONDS = float(os.getenv("AVAILABILITY_CACHE_SECONDS", "30"))
+# Сколько бронь ждёт фоновую запись в календарь (с повторами и перезапуском бота)
+BOOKING_HOLD_SECONDS = float(os.getenv("BOOKING_HOLD_SECONDS", "3600"))
+
+if WORK_END <= WORK_START:
+    raise ValueError("❌ WORK_END должен быть позже WORK_START")
 
 if not CALENDAR_ID:
     raise ValueError("❌ Не найден CALENDAR_ID. Убедись, что он указан в .env")
 
-# Подключение Google Sheets
-sheet_creds = Credentials.from_service_account_file(CREDENTIALS_SHEET, scopes=[
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive"
-])
-sheet_client = gspread.authorize(sheet_creds)
-sheet = sheet_client.open(SHEET_NAME).worksheet(SHEET_TAB)
+# Посты (подъёмники) с отдельными календарями: BAY_CALENDARS="Пост 1=id1,Пост 2=id2".
+# Без настройки — один пост с календарём CALENDAR_ID. Свободен хотя бы один пост — свободен слот.
+def parse_bays(value: str) -> dict:
+    bays = {}
+    for number, item in enumerate(filter(None, (part.strip() for part in value.split(","))), start=1):
+        name, _, calendar_id = item.rpartition("=")
+        bays[calendar_id.strip()] = name.strip() or f"Пост {number}"
+    return bays
+
+BAYS = parse_bays(os.getenv("BAY_CALENDARS", "")) or {CALENDAR_ID: "Пост 1"}
+# freebusy принимает не больше 50 календарей за запрос
+if len(BAYS) > 50:
+    raise ValueError("❌ В BAY_CALENDARS больше 50 календарей")
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Порт /metrics для Prometheus (0 — не запускать)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+# Обновления дольше порога пишутся в лог с разбивкой по вызовам
+tracing.SLOW_UPDATE_SECONDS = float(os.getenv("SLOW_UPDATE_SECONDS", "2"))
+# Адрес Bot API (для локальной проверки — tools/fake_bot_api.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"❌ Неизвестный BOT_MODE: {BOT_MODE}. Допустимо: polling, webhook")
+if BOT_MODE == "webhook":
+    if not WEBHOOK_URL:
+        raise ValueError("❌ Для BOT_MODE=webhook нужен WEBHOOK_URL (публичный адрес бота)")
+    # Telegram передаёт секрет в заголовке X-Telegram-Bot-Api-Secret-Token
+    if not WEBHOOK_SECRET or not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+        raise ValueError("❌ Для BOT_MODE=webhook нужен WEBHOOK_SECRET: 1–256 символов A-Z, a-z, 0-9, _ и -")
+
+# Клиенты Google и OpenAI создаются лениво: тяжёлые модули импортируются
+# при первом обращении, а не при запуске бота
+_clients = {}
+_clients_lock = threading.Lock()
+
+def open_spreadsheet():
+    with _clients_lock:
+        if "sheets" not in _clients:
+            import gspread
+            from google.oauth2.service_account import Credentials
+            sheet_creds = Credentials.from_service_account_file(CREDENTIALS_SHEET, scopes=[
+                "https://www.googleapis.com/auth/spreadsheets",
+                "https://www.googleapis.com/auth/drive"
+            ])
+            _clients["sheets"] = gspread.authorize(sheet_creds)
+    return _clients["sheets"].open(SHEET_NAME)
+
+def get_calendar_service():
+    with _clients_lock:
+        if "calendar" not in _clients:
+            from google.oauth2.service_account import Credentials
+            from googleapiclient.discovery import build
+            calendar_creds = Credentials.from_service_account_file(CREDENTIALS_CALENDAR, scopes=[
+                "https://www.googleapis.com/auth/calendar"
+            ])
+            _clients["calendar"] = build("calendar", "v3", credentials=calendar_creds)
+    return _clients["calendar"]
+
+def get_openai_client():
+    with _clients_lock:
+        if "openai" not in _clients:
+            from openai import AsyncOpenAI
+            _clients["openai"] = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _clients["openai"]
+
+# Асинхронный доступ к таблице: вызовы gspread не блокируют цикл событий.
+# Запросы проходят через вёдра квот Sheets API: сначала заявки, затем действия
+# пользователей, последними — рассылка, журнал диалогов и фоновая синхронизация.
+sheets = AsyncSheets(
+    open_spreadsheet,
+    max_workers=int(os.getenv("SHEETS_MAX_WORKERS", "4")),
+    timeout=float(os.getenv("SHEETS_TIMEOUT_SECONDS", "20")),
+    scheduler=QuotaScheduler(
+        reads_per_minute=float(os.getenv("SHEETS_READS_PER_MINUTE", "60")),
+        writes_per_minute=float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+    ),
+    tab_priorities={SHEET_TAB: BOOKING, "Диалоги": BACKGROUND}
+)
+
+# Локальные зеркала календарей постов (полная загрузка + изменения по syncToken)
+CALENDAR_MIRROR_MAX_AGE = float(os.getenv("CALENDAR_MIRROR_MAX_AGE", "300"))
+calendar_mirrors = {
+    calendar_id: CalendarMirror(
+        get_calendar_service,
+        calendar_id,
+        pytz.timezone("Europe/Warsaw"),
+        poll_interval=float(os.getenv("CALENDAR_SYNC_SECONDS", "30"))
+    )
+    for calendar_id in BAYS
+}
 
-# Подключение Google Calendar
-calendar_creds = Credentials.from_service_account_file(CREDENTIALS_CALENDAR, scopes=[
-    "https://www.googleapis.com/auth/calendar"
-])
-calendar_service = build("calendar", "v3", credentials=calendar_creds)
+# Локальная копия всех листов: чтение — из SQLite, запись — в таблицу и локально
+sheet_mirror = SheetMirror(
+    sheets,
+    os.path.join(DATA_DIR, "sheets.sqlite3"),
+    tabs=[SHEET_TAB, SUBSCRIBERS_TAB, "Акции", "Контакты", "Диалоги"],
+    # Без листа «Услуги» все записи — на SLOT_DURATION
+    optional_tabs=["Услуги"],
+    pull_interval=float(os.getenv("SHEETS_PULL_SECONDS", "60"))
+)
 
-# Константы состояний
-LANGUAGE, AUTO, YEAR, VIN, TELEFON, OPIS, SLOT_SELECT = range(7)
+# Журнал отложенной записи строк (заявки, подписчики) с пакетной отправкой
+write_queue = WriteBehindQueue(
+    sheet_mirror,
+    os.path.join(DATA_DIR, "write_queue.sqlite3"),
+    batch_size=int(os.getenv("SHEETS_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("SHEETS_FLUSH_SECONDS", "5")),
+    # Первая ячейка — номер заявки или id подписчика; в «Диалогах» она не уникальна
+    keyed_tabs=[SHEET_TAB, SUBSCRIBERS_TAB]
+)
 
-async def slot_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
+# Кэш ответов ассистента на первый вопрос (ASSISTANT_CACHE_DISK=0 — только в памяти)
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("ASSISTANT_CACHE_SIZE", "500")),
+    ttl=float(os.getenv("ASSISTANT_CACHE_TTL_SECONDS", str(7 * 86400))),
+    path=os.path.join(DATA_DIR, "response_cache.sqlite3") if os.getenv("ASSISTANT_CACHE_DISK", "1") == "1" else None
+)
 
-    # ✅ Привязка к timezone
-    tz = pytz.timezone("Europe/Warsaw")
-    slot_start = isoparse(query.data).replace(tzinfo=None)
-    slot_start = tz.localize(slot_start)
-    slot_end = slot_start + timedelta(minutes=30)
+# Рассылка новостей с контрольными точками (можно продолжить после сбоя)
+broadcaster = Broadcaster(
+    BroadcastCheckpoint(os.path.join(DATA_DIR, "broadcasts.sqlite3")),
+    concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "20")),
+    rate=float(os.getenv("BROADCAST_RATE", "25"))
+)
+
+# Номера заявок выдаются локально, без чтения листа заявок
+booking_ids = BookingIdAllocator(os.path.join(DATA_DIR, "booking_ids.sqlite3"))
+
+# Журнал броней слотов, общий для всех процессов бота с одним DATA_DIR
+reservations = ReservationLedger(os.path.join(DATA_DIR, "reservations.sqlite3"))
+
+# Фоновые задачи после подтверждения заявки (повторы + журнал неудач)
+jobs = BackgroundJobs(
+    os.path.join(DATA_DIR, "jobs.sqlite3"),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "4"))
+)
+
+# Индекс подписчиков в памяти (вместо полного чтения листа на каждое действие)
+subscriber_index = SubscriberIndex(
+    sheet_mirror,
+    write_queue,
+    reconcile_interval=int(os.getenv("SUBSCRIBERS_RECONCILE_SECONDS", "300"))
+)
+
+def is_admin(user) -> bool:
+    return user is not None and user.id == ADMIN_ID
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
 
-    # Получаем язык пользователя из таблицы
-    lang = None
+    # Язык — из сохранённой сессии, иначе из индекса подписчиков
+    lang = context.user_data.get("lang")
     subscribed = False
     try:
-        sub_sheet = sheet_client.open(SHEET_NAME).worksheet("Подписчики")
-        rows = sub_sheet.get_all_values()[1:]
-        for row in rows:
-            if row[0] == user_id:
-                lang = row[1]
-                subscribed = True
-                break
+        entry = await subscriber_index.get(user_id)
+        if entry:
+            lang = lang or normalize_lang(entry[0])
+            subscribed = True
     except Exception as e:
         logging.warning("⚠️ Ошибка при проверке подписки при старте: %s", e)
 
     # Если язык не найден — показать выбор
     if not lang:
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru")],
-            [InlineKeyboardButton("🇵🇱 Polski", callback_data="lang_pl")],
-            [InlineKeyboardButton("🇬🇧 English", callback_data="lang_en")]
-        ])
-        await update.message.reply_text(
-            "Выберите язык / Choose language / Wybierz język:",
-            reply_markup=keyboard
-        )
+        await update.message.reply_text(t(DEFAULT_LANG, "choose_language"), reply_markup=language_menu())
         return
 
     # Сохраняем язык в сессию
     context.user_data["lang"] = lang
 
-    subscribe_text = {
-        "🇷🇺 Русский": "📬 Отписаться" if subscribed else "📬 Подписаться",
-        "🇵🇱 Polski": "📬 Wypisz się" if subscribed else "📬 Subskrybuj",
-        "🇬🇧 English": "📬 Unsubscribe" if subscribed else "📬 Subscribe"
-    }.get(lang, "📬 Подписаться")
-
-    promo = PROMO_MESSAGES.get(lang, "Добро пожаловать!")
-
-    if lang == "🇵🇱 Polski":
-        buttons = [
-            [InlineKeyboardButton("📍 Adres", callback_data="address"),
-             InlineKeyboardButton("📝 Rejestracja", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Kontakt", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Asystent diagnostyczny", callback_data="assistant")],
-            [InlineKeyboardButton("🌍 Zmień język", callback_data="change_language")]
-        ]
-    elif lang == "🇬🇧 English":
-        buttons = [
-            [InlineKeyboardButton("📍 Address", callback_data="address"),
-             InlineKeyboardButton("📝 Appointment", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Contact", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Assistant", callback_data="assistant")],
-            [InlineKeyboardButton("🌍 Change language", callback_data="change_language")]
-        ]
-    else:
-        buttons = [
-            [InlineKeyboardButton("📍 Адрес", callback_data="address"),
-             InlineKeyboardButton("📝 Запись", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Контакты", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Помощник по неисправностям", callback_data="assistant")],
-            [InlineKeyboardButton("🌍 Сменить язык", callback_data="change_language")]
-        ]
-
-    # 👑 Админ-кнопка
-    if str(update.effective_user.id) == str(ADMIN_ID):
-        admin_text = admin_button_text.get(lang, "♻️ Обновить данные")
-        buttons.append([InlineKeyboardButton(admin_text, callback_data="reload_all")])
-        buttons.append([InlineKeyboardButton("📢 Разослать новость", callback_data="send_news")])
-
-    keyboard = InlineKeyboardMarkup(buttons)
+    promo = PROMO_MESSAGES.get(lang, t(lang, "welcome"))
+    keyboard = main_menu(lang, subscribed, is_admin(update.effective_user))
     await update.message.reply_text(promo, reply_markup=keyboard)
 
-    # Если язык найден — сохранить и показать меню
+# Выбор языка: сохранить, подписать на новости и показать меню
 async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    lang_map = {
-        "lang_ru": "🇷🇺 Русский",
-        "lang_pl": "🇵🇱 Polski",
-        "lang_en": "🇬🇧 English"
-    }
-
-    callback_data = query.data
-    lang = lang_map.get(callback_data, "🇷🇺 Русский")
+    lang = LANGUAGES.get(query.data.removeprefix("lang_"), DEFAULT_LANG)
     context.user_data["lang"] = lang
 
     user_id = str(query.from_user.id)
     subscribed = False
 
     try:
-        sub_sheet = sheet_client.open(SHEET_NAME).worksheet("Подписчики")
-        all_ids = [row[0] for row in sub_sheet.get_all_values()[1:]]
-        subscribed = user_id in all_ids
+        subscribed = await subscriber_index.is_subscribed(user_id)
         if not subscribed:
-            sub_sheet.append_row([user_id, lang])
+            await subscriber_index.subscribe(user_id, lang)
     except Exception as e:
         logging.warning("⚠️ Не удалось проверить или добавить подписку: %s", e)
 
-    # Динамический текст кнопки подписки
-    subscribe_text = {
-        "🇷🇺 Русский": "📬 Отписаться" if subscribed else "📬 Подписаться",
-        "🇵🇱 Polski": "📬 Wypisz się" if subscribed else "📬 Subskrybuj",
-        "🇬🇧 English": "📬 Unsubscribe" if subscribed else "📬 Subscribe"
-    }.get(lang, "📬 Подписаться")
-
-    promo = PROMO_MESSAGES.get(lang, "Добро пожаловать!")
-
-    if lang == "🇵🇱 Polski":
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📍 Adres", callback_data="address"),
-             InlineKeyboardButton("📝 Rejestracja", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Kontakt", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Asystent diagnostyczny", callback_data="assistant")],
-            [InlineKeyboardButton("🌍 Zmień język", callback_data="change_language")]
-        ])
-    elif lang == "🇬🇧 English":
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📍 Address", callback_data="address"),
-             InlineKeyboardButton("📝 Appointment", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Contact", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Assistant", callback_data="assistant")],
-            [InlineKeyboardButton("🌍 Change language", callback_data="change_language")]
-        ])
-    else:
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📍 Адрес", callback_data="address"),
-             InlineKeyboardButton("📝 Запись", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Контакты", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Помощник по неисправностям", callback_data="assistant")],
-            [InlineKeyboardButton("🌍 Сменить язык", callback_data="change_language")]
-        ])
-
-    await update.message.reply_text(promo, reply_markup=keyboard)
+    # Получаем текст из Google Таблицы
+    text = PROMO_MESSAGES.get(lang, t(lang, "welcome"))
+    keyboard = main_menu(lang, subscribed, is_admin(query.from_user))
+    await query.edit_message_text(text=text, reply_markup=keyboard)
 
 async def change_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru")],
-        [InlineKeyboardButton("🇵🇱 Polski", callback_data="lang_pl")],
-        [InlineKeyboardButton("🇬🇧 English", callback_data="lang_en")]
-    ])
-    await query.edit_message_text(
-        "Выберите язык / Choose language / Wybierz język:",
-        reply_markup=keyboard
-    )
-
-    await query.edit_message_text(
-    "Выберите язык / Choose language / Wybierz język:",
-    reply_markup=keyboard
-)
-
-async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-
-    lang_map = {
-        "lang_ru": "🇷🇺 Русский",
-        "lang_pl": "🇵🇱 Polski",
-        "lang_en": "🇬🇧 English"
-    }
-
-    callback_data = query.data
-    lang = lang_map.get(callback_data, "🇷🇺 Русский")
-    context.user_data["lang"] = lang
-
-    user_id = str(query.from_user.id)
-    subscribed = False
-
-    try:
-        sub_sheet = sheet_client.open(SHEET_NAME).worksheet("Подписчики")
-        all_ids = [row[0] for row in sub_sheet.get_all_values()[1:]]
-        subscribed = user_id in all_ids
-        if not subscribed:
-            sub_sheet.append_row([user_id, lang])
-    except Exception as e:
-        logging.warning("⚠️ Не удалось проверить или добавить подписку: %s", e)
-
-    # Динамический текст кнопки подписки
-    subscribe_text = {
-        "🇷🇺 Русский": "📬 Отписаться" if subscribed else "📬 Подписаться",
-        "🇵🇱 Polski": "📬 Wypisz się" if subscribed else "📬 Subskrybuj",
-        "🇬🇧 English": "📬 Unsubscribe" if subscribed else "📬 Subscribe"
-    }.get(lang, "📬 Подписаться")
-
-    # Получаем текст из Google Таблицы
-    text = PROMO_MESSAGES.get(lang, "Добро пожаловать!")
-
-    if lang == "🇵🇱 Polski":
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📍 Adres", callback_data="address"),
-             InlineKeyboardButton("📝 Rejestracja", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Kontakt", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Asystent awarii", callback_data="assistant")]
-        ])
-    elif lang == "🇬🇧 English":
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📍 Address", callback_data="address"),
-             InlineKeyboardButton("📝 Appointment", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Contact", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Assistant", callback_data="assistant")]
-        ])
-    else:  # Русский по умолчанию
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📍 Адрес", callback_data="address"),
-             InlineKeyboardButton("📝 Запись", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Контакты", callback_data="contacts"),
-             InlineKeyboardButton(subscribe_text, callback_data="subscribe")],
-            [InlineKeyboardButton("🤖 Помощник по неисправностям", callback_data="assistant")]
-        ])
-
-    await query.edit_message_text(text=text, reply_markup=keyboard)
+    await query.edit_message_text(t(DEFAULT_LANG, "choose_language"), reply_markup=language_menu())
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -333,54 +314,18 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "reload_all":
         await reload_all(update, context)
 
-    # Сбор сообщений
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-    system_prompt = assistant_system_prompts.get(lang, assistant_system_prompts["🇷🇺 Русский"])
-    messages = [{"role": "system", "content": system_prompt}] + history + [
-        {"role": "user", "content": user_input}
-    ]
-
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=0.7
-        )
-        reply = response.choices[0].message.content
-
-        # Обновляем историю
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": reply})
-        context.user_data["assistant_history"] = history
-
-    except Exception as e:
-        logging.error("Ошибка OpenAI: %s", e)
-        reply = {
-            "🇷🇺 Русский": "⚠️ Произошла ошибка. Попробуйте позже.",
-            "🇵🇱 Polski": "⚠️ Wystąpił błąd. Spróbuj ponownie później.",
-            "🇬🇧 English": "⚠️ An error occurred. Please try again later."
-        }.get(lang, "⚠️ Ошибка. Попробуйте позже.")
-
-    await update.message.reply_text(reply)
-
 async def toggle_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = str(query.from_user.id)
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
+    lang = context.user_data.get("lang", DEFAULT_LANG)
 
     try:
-        sub_sheet = sheet_client.open(SHEET_NAME).worksheet("Подписчики")
-        values = sub_sheet.get_all_values()
-        rows = values[1:]  # без заголовка
-        ids = [row[0] for row in rows]
-
-        if user_id in ids:
-            index = ids.index(user_id) + 2  # +2 из-за заголовка и индекса с 1
-            sub_sheet.delete_rows(index)
-            status_msg = "❌ Вы отписались от новостей."
+        if await subscriber_index.is_subscribed(user_id):
+            await subscriber_index.unsubscribe(user_id)
+            status_msg = t(lang, "unsubscribed")
         else:
-            sub_sheet.append_row([user_id, lang])
-            status_msg = "✅ Вы подписались на новости."
+            await subscriber_index.subscribe(user_id, lang)
+            status_msg = t(lang, "subscribed")
 
         await query.answer()
 
@@ -392,11 +337,11 @@ async def toggle_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     except Exception as e:
         logging.error("❌ Ошибка при работе с подпиской: %s", e)
-        await query.answer("⚠️ Ошибка. Попробуйте позже.")
+        await query.answer(t(lang, "subscription_error"))
         
 async def show_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global CONTACTS
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
+    lang = context.user_data.get("lang", DEFAULT_LANG)
 
     address = CONTACTS.get("ADDRESS", "Gdańsk")
     try:
@@ -410,94 +355,62 @@ async def show_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     route_url = f"https://www.google.com/maps/dir/?api=1&destination={latitude},{longitude}"
 
-    route_button_text = {
-        "🇷🇺 Русский": "🗺️ Проложить маршрут",
-        "🇵🇱 Polski": "🗺️ Wyznacz trasę",
-        "🇬🇧 English": "🗺️ Get directions"
-    }.get(lang, "🗺️ Проложить маршрут")
-
     await update.effective_message.reply_text(
         f"📍 {address}",
         reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton(route_button_text, url=route_url)]
+            [InlineKeyboardButton(t(lang, "route"), url=route_url)]
         ])
     )
 
 async def show_contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global CONTACTS
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
+    lang = context.user_data.get("lang", DEFAULT_LANG)
 
     phone = CONTACTS.get("PHONE", "+48 000 000 000")
     instagram = CONTACTS.get("INSTAGRAM", "#")
     facebook = CONTACTS.get("FACEBOOK", "#")
 
-    text_map = {
-        "🇷🇺 Русский": f"Наши контакты и соцсети:\n\n📞 Телефон: {phone}",
-        "🇵🇱 Polski": f"Nasze kontakty i media społecznościowe:\n\n📞 Telefon: {phone}",
-        "🇬🇧 English": f"Our contacts and social media:\n\n📞 Phone: {phone}"
-    }
-
-    back_label = {
-        "🇷🇺 Русский": "🔙 Назад",
-        "🇵🇱 Polski": "🔙 Wróć",
-        "🇬🇧 English": "🔙 Back"
-    }.get(lang, "🔙 Назад")
-
     buttons = [
         [InlineKeyboardButton("📸 Instagram", url=instagram)],
         [InlineKeyboardButton("📘 Facebook", url=facebook)],
-        [InlineKeyboardButton(back_label, callback_data="back_to_menu")]
+        [InlineKeyboardButton(t(lang, "back"), callback_data="back_to_menu")]
     ]
 
     await update.effective_message.reply_text(
-        text_map.get(lang, text_map["🇷🇺 Русский"]),
+        t(lang, "contacts", phone=phone),
         reply_markup=InlineKeyboardMarkup(buttons)
     )
 
-LANGUAGE, AUTO, YEAR, VIN, TELEFON, OPIS, SLOT_SELECT = range(7)
+LANGUAGE, AUTO, YEAR, VIN, TELEFON, OPIS, SLOT_SELECT, SERVICE = range(8)
+
+# Шаблоны проверки полей заявки компилируются один раз
+AUTO_MAKE_RE = re.compile(r"^[A-Za-zА-Яа-яЁё]+$")
+AUTO_MODEL_RE = re.compile(r"^[A-Za-zА-Яа-яЁё0-9]+$")
+VIN_RE = re.compile(r"^[A-HJ-NPR-Z0-9]{17}$")
+PHONE_RE = re.compile(r"^\+?\d{9,15}$")
 
 async def get_auto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     auto_input = update.message.text.strip()
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
+    lang = context.user_data.get("lang", DEFAULT_LANG)
 
     parts = auto_input.split(maxsplit=1)
     if len(parts) < 2:
-        error_msg = {
-            "🇷🇺 Русский": "❌ Введите марку и модель через пробел, например: Audi A4",
-            "🇵🇱 Polski": "❌ Wprowadź markę i model oddzielone spacją, np. Audi A4",
-            "🇬🇧 English": "❌ Enter make and model separated by space, e.g. Audi A4"
-        }.get(lang, "❌ Введите корректные данные: марка и модель")
-        await update.message.reply_text(error_msg)
+        await update.message.reply_text(t(lang, "auto_format"))
         return AUTO
 
     marka, model = parts[0], parts[1]
 
-    if not re.match(r"^[A-Za-zА-Яа-яЁё]+$", marka):
-        error_msg = {
-            "🇷🇺 Русский": "❌ Марка должна содержать только буквы.",
-            "🇵🇱 Polski": "❌ Marka może zawierać tylko litery.",
-            "🇬🇧 English": "❌ Make must contain only letters."
-        }.get(lang, "❌ Только буквы в марке")
-        await update.message.reply_text(error_msg)
+    if not AUTO_MAKE_RE.match(marka):
+        await update.message.reply_text(t(lang, "auto_make"))
         return AUTO
 
-    if not re.match(r"^[A-Za-zА-Яа-яЁё0-9]+$", model):
-        error_msg = {
-            "🇷🇺 Русский": "❌ Модель должна содержать только буквы и цифры.",
-            "🇵🇱 Polski": "❌ Model może zawierać tylko litery i cyfry.",
-            "🇬🇧 English": "❌ Model can only contain letters and digits."
-        }.get(lang, "❌ Только буквы и цифры в модели")
-        await update.message.reply_text(error_msg)
+    if not AUTO_MODEL_RE.match(model):
+        await update.message.reply_text(t(lang, "auto_model"))
         return AUTO
 
     context.user_data["auto"] = f"{marka} {model}"
 
-    next_msg = {
-        "🇷🇺 Русский": "Год выпуска:",
-        "🇵🇱 Polski": "Podaj rok produkcji:",
-        "🇬🇧 English": "Enter the year of manufacture:"
-    }.get(lang, "Год выпуска:")
-    await update.message.reply_text(next_msg)
+    await update.message.reply_text(t(lang, "ask_year"))
     return YEAR
 
 async def handle_zapis(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -506,116 +419,202 @@ async def handle_zapis(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def get_year(update: Update, context: ContextTypes.DEFAULT_TYPE):
     year_input = update.message.text.strip()
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
+    lang = context.user_data.get("lang", DEFAULT_LANG)
 
     if not year_input.isdigit() or len(year_input) != 4 or int(year_input) < 1990:
-        error_msg = {
-            "🇷🇺 Русский": "❌ Введите корректный год (4 цифры, не раньше 1990).",
-            "🇵🇱 Polski": "❌ Wprowadź poprawny rok (4 cyfry, nie wcześniej niż 1990).",
-            "🇬🇧 English": "❌ Enter a valid year (4 digits, not earlier than 1990)."
-        }.get(lang, "❌ Неверный год")
-        await update.message.reply_text(error_msg)
+        await update.message.reply_text(t(lang, "bad_year"))
         return YEAR
 
     context.user_data["year"] = year_input
 
-    next_msg = {
-        "🇷🇺 Русский": "VIN код:",
-        "🇵🇱 Polski": "Kod VIN:",
-        "🇬🇧 English": "VIN code:"
-    }.get(lang, "VIN код:")
-    await update.message.reply_text(next_msg)
+    await update.message.reply_text(t(lang, "ask_vin"))
     return VIN
 
 async def get_vin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     vin_input = update.message.text.strip().upper()
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-
-    if len(vin_input) != 17 or not re.match(r"^[A-HJ-NPR-Z0-9]{17}$", vin_input):
-        error_msg = {
-            "🇷🇺 Русский": "❌ VIN должен содержать ровно 17 символов (без I, O, Q).",
-            "🇵🇱 Polski": "❌ VIN musi mieć dokładnie 17 znaków (bez I, O, Q).",
-            "🇬🇧 English": "❌ VIN must be exactly 17 characters (excluding I, O, Q)."
-        }.get(lang, "❌ Неверный VIN")
-        await update.message.reply_text(error_msg)
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+
+    if not VIN_RE.match(vin_input):
+        await update.message.reply_text(t(lang, "bad_vin"))
         return VIN
 
     context.user_data["vin"] = vin_input
 
-    next_msg = {
-        "🇷🇺 Русский": "Введите номер телефона:",
-        "🇵🇱 Polski": "Podaj numer telefonu:",
-        "🇬🇧 English": "Enter your phone number:"
-    }.get(lang, "Введите номер телефона:")
-    await update.message.reply_text(next_msg)
+    await update.message.reply_text(t(lang, "ask_phone"))
     return TELEFON
 
 async def get_telefon(update: Update, context: ContextTypes.DEFAULT_TYPE):
     phone_input = update.message.text.strip()
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-
-    if not re.match(r"^\+?\d{9,15}$", phone_input):
-        error_msg = {
-            "🇷🇺 Русский": "❌ Введите корректный номер телефона (9–15 цифр).",
-            "🇵🇱 Polski": "❌ Wprowadź poprawny numer telefonu (9–15 cyfr).",
-            "🇬🇧 English": "❌ Enter a valid phone number (9–15 digits)."
-        }.get(lang, "❌ Некорректный номер телефона")
-        await update.message.reply_text(error_msg)
-        return TELEFON
-
-    context.user_data["telefon"] = phone_input
+    lang = context.user_data.get("lang", DEFAULT_LANG)
 
-    next_msg = {
-        "🇷🇺 Русский": "Опишите проблему:",
-        "🇵🇱 Polski": "Opisz problem:",
-        "🇬🇧 English": "Describe the issue:"
-    }.get(lang, "Опишите проблему:")
-    await update.message.reply_text(next_msg)
-    return OPIS
-
-async def get_telefon(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    phone_input = update.message.text.strip()
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-
-    if not re.match(r"^\+?\d{9,15}$", phone_input):
-        error_msg = {
-            "🇷🇺 Русский": "❌ Введите корректный номер телефона (9–15 цифр).",
-            "🇵🇱 Polski": "❌ Wprowadź poprawny numer telefonu (9–15 cyfr).",
-            "🇬🇧 English": "❌ Enter a valid phone number (9–15 digits)."
-        }.get(lang)
-        await update.message.reply_text(error_msg)
+    if not PHONE_RE.match(phone_input):
+        await update.message.reply_text(t(lang, "bad_phone"))
         return TELEFON
 
     context.user_data["telefon"] = phone_input
 
-    next_msg = {
-        "🇷🇺 Русский": "Опишите проблему:",
-        "🇵🇱 Polski": "Opisz problem:",
-        "🇬🇧 English": "Describe the issue:"
-    }.get(lang)
-    await update.message.reply_text(next_msg)
+    await update.message.reply_text(t(lang, "ask_issue"))
     return OPIS
 
 async def get_opis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["opis"] = update.message.text
-    slots = get_free_slots()
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+    if SERVICES:
+        buttons = [
+            [InlineKeyboardButton(f"{service_name(key, lang)} · {format_minutes(service['minutes'])}", callback_data=f"svc:{key}")]
+            for key, service in SERVICES.items()
+        ]
+        await update.message.reply_text(t(lang, "choose_service"), reply_markup=InlineKeyboardMarkup(buttons))
+        return SERVICE
+
+    context.user_data.pop("service", None)
+    context.user_data.pop("service_minutes", None)
+    return await offer_slots(update.message.reply_text, lang, SLOT_DURATION)
+
+async def service_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+    key = query.data.split(":", 1)[1]
+    service = SERVICES.get(key)
+    if not service:
+        # Лист услуг перезагрузили, пока пользователь выбирал
+        await query.message.reply_text(t(lang, "service_unknown"))
+        return SERVICE
+
+    context.user_data["service"] = key
+    context.user_data["service_minutes"] = service["minutes"]
+    return await offer_slots(query.edit_message_text, lang, timedelta(minutes=service["minutes"]))
+
+# === Листание слотов ===
+# Страница слотов строится от курсора ленивыми генераторами движка: считается только то,
+# что попадает на страницу. Индекс свободного времени берётся из кэша get_availability,
+# поэтому листание не обращается к Calendar, пока календари и брони не менялись.
+SLOT_PAGE_SIZE = 8
+SLOT_TOKEN_RE = r"[0-9a-z]+"
+
+# Компактные токены callback_data: буква действия, двоеточие и минуты от эпохи в base36
+# (s — выбрать слот, n — страница с момента, b — страница до момента, d — выбор дня).
+# Двоеточие отделяет токены от слов меню: «subscribe» не должен читаться как слот
+def encode_moment(moment: datetime) -> str:
+    value = int(moment.timestamp()) // 60
+    digits = ""
+    while True:
+        value, digit = divmod(value, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+        if not value:
+            return digits
+
+def decode_moment(token: str) -> datetime:
+    return datetime.fromtimestamp(int(token, 36) * 60, pytz.timezone("Europe/Warsaw"))
+
+def slot_token(action: str, moment: datetime) -> str:
+    return f"{action}:{encode_moment(moment)}"
+
+def parse_slot_token(data: str):
+    action, _, token = data.partition(":")
+    return action, decode_moment(token)
+
+# Длительность выбранной услуги; без листа «Услуги» — SLOT_DURATION
+def booking_duration(user_data) -> timedelta:
+    minutes = user_data.get("service_minutes")
+    return timedelta(minutes=minutes) if minutes else SLOT_DURATION
+
+# Страница слотов: after — с этого момента включительно, before — строго до него
+def slot_page(engine: BayAvailability, duration: timedelta, after: datetime = None, before: datetime = None):
+    if before is not None:
+        slots = list(islice(engine.iter_free_slots_reverse(duration, SLOT_STEP, before), SLOT_PAGE_SIZE))[::-1]
+        if not slots:
+            return slot_page(engine, duration)
+    else:
+        slots = list(islice(engine.iter_free_slots(duration, SLOT_STEP, after), SLOT_PAGE_SIZE))
     if not slots:
-        await update.message.reply_text("Нет доступных времён. Попробуйте позже.")
+        return [], False, False
+    has_earlier = next(engine.iter_free_slots_reverse(duration, SLOT_STEP, slots[0][0]), None) is not None
+    has_later = next(engine.iter_free_slots(duration, SLOT_STEP, slots[-1][0] + timedelta(minutes=1)), None) is not None
+    return slots, has_earlier, has_later
+
+def slot_keyboard(lang: str, slots, has_earlier: bool, has_later: bool) -> InlineKeyboardMarkup:
+    buttons = [InlineKeyboardButton(start.strftime('%d.%m %H:%M'), callback_data=slot_token("s", start))
+               for start, _ in slots]
+    rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    navigation = []
+    if has_earlier:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=slot_token("b", slots[0][0])))
+    navigation.append(InlineKeyboardButton(t(lang, "pick_day"), callback_data=slot_token("d", slots[0][0])))
+    if has_later:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=slot_token("n", slots[-1][0] + timedelta(minutes=1))))
+    rows.append(navigation)
+    return InlineKeyboardMarkup(rows)
+
+# Первая страница слотов, в которые помещается работа длиной duration
+async def offer_slots(send, lang: str, duration: timedelta):
+    try:
+        engine = await get_availability()
+    except Exception as e:
+        logging.error("❌ Ошибка при получении занятости календаря: %s", e)
+        engine = None
+    slots, has_earlier, has_later = slot_page(engine, duration) if engine else ([], False, False)
+    if not slots:
+        await send(t(lang, "no_slots"))
         return ConversationHandler.END
 
-    buttons = [[InlineKeyboardButton(slot.strftime('%d.%m %H:%M'), callback_data=slot.isoformat())]
-               for slot in [start for start, _ in slots[:10]]]
+    await send(t(lang, "choose_slot"), reply_markup=slot_keyboard(lang, slots, has_earlier, has_later))
+    return SLOT_SELECT
 
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-    text = {
-        "🇷🇺 Русский": "Выберите удобное время:",
-        "🇵🇱 Polski": "Wybierz dogodny termin:",
-        "🇬🇧 English": "Choose a convenient time:"
-    }.get(lang, "Выберите удобное время:")
+# Кнопки ◀️/▶️ и выбор дня: страница от курсора из callback_data
+async def slot_page_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+    action, cursor = parse_slot_token(query.data)
+    try:
+        engine = await get_availability()
+    except Exception as e:
+        logging.error("❌ Ошибка при получении занятости календаря: %s", e)
+        await query.message.reply_text(t(lang, "booking_failed"))
+        return SLOT_SELECT
+
+    if action == "b":
+        slots, has_earlier, has_later = slot_page(engine, booking_duration(context.user_data), before=cursor)
+    else:
+        slots, has_earlier, has_later = slot_page(engine, booking_duration(context.user_data), after=cursor)
+    if not slots:
+        await query.edit_message_text(t(lang, "no_slots"))
+        return ConversationHandler.END
+    await query.edit_message_text(t(lang, "choose_slot"), reply_markup=slot_keyboard(lang, slots, has_earlier, has_later))
+    return SLOT_SELECT
 
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+# Дни, в которые помещается выбранная услуга; «назад» возвращает на страницу курсора
+async def day_picker(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+    try:
+        engine = await get_availability()
+    except Exception as e:
+        logging.error("❌ Ошибка при получении занятости календаря: %s", e)
+        await query.message.reply_text(t(lang, "booking_failed"))
+        return SLOT_SELECT
+
+    tz = pytz.timezone("Europe/Warsaw")
+    days = engine.free_days(booking_duration(context.user_data), SLOT_STEP, limit=30)
+    buttons = [
+        InlineKeyboardButton(
+            day.strftime('%d.%m'),
+            callback_data=slot_token("n", tz.localize(datetime.combine(day, time(0, 0))))
+        )
+        for day in days
+    ]
+    rows = [buttons[i:i + 4] for i in range(0, len(buttons), 4)]
+    rows.append([InlineKeyboardButton(t(lang, "back"), callback_data=f"n:{query.data.partition(':')[2]}")])
+    await query.edit_message_text(t(lang, "choose_day"), reply_markup=InlineKeyboardMarkup(rows))
     return SLOT_SELECT
 
+# Длительность услуги на кнопке: 0:30, 4:00
+def format_minutes(minutes: int) -> str:
+    return f"⏱ {minutes // 60}:{minutes % 60:02d}"
+
 # Установка кнопок командного меню Telegram
 async def setup_bot_commands(app):
     # Команды для всех пользователей
@@ -631,83 +630,171 @@ async def setup_bot_commands(app):
 async def slot_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    slot_start = isoparse(query.data).astimezone(pytz.timezone("Europe/Warsaw"))
-    slot_end = slot_start + timedelta(minutes=30)
-
-    event = {
-        'summary': f"Заявка от {context.user_data['telefon']}",
-        'description': (
-            f"{context.user_data['auto']} {context.user_data['year']}, "
-            f"VIN: {context.user_data['vin']}\n"
-            f"Проблема: {context.user_data['opis']}"
-        ),
-        'start': {'dateTime': slot_start.isoformat(), 'timeZone': 'Europe/Warsaw'},
-        'end': {'dateTime': slot_end.isoformat(), 'timeZone': 'Europe/Warsaw'}
+    # Токен s:<минуты base36>; ISO-строка — кнопки сообщений, отправленных до токенов
+    if query.data.startswith("s:"):
+        _, slot_start = parse_slot_token(query.data)
+    else:
+        slot_start = isoparse(query.data).astimezone(pytz.timezone("Europe/Warsaw"))
+    slot_end = slot_start + booking_duration(context.user_data)
+    lang = context.user_data.get("lang", DEFAULT_LANG)
+    owner = str(query.from_user.id)
+    timer = StageTimer(jobs)
+
+    # Свежая занятость всех постов на день визита — один запрос freebusy на заявку,
+    # сколько бы постов ни было; по ней же выбирается наименее загруженный пост
+    tz = pytz.timezone("Europe/Warsaw")
+    try:
+        with timer.stage("recheck"):
+            day_start = tz.localize(datetime.combine(slot_start.date(), time(0, 0)))
+            day_end = tz.localize(datetime.combine(slot_start.date() + timedelta(days=1), time(0, 0)))
+            busy_by_bay = await get_busy_intervals(day_start, day_end, fresh=True)
+            engine = BayAvailability(busy_by_bay, tz, slot_start.date(), 1, **WORK_HOURS)
+            candidates = engine.free_bays(slot_start, slot_end)
+    except Exception as e:
+        logging.error("❌ Ошибка при проверке занятости календаря: %s", e)
+        await query.message.reply_text(t(lang, "booking_failed"))
+        return SLOT_SELECT
+
+    # Бронь в общем журнале: из двух одновременных попыток занять один пост
+    # (в том числе из разных экземпляров бота) пройдёт только одна,
+    # проигравшая пробует следующий свободный пост
+    with timer.stage("reserve"):
+        bay = next(
+            (calendar_id for calendar_id in candidates
+             if reservations.reserve(calendar_id, slot_start, slot_end, owner)),
+            None
+        )
+    if bay is None:
+        await query.message.reply_text(t(lang, "slot_taken"))
+        return SLOT_SELECT
+
+    # Слот наш: пользователь получает ответ сразу, а событие в календаре и уведомление
+    # администратору уходят фоновыми задачами. Бронь остаётся временной и продлевается
+    # на время записи в календарь: подтверждает её задача calendar_event, а если задача
+    # исчерпает попытки, бронь снимается и слот снова свободен
+    try:
+        with timer.stage("booking_id"):
+            await ensure_booking_ids_seeded()
+            booking_id = str(booking_ids.next_id())
+    except Exception as e:
+        logging.error("❌ Не удалось выдать номер заявки: %s", e)
+        reservations.release(bay, slot_start, owner)
+        await query.message.reply_text(t(lang, "booking_failed"))
+        return SLOT_SELECT
+    reservations.extend(bay, slot_start, owner, BOOKING_HOLD_SECONDS)
+
+    booking = {
+        "id": booking_id,
+        # Свой id события: повтор после таймаута не создаст дубль
+        "event_id": f"bk{booking_id}t{secrets.token_hex(4)}",
+        "start": slot_start.isoformat(),
+        "end": slot_end.isoformat(),
+        "calendar": bay,
+        "bay": BAYS[bay],
+        "service": service_name(context.user_data["service"], DEFAULT_LANG) if context.user_data.get("service") else "",
+        "auto": context.user_data["auto"],
+        "year": context.user_data["year"],
+        "vin": context.user_data["vin"],
+        "telefon": context.user_data["telefon"],
+        "opis": context.user_data["opis"],
+        # Владелец брони и чат — чтобы снять бронь и предупредить клиента, если событие не создастся
+        "owner": owner,
+        "chat_id": query.message.chat_id,
+        "lang": lang
     }
 
-        # Повторная проверка занятости
-    check_body = {
-        "timeMin": slot_start.isoformat(),
-        "timeMax": slot_end.isoformat(),
-        "timeZone": "Europe/Warsaw",
-        "items": [{"id": CALENDAR_ID}]
-    }
+    with timer.stage("sheet_journal"):
+        write_queue.enqueue(SHEET_TAB, [
+            booking_id,
+            datetime.now().strftime("%Y-%m-%d %H:%M"),
+            booking["auto"], booking["year"], booking["vin"],
+            booking["telefon"], booking["opis"],
+            slot_start.strftime('%Y-%m-%d %H:%M'), "Nowe", booking["service"]
+        ])
 
-    try:
-        busy = calendar_service.freebusy().query(body=check_body).execute()
-        busy_times = busy['calendars'][CALENDAR_ID]['busy']
-        overlapping = any(
-            datetime.fromisoformat(b["start"]) < slot_end and datetime.fromisoformat(b["end"]) > slot_start
-            for b in busy_times
-        )
+    with timer.stage("confirm"):
+        await query.edit_message_text(t(lang, "booking_confirmed", slot=slot_start.strftime('%d.%m %H:%M')))
 
-        if overlapping:
-            lang = context.user_data.get("lang", "🇷🇺 Русский")
-            msg = {
-                "🇷🇺 Русский": "⚠️ Это время уже занято. Пожалуйста, выберите другое.",
-                "🇵🇱 Polski": "⚠️ Ten termin jest już zajęty. Wybierz inny.",
-                "🇬🇧 English": "⚠️ This time slot is already booked. Please choose another."
-            }.get(lang, "⚠️ Это время уже занято. Пожалуйста, выберите другое.")
-            await query.message.reply_text(msg)
-            return SLOT_SELECT
+    jobs.submit(context.application, "calendar_event", booking)
+    if ADMIN_CHAT_ID:
+        jobs.submit(context.application, "admin_notification", booking)
 
-        # Если всё свободно — создаём событие
-        calendar_service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
+    logging.info("⏱️ Заявка %s: %s", booking_id, timer.summary())
+    return ConversationHandler.END
 
+# === Фоновые задачи после подтверждения заявки ===
+async def create_calendar_event(booking: dict):
+    event = {
+        'id': booking["event_id"],
+        'summary': f"Заявка от {booking['telefon']}",
+        'description': (
+            f"{booking['auto']} {booking['year']}, "
+            f"VIN: {booking['vin']}\n"
+            f"Проблема: {booking['opis']}"
+            + (f"\nУслуга: {booking['service']}" if booking.get("service") else "")
+        ),
+        'start': {'dateTime': booking["start"], 'timeZone': 'Europe/Warsaw'},
+        'end': {'dateTime': booking["end"], 'timeZone': 'Europe/Warsaw'}
+    }
+    # Заявки, поставленные в очередь до появления постов, идут в CALENDAR_ID
+    calendar_id = booking.get("calendar", CALENDAR_ID)
+    start = isoparse(booking["start"])
+    # Бронь могла истечь (долгий простой, повтор из журнала неудач) — занимаем слот заново,
+    # чтобы не записать клиента поверх чужой заявки
+    owner = booking.get("owner")
+    if owner and not reservations.extend(calendar_id, start, owner, BOOKING_HOLD_SECONDS):
+        if not reservations.reserve(calendar_id, start, isoparse(booking["end"]), owner, BOOKING_HOLD_SECONDS):
+            raise RuntimeError(f"слот {booking['start']} уже занят другой заявкой")
+    try:
+        with track_dependency("calendar", "events.insert"):
+            created = await asyncio.to_thread(
+                lambda: get_calendar_service().events().insert(calendarId=calendar_id, body=event).execute()
+            )
     except Exception as e:
-        logging.error("❌ Ошибка при добавлении в календарь: %s", e)
-
-    sheet.append_row([
-        str(len(sheet.get_all_values())),
-        datetime.now().strftime("%Y-%m-%d %H:%M"),
-        context.user_data["auto"], context.user_data["year"], context.user_data["vin"],
-        context.user_data["telefon"], context.user_data["opis"],
-        slot_start.strftime('%Y-%m-%d %H:%M'), "Nowe"
-    ])
+        # 409 — событие уже создано предыдущей попыткой
+        if getattr(getattr(e, "resp", None), "status", None) != 409:
+            raise
+        created = event
+    reservations.confirm(calendar_id, start, created.get("id"))
+    if calendar_id in calendar_mirrors:
+        calendar_mirrors[calendar_id].add_event(created)
+
+async def notify_admin(booking: dict):
+    await app.bot.send_message(
+        chat_id=int(ADMIN_CHAT_ID),
+        text=(
+            f"🗓️ Новая заявка:\n"
+            f"Марка: {booking['auto']}\n"
+            f"Год: {booking['year']}\n"
+            f"VIN: {booking['vin']}\n"
+            f"Телефон: {booking['telefon']}\n"
+            f"Проблема: {booking['opis']}\n"
+            f"Дата визита: {isoparse(booking['start']).strftime('%d.%m %H:%M')}"
+            + (f"\nУслуга: {booking['service']} (до {isoparse(booking['end']).strftime('%H:%M')})"
+               if booking.get("service") else "")
+            + (f"\nПост: {booking['bay']}" if len(BAYS) > 1 and booking.get("bay") else "")
+        )
+    )
 
+# Событие так и не создано: снимаем бронь и предупреждаем клиента и администратора
+async def calendar_event_failed(booking: dict):
+    calendar_id = booking.get("calendar", CALENDAR_ID)
+    start = isoparse(booking["start"])
+    if booking.get("owner"):
+        reservations.release(calendar_id, start, booking["owner"])
+    if booking.get("chat_id"):
+        await app.bot.send_message(
+            chat_id=booking["chat_id"],
+            text=t(booking.get("lang", DEFAULT_LANG), "booking_lost", slot=start.strftime('%d.%m %H:%M'))
+        )
     if ADMIN_CHAT_ID:
-        await context.bot.send_message(
+        await app.bot.send_message(
             chat_id=int(ADMIN_CHAT_ID),
-            text=(
-                f"🗓️ Новая заявка:\n"
-                f"Марка: {context.user_data['auto']}\n"
-                f"Год: {context.user_data['year']}\n"
-                f"VIN: {context.user_data['vin']}\n"
-                f"Телефон: {context.user_data['telefon']}\n"
-                f"Проблема: {context.user_data['opis']}\n"
-                f"Дата визита: {slot_start.strftime('%d.%m %H:%M')}"
-            )
+            text=f"❌ Заявка {booking['id']} на {start.strftime('%d.%m %H:%M')} не попала в календарь, слот освобождён"
         )
 
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
-    confirmation_message = {
-        "🇷🇺 Русский": f"✅ Ваша запись подтверждена на {slot_start.strftime('%d.%m %H:%M')}. Спасибо!",
-        "🇵🇱 Polski": f"✅ Twoja rezerwacja została potwierdzona na {slot_start.strftime('%d.%m %H:%M')}. Dziękujemy!",
-        "🇬🇧 English": f"✅ Your appointment is confirmed for {slot_start.strftime('%d.%m %H:%M')}. Thank you!"
-    }.get(lang)
-
-    await query.edit_message_text(confirmation_message)
-    return ConversationHandler.END
+jobs.register("calendar_event", create_calendar_event, on_dead=calendar_event_failed)
+jobs.register("admin_notification", notify_admin)
 
 async def reload_contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -716,7 +803,11 @@ async def reload_contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     global CONTACTS
-    CONTACTS = load_contacts_from_sheet()
+    try:
+        await sheet_mirror.pull()
+    except Exception as e:
+        logging.warning("⚠️ Не удалось обновить локальную копию таблицы: %s", e)
+    CONTACTS = await load_contacts_from_sheet()
     await update.message.reply_text("✅ Контакты перезагружены.")
 
 async def reload_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -732,93 +823,184 @@ async def reload_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.callback_query.answer("⛔ Доступ запрещён", show_alert=True)
         return
 
-    global PROMO_MESSAGES, CONTACTS
-    PROMO_MESSAGES = load_promos_from_sheet()
-    CONTACTS = load_contacts_from_sheet()
+    global PROMO_MESSAGES, CONTACTS, SERVICES
+    try:
+        await sheet_mirror.pull()
+    except Exception as e:
+        logging.warning("⚠️ Не удалось обновить локальную копию таблицы: %s", e)
+    PROMO_MESSAGES, CONTACTS, SERVICES = await asyncio.gather(
+        load_promos_from_sheet(),
+        load_contacts_from_sheet(),
+        load_services_from_sheet()
+    )
 
     if update.message:
         await update.message.reply_text("✅ Акции и контакты успешно перезагружены.")
     else:
         await update.callback_query.answer("✅ Данные обновлены", show_alert=True)
 
-def get_free_slots():
-    tz = pytz.timezone("Europe/Warsaw")
-    today = datetime.now(tz).date()
-    now = tz.localize(datetime.combine(today + timedelta(days=1), time(0, 0)))
-    end_range = now + timedelta(days=14)
-    work_start = time(8, 0)
-    work_end = time(18, 0)
-    slot_duration = timedelta(minutes=30)
+# Очистка кэша ответов ассистента: /cache_clear [текст вопроса] (только для администратора)
+async def cache_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ Эта команда доступна только администратору.")
+        return
+
+    stats = response_cache.stats()
+    removed = response_cache.invalidate(" ".join(context.args) if context.args else None)
+    await update.message.reply_text(
+        f"🧹 Удалено из кэша ответов: {removed}\n"
+        f"Попаданий: {stats['hits']}, промахов: {stats['misses']} ({stats['hit_rate']:.0%})"
+    )
 
+# Метрики пула запросов к Google Sheets (только для администратора)
+async def sheets_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ Эта команда доступна только администратору.")
+        return
+
+    stats = sheets.stats()
+    queue_stats = write_queue.stats()
+    last_pull = sheet_mirror.last_pull()
+    await update.message.reply_text(
+        "📊 Google Sheets:\n"
+        f"В очереди: {stats['queued']} (макс. {stats['max_queued']})\n"
+        f"Выполняется: {stats['running']}/{stats['max_workers']} ({stats['saturation']:.0%})\n"
+        f"Запросов: {stats['calls']}, ошибок: {stats['errors']}, таймаутов: {stats['timeouts']}\n"
+        f"Квота: чтение {stats['quota_read_tokens']:.0f} токенов (ждут {stats['quota_read_waiting']}), "
+        f"запись {stats['quota_write_tokens']:.0f} (ждут {stats['quota_write_waiting']}), "
+        f"отложено {stats['quota_delayed']}, ответов 429: {stats['quota_throttled']}\n"
+        f"Объединено одинаковых чтений: {stats['coalesced']}\n"
+        f"Журнал записи: ожидает {queue_stats['pending']}, "
+        f"отправлено {queue_stats['flushed_rows']} строк в {queue_stats['batches']} пачках\n"
+        f"Локальная копия обновлена: "
+        f"{datetime.fromtimestamp(last_pull).strftime('%H:%M:%S') if last_pull else '—'}"
+    )
+
+# Фоновые задачи заявок: время этапов и журнал неудач; /jobs retry — повторить неудачные
+async def jobs_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ Эта команда доступна только администратору.")
+        return
+
+    if context.args and context.args[0] == "retry":
+        retried = jobs.retry_dead(context.application)
+        await update.message.reply_text(f"🔁 Повторно запущено задач: {retried}")
+        return
+
+    stats = jobs.stats()
+    lines = [f"⚙️ Фоновые задачи: выполняется {stats['running']}, в журнале неудач {stats['dead']}"]
+    for name, timing in stats["timings"].items():
+        lines.append(f"{name}: {timing['count']} шт., в среднем {timing['avg'] * 1000:.0f} мс, макс. {timing['max'] * 1000:.0f} мс")
+    for job_id, name, error, created in jobs.dead_letters(5):
+        lines.append(f"❌ #{job_id} {name} ({datetime.fromtimestamp(created).strftime('%d.%m %H:%M')}): {error}")
+    await update.message.reply_text("\n".join(lines))
+
+# Профилирование следующих N обновлений: /profile [N], /profile off — отменить.
+# Отчёт с самыми затратными функциями приходит администратору после N-го обновления.
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ Эта команда доступна только администратору.")
+        return
+
+    if context.args and context.args[0] == "off":
+        tracing.profiler.disarm()
+        await update.message.reply_text("🔕 Профилирование отменено.")
+        return
+
+    try:
+        count = int(context.args[0]) if context.args else 20
+    except ValueError:
+        await update.message.reply_text("Использование: /profile [число обновлений] или /profile off")
+        return
+    count = max(1, min(count, 1000))
+    chat_id = update.effective_chat.id
+
+    async def send_report(text):
+        await context.bot.send_message(chat_id=chat_id, text=text[:4096])
+
+    tracing.profiler.arm(count, send_report)
+    await update.message.reply_text(f"🔥 Профилирую следующие {count} обновлений.")
+
+# Занятость всех постов одним запросом freebusy: {calendar_id: [(start_ts, end_ts)]}
+async def query_freebusy(time_min: datetime, time_max: datetime) -> dict:
     body = {
-        "timeMin": now.isoformat(),
-        "timeMax": end_range.isoformat(),
+        "timeMin": time_min.isoformat(),
+        "timeMax": time_max.isoformat(),
         "timeZone": "Europe/Warsaw",
-        "items": [{"id": CALENDAR_ID}]
+        "items": [{"id": calendar_id} for calendar_id in BAYS]
     }
-
+    with track_dependency("calendar", "freebusy"):
+        busy = await asyncio.to_thread(lambda: get_calendar_service().freebusy().query(body=body).execute())
+    tz = pytz.timezone("Europe/Warsaw")
+    busy_by_bay = {}
+    for calendar_id in BAYS:
+        calendar = busy["calendars"].get(calendar_id, {})
+        if calendar.get("errors"):
+            raise RuntimeError(f"freebusy {calendar_id}: {calendar['errors']}")
+        busy_by_bay[calendar_id] = parse_busy(calendar.get("busy", []), tz)
+    logging.info("📅 Занятых интервалов (freebusy): %d", sum(map(len, busy_by_bay.values())))
+    return busy_by_bay
+
+# Занятость постов: из локальных зеркал, а если хотя бы одно не готово — одним freebusy.
+# Брони из журнала, ещё не попавшие в календарь, добавляются к своему посту.
+async def get_busy_intervals(time_min: datetime, time_max: datetime, fresh: bool = False) -> dict:
+    mirrors_ready = all(
+        mirror.ready and not mirror.is_stale(CALENDAR_MIRROR_MAX_AGE) for mirror in calendar_mirrors.values()
+    )
+    if mirrors_ready and not fresh:
+        busy_by_bay = {
+            calendar_id: mirror.busy_intervals(time_min, time_max)
+            for calendar_id, mirror in calendar_mirrors.items()
+        }
+    else:
+        busy_by_bay = await query_freebusy(time_min, time_max)
+    for calendar_id, intervals in busy_by_bay.items():
+        intervals.extend(reservations.reserved_intervals(calendar_id, time_min, time_max))
+    return busy_by_bay
+
+# Версия данных о занятости: меняется при любом изменении зеркал или журнала броней.
+# None — зеркала не готовы, занятость читается через freebusy и не кэшируется.
+def availability_version():
+    if not all(mirror.ready and not mirror.is_stale(CALENDAR_MIRROR_MAX_AGE) for mirror in calendar_mirrors.values()):
+        return None
+    return tuple(mirror.version for mirror in calendar_mirrors.values()), reservations.version()
+
+# Индекс свободного времени на горизонт days дней с завтрашнего: строится заново,
+# только когда изменились календари или брони (или истёк AVAILABILITY_CACHE_SECONDS)
+_availability_cache = {}
+
+async def get_availability(days: int = None) -> BayAvailability:
+    tz = pytz.timezone("Europe/Warsaw")
+    start_date = datetime.now(tz).date() + timedelta(days=1)
+    days = days or SLOT_HORIZON_DAYS
+    version = availability_version()
+    cached = _availability_cache.get((start_date, days))
+    if version is not None and cached and cached[0] == version and time_module.monotonic() - cached[2] < AVAILABILITY_CACHE_SECONDS:
+        return cached[1]
+
+    time_min = tz.localize(datetime.combine(start_date, time(0, 0)))
+    busy_by_bay = await get_busy_intervals(time_min, time_min + timedelta(days=days))
+    engine = BayAvailability(busy_by_bay, tz, start_date, days, **WORK_HOURS)
+    if version is not None:
+        if len(_availability_cache) >= 8:
+            _availability_cache.clear()
+        _availability_cache[(start_date, days)] = (version, engine, time_module.monotonic())
+    return engine
+
+# Первые limit начал, в которые помещается работа длиной duration
+async def get_free_slots(days: int = None, limit: int = 10, duration: timedelta = SLOT_DURATION):
     try:
-        busy = calendar_service.freebusy().query(body=body).execute()
-        busy_times = busy['calendars'][CALENDAR_ID]['busy']
-        logging.info("📅 Занятых интервалов: %d", len(busy_times))
+        engine = await get_availability(days)
     except Exception as e:
         logging.error("❌ Ошибка при получении занятости календаря: %s", e)
         return []
-
-    # Парсинг занятых интервалов с учетом таймзоны
-    busy_intervals = []
-    for b in busy_times:
-        try:
-            start = isoparse(b["start"])
-            end = isoparse(b["end"])
-
-            if start.tzinfo is None:
-                start = tz.localize(start)
-            else:
-                start = start.astimezone(tz)
-
-            if end.tzinfo is None:
-                end = tz.localize(end)
-            else:
-                end = end.astimezone(tz)
-
-            busy_intervals.append((start, end))
-            logging.info("⛔ %s — %s", start, end)
-        except Exception as e:
-            logging.warning("⚠️ Ошибка при обработке занятости: %s", e)
-
-    # Поиск свободных слотов
-    free_slots = []
-    current = now
-
-    while current < end_range and len(free_slots) < 10:
-        if current.weekday() < 5:  # Только рабочие дни
-            slot_start = datetime.combine(current.date(), work_start, tz)
-            slot_end = datetime.combine(current.date(), work_end, tz)
-
-            while slot_start + slot_duration <= slot_end:
-                is_busy = any(
-                    max(slot_start, b_start) < min(slot_start + slot_duration, b_end)
-                    for b_start, b_end in busy_intervals
-                )
-                if not is_busy:
-                    free_slots.append((slot_start, slot_start + slot_duration))
-                    logging.info("✅ Свободно: %s", slot_start)
-                    if len(free_slots) >= 10:
-                        break
-                slot_start += slot_duration
-        current += timedelta(days=1)
-
-    return free_slots
-
-# === Запуск ===
-if __name__ == "__main__":
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    return engine.free_slots(duration, limit=limit, step=SLOT_STEP)
 
 # Команда reset
 async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cancel_assistant_request(update.effective_user.id)
     context.user_data["awaiting_question"] = False
-    context.user_data["assistant_history"] = []
+    reset_memory(context.user_data)
     await update.message.reply_text("🔄 Режим помощника сброшен. Вы можете выбрать другую функцию.")
 
 # Команда help
@@ -832,65 +1014,74 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
+    message = update.effective_message
     if user_id != ADMIN_ID:
-        await update.message.reply_text("⛔ Эта команда доступна только администратору.")
+        await message.reply_text("⛔ Эта команда доступна только администратору.")
+        return
+
+    if broadcaster.running:
+        await message.reply_text("⏳ Рассылка уже идёт.")
         return
 
     try:
-        promos = load_promos_from_sheet()
+        promos = await load_promos_from_sheet()
 
-        sub_sheet = sheet_client.open(SHEET_NAME).worksheet("Подписчики")
-        rows = sub_sheet.get_all_values()[1:]
+        rows = await subscriber_index.items()
 
-        lang_map = {
-            "Русский": "🇷🇺 Русский",
-            "Polski": "🇵🇱 Polski",
-            "English": "🇬🇧 English"
-        }
+        recipients = []
+        for chat_id, raw_lang in rows:
+            user_lang = normalize_lang(raw_lang)
+            promo_text = promos.get(user_lang, promos.get(DEFAULT_LANG, t(DEFAULT_LANG, "promo_fallback")))
+            recipients.append((chat_id, promo_text))
 
-        for row in rows:
-            if len(row) >= 2:
-                user_id, raw_lang = row[0], row[1].strip()
-                user_lang = lang_map.get(raw_lang, raw_lang)
-                promo_text = promos.get(user_lang, promos.get("🇷🇺 Русский", "Привет 👋\n\n🔧 Весенние скидки!"))
+        status_message = await message.reply_text(f"📢 Рассылка запущена: 0/{len(recipients)}")
+
+        async def on_progress(progress):
+            await status_message.edit_text(
+                f"📢 Рассылка: {progress['sent']}/{progress['total']}\n"
+                f"Ошибок: {progress['failed']}, заблокировали бота: {len(progress['blocked'])}"
+            )
 
-                try:
-                    await context.bot.send_message(chat_id=int(user_id), text=promo_text)
-                except Exception as e:
-                    logging.warning("⚠️ Не удалось отправить сообщение пользователю %s: %s", user_id, e)
+        async def on_done(result):
+            # Чаты, заблокировавшие бота, удаляются из подписчиков
+            pruned = 0
+            with sheets_priority(BACKGROUND):
+                for chat_id in result["blocked"]:
+                    try:
+                        pruned += await subscriber_index.unsubscribe(chat_id)
+                    except Exception as e:
+                        logging.warning("⚠️ Не удалось удалить подписчика %s: %s", chat_id, e)
+            await status_message.edit_text(
+                f"✅ Новость отправлена подписчикам: {result['sent']}/{result['total']}"
+                f"{' (продолжение прерванной рассылки)' if result['resumed'] else ''}"
+                f"{' (прерванная рассылка с другим текстом отменена)' if result['replaced'] else ''}\n"
+                f"Ошибок: {result['failed']}, удалено заблокировавших: {pruned}\n"
+                f"Время: {result['elapsed']:.0f} с"
+            )
 
-        await update.message.reply_text("✅ Новость отправлена подписчикам.")
+        broadcaster.start(context.application, context.bot, recipients, on_progress, on_done)
 
     except Exception as e:
         logging.error("❌ Ошибка при отправке новости: %s", e)
-        await update.message.reply_text("⚠️ Ошибка при отправке новости.")
+        await message.reply_text("⚠️ Ошибка при отправке новости.")
 
-def get_promo_message(lang: str) -> str:
+async def get_promo_message(lang: str) -> str:
     try:
-        promos = load_promos_from_sheet()
-        return promos.get(lang, promos.get("🇷🇺 Русский", "Привет 👋\n\n🔧 Весенние скидки!"))
+        promos = await load_promos_from_sheet()
+        return promos.get(lang, promos.get(DEFAULT_LANG, t(DEFAULT_LANG, "promo_fallback")))
     except Exception as e:
         logging.warning("⚠️ Ошибка при получении промо: %s", e)
-        return "Привет 👋\n\n🔧 Весенние скидки!"
+        return t(DEFAULT_LANG, "promo_fallback")
     
 # Загрузка акций из листа
-def load_promos_from_sheet():
+async def load_promos_from_sheet():
     try:
-        promo_sheet = sheet_client.open(SHEET_NAME).worksheet("Акции")
-        rows = promo_sheet.get_all_values()
-
-        LANG_MAP = {
-            "Русский": "🇷🇺 Русский",
-            "Polski": "🇵🇱 Polski",
-            "English": "🇬🇧 English"
-        }
+        rows = await sheet_mirror.get_all_values("Акции")
 
         promo_dict = {}
         for row in rows[1:]:
             if len(row) >= 2:
-                lang_raw, text = row[0], row[1]
-                lang = LANG_MAP.get(lang_raw.strip(), lang_raw.strip())
-                promo_dict[lang] = text
+                promo_dict[normalize_lang(row[0])] = row[1]
 
         logging.info("📦 Загруженные промо: %s", promo_dict)
         return promo_dict
@@ -899,122 +1090,263 @@ def load_promos_from_sheet():
         logging.error("❌ Ошибка при загрузке промо из таблицы: %s", e)
         return {}
 
-def load_contacts_from_sheet():
+async def load_contacts_from_sheet():
     try:
-        contact_sheet = sheet_client.open(SHEET_NAME).worksheet("Контакты")
-        rows = contact_sheet.get_all_values()[1:]  # Пропускаем заголовок
+        rows = (await sheet_mirror.get_all_values("Контакты"))[1:]  # Пропускаем заголовок
         return {row[0].strip().upper(): row[1].strip() for row in rows if len(row) >= 2}
     except Exception as e:
         logging.error("❌ Ошибка при загрузке контактов: %s", e)
         return {}
     
-PROMO_MESSAGES = load_promos_from_sheet()
-CONTACTS = load_contacts_from_sheet()
+# Разбор листа «Услуги»: key | minutes | Русский | Polski | English — код, длительность
+# в минутах и названия на языках из заголовка (пустое название берётся из колонки
+# «Русский», затем код)
+def parse_services(rows):
+    if not rows:
+        return {}
+    langs = [normalize_lang(header) for header in rows[0][2:]]
+    services = {}
+    for row in rows[1:]:
+        if len(row) < 2 or not row[0].strip():
+            continue
+        key = row[0].strip()
+        # Код услуги идёт в callback_data кнопки (не больше 64 байт вместе с префиксом)
+        if len(f"svc:{key}".encode()) > 64:
+            logging.warning("⚠️ Слишком длинный код услуги: %s", key)
+            continue
+        # Нецелая или неположительная длительность — услуга идёт на SLOT_DURATION
+        try:
+            minutes = int(row[1])
+        except ValueError:
+            minutes = 0
+        if minutes <= 0:
+            logging.warning("⚠️ Неверная длительность услуги %s: %s, используем %d мин",
+                            key, row[1], SLOT_DURATION.seconds // 60)
+            minutes = SLOT_DURATION.seconds // 60
+        names = {lang: name.strip() for lang, name in zip(langs, row[2:]) if name.strip()}
+        services[key] = {"minutes": minutes, "names": names}
+    return services
+
+async def load_services_from_sheet():
+    try:
+        services = parse_services(await sheet_mirror.get_all_values("Услуги"))
+        if services:
+            logging.info("🔧 Загружено услуг: %d", len(services))
+        return services
+    except Exception as e:
+        logging.error("❌ Ошибка при загрузке услуг: %s", e)
+        return {}
+
+def service_name(key: str, lang: str) -> str:
+    names = SERVICES.get(key, {}).get("names", {})
+    return names.get(lang) or names.get(DEFAULT_LANG) or key
+
+PROMO_MESSAGES = {}
+CONTACTS = {}
+SERVICES = {}
 
 # Обработчик кнопки "Назад"
 async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    lang = context.user_data.get("lang", "🇷🇺 Русский")
+    lang = context.user_data.get("lang", DEFAULT_LANG)
     user_id = str(query.from_user.id)
 
     try:
-        sub_sheet = sheet_client.open(SHEET_NAME).worksheet("Подписчики")
-        ids = [row[0] for row in sub_sheet.get_all_values()[1:]]
-        subscribed = user_id in ids
+        subscribed = await subscriber_index.is_subscribed(user_id)
     except Exception as e:
         logging.warning("⚠️ Ошибка при проверке подписки: %s", e)
         subscribed = False
 
-    subscribe_text = {
-        "🇷🇺 Русский": "📬 Отписаться" if subscribed else "📬 Подписаться",
-        "🇵🇱 Polski": "📬 Wypisz się" if subscribed else "📬 Subskrybuj",
-        "🇬🇧 English": "📬 Unsubscribe" if subscribed else "📬 Subscribe"
-    }.get(lang, "📬 Подписаться")
-
-    promo = get_promo_message(lang)
-
-    if lang == "🇵🇱 Polski":
-        buttons = [
-            [InlineKeyboardButton("📍 Adres", callback_data="address")],
-            [InlineKeyboardButton("📝 Rejestracja", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Kontakt", callback_data="contacts")],
-            [InlineKeyboardButton("🤖 Asystent diagnostyczny", callback_data="assistant")],
-            [InlineKeyboardButton(subscribe_text, callback_data="subscribe")]
-        ]
-    elif lang == "🇬🇧 English":
-        buttons = [
-            [InlineKeyboardButton("📍 Address", callback_data="address")],
-            [InlineKeyboardButton("📝 Appointment", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Contact", callback_data="contacts")],
-            [InlineKeyboardButton("🤖 Assistant", callback_data="assistant")],
-            [InlineKeyboardButton(subscribe_text, callback_data="subscribe")]
-        ]
-    else:
-        buttons = [
-            [InlineKeyboardButton("📍 Адрес", callback_data="address")],
-            [InlineKeyboardButton("📝 Запись", callback_data="zapis")],
-            [InlineKeyboardButton("📞 Контакты", callback_data="contacts")],
-            [InlineKeyboardButton("🤖 Помощник по неисправностям", callback_data="assistant")],
-            [InlineKeyboardButton(subscribe_text, callback_data="subscribe")]
-        ]
-
-# 👑 Добавляем кнопку администратора
-    if str(update.effective_user.id) == str(ADMIN_ID):
-        admin_text = admin_button_text.get(lang, "♻️ Обновить данные")
-        buttons.append([InlineKeyboardButton(admin_text, callback_data="reload_all")])
-        buttons.append([InlineKeyboardButton("📢 Разослать новость", callback_data="send_news")])
+    promo = await get_promo_message(lang)
+    keyboard = main_menu(lang, subscribed, is_admin(query.from_user))
 
     try:
         await context.bot.delete_message(chat_id=query.message.chat_id, message_id=query.message.message_id)
         await context.bot.send_message(
             chat_id=query.message.chat_id,
             text=promo,
-            reply_markup=InlineKeyboardMarkup(buttons))
+            reply_markup=keyboard)
     except Exception as e:
         logging.error("❌ Ошибка при обновлении меню: %s", e)
 
 conv_handler = ConversationHandler(
-    entry_points=[CallbackQueryHandler(handle_zapis, pattern="^zapis$")],
+    entry_points=[CallbackQueryHandler(timed(handle_zapis), pattern="^zapis$")],
     states={
-        AUTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_auto)],
-        YEAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_year)],
-        VIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_vin)],
-        TELEFON: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_telefon)],
-        OPIS: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_opis)],
-        SLOT_SELECT: [CallbackQueryHandler(slot_selected, pattern=r"^\d{4}-\d{2}-\d{2}T")]
+        AUTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_auto))],
+        YEAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_year))],
+        VIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_vin))],
+        TELEFON: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_telefon))],
+        OPIS: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_opis))],
+        SERVICE: [CallbackQueryHandler(timed(service_selected), pattern="^svc:")],
+        SLOT_SELECT: [
+            CallbackQueryHandler(timed(slot_selected), pattern=rf"^(s:{SLOT_TOKEN_RE}|\d{{4}}-\d{{2}}-\d{{2}}T.*)$"),
+            CallbackQueryHandler(timed(slot_page_selected), pattern=rf"^[nb]:{SLOT_TOKEN_RE}$"),
+            CallbackQueryHandler(timed(day_picker), pattern=rf"^d:{SLOT_TOKEN_RE}$")
+        ]
     },
-    fallbacks=[CommandHandler("start", start)]
+    fallbacks=[CommandHandler("start", timed(start))],
+    name="zapis",
+    persistent=True
 )
 
+# Однократная инициализация счётчика заявок по листу (и неотправленному журналу)
+async def ensure_booking_ids_seeded():
+    if booking_ids.is_seeded():
+        return
+    rows = await sheet_mirror.get_all_values(SHEET_TAB)
+    booking_ids.seed(last_booking_id(rows + write_queue.pending_rows(SHEET_TAB)))
+
+# Загрузка промо, контактов, подписчиков и счётчика заявок — параллельно.
+# Читается локальная копия таблицы, поэтому после перезапуска это мгновенно.
+async def refresh_local_data():
+    global PROMO_MESSAGES, CONTACTS, SERVICES
+    promos, contacts, services, *errors = await asyncio.gather(
+        load_promos_from_sheet(),
+        load_contacts_from_sheet(),
+        load_services_from_sheet(),
+        subscriber_index.load(),
+        ensure_booking_ids_seeded(),
+        return_exceptions=True
+    )
+    if isinstance(promos, dict) and promos:
+        PROMO_MESSAGES = promos
+    if isinstance(contacts, dict) and contacts:
+        CONTACTS = contacts
+    if isinstance(services, dict):
+        SERVICES = services
+    for error in errors:
+        if isinstance(error, Exception):
+            logging.warning("⚠️ Ошибка при загрузке данных: %s", error)
+
+# Прогрев в фоне: бот начинает принимать обновления сразу, на снимке данных
+async def warm_up():
+    started = time_module.monotonic()
+    had_snapshot = sheet_mirror.last_pull() is not None
+    reservations.purge()
+    await refresh_local_data()
+    logging.info("🚀 Данные из локальной копии загружены за %.2f с", time_module.monotonic() - started)
+    if had_snapshot:
+        # Снимок мог устареть, пока бот был выключен
+        try:
+            await sheet_mirror.pull()
+            await refresh_local_data()
+        except Exception as e:
+            logging.warning("⚠️ Не удалось обновить локальную копию таблицы: %s", e)
+    logging.info("🚀 Прогрев завершён за %.2f с", time_module.monotonic() - started)
+
+# Фоновые задачи после инициализации приложения
+async def on_startup(application):
+    await setup_bot_commands(application)
+    application.create_task(warm_up())
+    application.create_task(subscriber_index.reconcile_forever())
+    application.create_task(write_queue.run_forever())
+    for mirror in calendar_mirrors.values():
+        application.create_task(mirror.run_forever())
+    application.create_task(sheet_mirror.run_forever())
+    jobs.resume(application)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+# Дождаться фоновых задач заявок перед остановкой
+async def on_shutdown(application):
+    await jobs.drain()
+
 # === Запуск ===
-app = ApplicationBuilder().token(BOT_TOKEN).build()
+# Сессии пользователей и состояния диалогов переживают перезапуск
+persistence = SQLitePersistence(
+    os.path.join(DATA_DIR, "sessions.sqlite3"),
+    update_interval=float(os.getenv("PERSISTENCE_INTERVAL_SECONDS", "30"))
+)
+# === Метрики состояния (считаются в момент запроса /metrics) ===
+CONVERSATION_STATES = {AUTO: "AUTO", YEAR: "YEAR", VIN: "VIN", TELEFON: "TELEFON", OPIS: "OPIS", SERVICE: "SERVICE", SLOT_SELECT: "SLOT_SELECT"}
+
+def conversation_counts():
+    counts = dict.fromkeys(CONVERSATION_STATES.values(), 0)
+    for state in persistence.conversations.get(conv_handler.name, {}).values():
+        if state in CONVERSATION_STATES:
+            counts[CONVERSATION_STATES[state]] += 1
+    return [((name,), count) for name, count in counts.items()]
+
+def broadcast_progress():
+    progress = broadcaster.progress
+    return [
+        (("running",), int(broadcaster.running)),
+        (("total",), progress.get("total", 0)),
+        (("sent",), progress.get("sent", 0)),
+        (("failed",), progress.get("failed", 0)),
+        (("blocked",), len(progress.get("blocked", [])))
+    ]
+
+def sheets_pool():
+    stats = sheets.stats()
+    fields = ("queued", "running", "max_queued", "saturation", "coalesced",
+              "quota_read_tokens", "quota_write_tokens", "quota_read_waiting", "quota_write_waiting")
+    return [((name,), stats[name]) for name in fields] + [
+        (("journal_pending",), write_queue.stats()["pending"])
+    ]
+
+gauge_callback("bot_conversations", "Активные диалоги записи по шагам", ["state"], conversation_counts)
+gauge_callback("bot_broadcast", "Ход текущей (последней) рассылки", ["field"], broadcast_progress)
+gauge_callback("bot_sheets_pool", "Пул запросов к Google Sheets и журнал записи", ["field"], sheets_pool)
+gauge_callback("bot_background_jobs", "Фоновые задачи заявок", ["field"],
+               lambda: [(("running",), jobs.stats()["running"]), (("dead",), jobs.stats()["dead"])])
+
+builder = (
+    ApplicationBuilder().token(BOT_TOKEN).persistence(persistence)
+    .post_init(on_startup).post_shutdown(on_shutdown)
+    # Замер вызовов Bot API по методам
+    .request(InstrumentedRequest(connection_pool_size=256))
+    .get_updates_request(InstrumentedRequest())
+)
+if TELEGRAM_API_URL:
+    builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+app = builder.build()
 
 # Хендлеры команд
-app.add_handler(CommandHandler("start", start))
-app.add_handler(CommandHandler("reset", reset_command))
-app.add_handler(CommandHandler("help", help_command))
-app.add_handler(CommandHandler("send_news", send_news))
-app.add_handler(CommandHandler("reload_contacts", reload_contacts))
-app.add_handler(CommandHandler("reload_all", reload_all))
+app.add_handler(CommandHandler("start", timed(start)))
+app.add_handler(CommandHandler("reset", timed(reset_command)))
+app.add_handler(CommandHandler("help", timed(help_command)))
+app.add_handler(CommandHandler("send_news", timed(send_news)))
+app.add_handler(CommandHandler("reload_contacts", timed(reload_contacts)))
+app.add_handler(CommandHandler("reload_all", timed(reload_all)))
+app.add_handler(CommandHandler("sheets_stats", timed(sheets_stats)))
+app.add_handler(CommandHandler("jobs", timed(jobs_stats)))
+app.add_handler(CommandHandler("profile", timed(profile_command)))
+app.add_handler(CommandHandler("cache_clear", timed(cache_clear)))
 
 # Остальные хендлеры
-app.add_handler(CallbackQueryHandler(back_to_menu, pattern="^back_to_menu$"))
-app.add_handler(CallbackQueryHandler(change_language, pattern="^change_language$"))
-app.add_handler(CallbackQueryHandler(language_callback, pattern="^lang_"))  
+app.add_handler(CallbackQueryHandler(timed(back_to_menu), pattern="^back_to_menu$"))
+app.add_handler(CallbackQueryHandler(timed(change_language), pattern="^change_language$"))
+app.add_handler(CallbackQueryHandler(timed(language_callback), pattern="^lang_"))  
 app.add_handler(conv_handler)
-app.add_handler(CallbackQueryHandler(button_handler))
+app.add_handler(CallbackQueryHandler(timed(button_handler)))
 app.add_handler(MessageHandler(
     filters.TEXT & ~filters.COMMAND,
-    lambda update, context: handle_user_message(update, context, openai_client)
+    timed(
+        lambda update, context: handle_user_message(update, context, get_openai_client(), write_queue, response_cache),
+        "handle_user_message"
+    )
 ))
 
-# Запуск и установка команд
-async def main():
-    await setup_bot_commands(app)
-    await app.run_polling()
+# Запуск (команды меню устанавливаются в on_startup)
+def main():
+    if BOT_MODE == "webhook":
+        # Встроенный HTTP-сервер: Telegram сам присылает обновления,
+        # запросы без верного секрета отклоняются с кодом 403
+        logging.info("🌐 Webhook: %s/%s (слушаем %s:%d)", WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT)
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    main()
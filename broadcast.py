@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота, 1 в секунду на чат
+GLOBAL_RATE = 25
+PER_CHAT_INTERVAL = 1.0
+MAX_ATTEMPTS = 3
+
+
+# Равномерный лимит скорости (token bucket) с общей паузой после RetryAfter
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# Отпечаток текстов рассылки: продолжать можно только рассылку того же сообщения
+def message_hash(recipients) -> str:
+    texts = sorted({text for _, text in recipients})
+    return hashlib.sha1("\0".join(texts).encode("utf-8")).hexdigest()
+
+
+# Журнал рассылок: кому уже отправлено — для продолжения после сбоя
+class BroadcastCheckpoint:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created REAL NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " finished REAL);"
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " broadcast_id INTEGER NOT NULL,"
+            " chat_id TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " PRIMARY KEY (broadcast_id, chat_id));"
+        )
+        # Журналы прежних версий — без отпечатка сообщения
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(broadcasts)")]
+        if "message_hash" not in columns:
+            self._db.execute("ALTER TABLE broadcasts ADD COLUMN message_hash TEXT")
+        self._db.commit()
+        self._buffer = []
+
+    # Незавершённая рассылка (если бот упал посреди неё): (id, отпечаток сообщения)
+    def unfinished(self):
+        row = self._db.execute(
+            "SELECT id, message_hash FROM broadcasts WHERE finished IS NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def start(self, total: int, message_hash: str = None) -> int:
+        cursor = self._db.execute(
+            "INSERT INTO broadcasts (created, total, message_hash) VALUES (?, ?, ?)",
+            (time.time(), total, message_hash)
+        )
+        self._db.commit()
+        return cursor.lastrowid
+
+    def done(self, broadcast_id: int) -> dict:
+        rows = self._db.execute(
+            "SELECT chat_id, status FROM deliveries WHERE broadcast_id = ?", (broadcast_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def record(self, broadcast_id: int, chat_id: str, status: str):
+        self._buffer.append((broadcast_id, chat_id, status))
+        if len(self._buffer) >= 50:
+            self.flush()
+
+    # Записи копятся в памяти и сохраняются пачкой
+    def flush(self):
+        if self._buffer:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO deliveries (broadcast_id, chat_id, status) VALUES (?, ?, ?)",
+                self._buffer
+            )
+            self._db.commit()
+            self._buffer = []
+
+    def finish(self, broadcast_id: int):
+        self.flush()
+        self._db.execute("UPDATE broadcasts SET finished = ? WHERE id = ?", (time.time(), broadcast_id))
+        self._db.commit()
+
+
+# Рассылка с ограниченной параллельностью, соблюдением лимитов Telegram
+# и продолжением с места остановки
+class Broadcaster:
+    def __init__(self, checkpoint: BroadcastCheckpoint, concurrency: int = 20,
+                 rate: float = GLOBAL_RATE, progress_interval: float = 5.0):
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.rate = rate
+        self.progress_interval = progress_interval
+        self.progress = {}
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # recipients — список (chat_id, текст); on_progress(progress) вызывается периодически.
+    # Прерванная рассылка продолжается, только если текст тот же: иначе она закрывается
+    # и новое сообщение получают все, в том числе получившие старое
+    async def run(self, bot, recipients, on_progress=None) -> dict:
+        fingerprint = message_hash(recipients)
+        unfinished = self.checkpoint.unfinished()
+        replaced = None
+        if unfinished is not None and unfinished[1] != fingerprint:
+            replaced = unfinished[0]
+            logging.warning("📢 Прерванная рассылка #%d была с другим текстом — не продолжаем её", replaced)
+            self.checkpoint.finish(replaced)
+            unfinished = None
+        resumed = unfinished is not None
+        broadcast_id = unfinished[0] if resumed else self.checkpoint.start(len(recipients), fingerprint)
+        already = self.checkpoint.done(broadcast_id)
+
+        self.progress = {
+            "id": broadcast_id,
+            "resumed": resumed,
+            "replaced": replaced,
+            "total": len(recipients),
+            "sent": sum(1 for status in already.values() if status == "sent"),
+            "failed": 0,
+            "blocked": [chat_id for chat_id, status in already.items() if status == "blocked"],
+            "started": time.monotonic(),
+        }
+
+        queue = asyncio.Queue()
+        for chat_id, text in recipients:
+            if str(chat_id) not in already:
+                queue.put_nowait((str(chat_id), text))
+        if resumed:
+            logging.info("📢 Продолжение рассылки #%d: осталось %d", broadcast_id, queue.qsize())
+
+        limiter = RateLimiter(self.rate)
+        workers = [
+            asyncio.create_task(self._worker(bot, queue, limiter, broadcast_id))
+            for _ in range(min(self.concurrency, max(queue.qsize(), 1)))
+        ]
+        reporter = asyncio.create_task(self._report(on_progress))
+        try:
+            await queue.join()
+        finally:
+            for task in workers + [reporter]:
+                task.cancel()
+            self.checkpoint.flush()
+
+        self.checkpoint.finish(broadcast_id)
+        self.progress["elapsed"] = time.monotonic() - self.progress["started"]
+        logging.info(
+            "📢 Рассылка #%d завершена: отправлено %d, ошибок %d, заблокировали %d, %.0f с",
+            broadcast_id, self.progress["sent"], self.progress["failed"],
+            len(self.progress["blocked"]), self.progress["elapsed"]
+        )
+        return self.progress
+
+    # Запуск в фоне, чтобы обработчик команды не ждал окончания
+    def start(self, application, bot, recipients, on_progress=None, on_done=None):
+        async def job():
+            result = await self.run(bot, recipients, on_progress)
+            if on_done:
+                await on_done(result)
+        self._task = application.create_task(job())
+        return self._task
+
+    async def _worker(self, bot, queue, limiter, broadcast_id):
+        while True:
+            chat_id, text = await queue.get()
+            try:
+                # Любая ошибка — неудача одного получателя, а не остановка воркера:
+                # иначе очередь не опустеет и queue.join() будет ждать вечно
+                try:
+                    status = await self._deliver(bot, limiter, chat_id, text)
+                except Exception as e:
+                    logging.warning("⚠️ Ошибка рассылки пользователю %s: %s", chat_id, e)
+                    status = "failed"
+                self.checkpoint.record(broadcast_id, chat_id, status)
+                if status == "sent":
+                    self.progress["sent"] += 1
+                elif status == "blocked":
+                    self.progress["blocked"].append(chat_id)
+                else:
+                    self.progress["failed"] += 1
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, bot, limiter, chat_id, text) -> str:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await limiter.acquire()
+            try:
+                await bot.send_message(chat_id=int(chat_id), text=text)
+                return "sent"
+            except RetryAfter as e:
+                # Flood control — притормаживаем всю рассылку, а не только этот чат
+                logging.warning("⏳ RetryAfter %s с при рассылке", e.retry_after)
+                limiter.pause(e.retry_after + PER_CHAT_INTERVAL)
+            except Forbidden:
+                return "blocked"
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    return "blocked"
+                logging.warning("⚠️ Не удалось отправить сообщение пользователю %s: %s", chat_id, e)
+                return "failed"
+            except TelegramError as e:
+                logging.warning("⚠️ Ошибка отправки пользователю %s (попытка %d): %s", chat_id, attempt, e)
+                await asyncio.sleep(PER_CHAT_INTERVAL * attempt)
+        return "failed"
+
+    async def _report(self, on_progress):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.checkpoint.flush()
+            if on_progress:
+                try:
+                    await on_progress(self.progress)
+                except Exception as e:
+                    logging.warning("⚠️ Не удалось обновить прогресс рассылки: %s", e)
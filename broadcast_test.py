@@ -0,0 +1,62 @@
+import asyncio
+
+from telegram.error import Forbidden
+
+from broadcast import Broadcaster, BroadcastCheckpoint, message_hash
+
+
+# Вместо telegram Bot: запоминает отправленное, для отдельных чатов падает
+class Bot:
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        self.sent.append((chat_id, text))
+
+
+def broadcast(checkpoint, bot, recipients):
+    broadcaster = Broadcaster(checkpoint, concurrency=2, rate=1000)
+    return asyncio.run(asyncio.wait_for(broadcaster.run(bot, recipients), timeout=5))
+
+
+def test_unexpected_error_fails_one_recipient(tmp_path):
+    checkpoint = BroadcastCheckpoint(str(tmp_path / "broadcasts.sqlite3"))
+    bot = Bot({2: RuntimeError("connection reset"), 3: Forbidden("bot was blocked by the user")})
+    recipients = [(chat_id, "Акция") for chat_id in range(1, 6)]
+    result = broadcast(checkpoint, bot, recipients)
+    assert (result["sent"], result["failed"], result["blocked"]) == (3, 1, ["3"])
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 4, 5]
+    assert checkpoint.unfinished() is None
+
+
+def test_interrupted_broadcast_resumes_same_message(tmp_path):
+    checkpoint = BroadcastCheckpoint(str(tmp_path / "broadcasts.sqlite3"))
+    recipients = [(1, "Акция"), (2, "Promocja"), (3, "Акция")]
+    broadcast_id = checkpoint.start(len(recipients), message_hash(recipients))
+    checkpoint.record(broadcast_id, "1", "sent")
+    checkpoint.flush()
+
+    bot = Bot()
+    result = broadcast(checkpoint, bot, recipients)
+    assert result["id"] == broadcast_id
+    assert result["resumed"] and result["replaced"] is None
+    assert sorted(bot.sent) == [(2, "Promocja"), (3, "Акция")]
+
+
+def test_interrupted_broadcast_of_other_message_is_not_resumed(tmp_path):
+    checkpoint = BroadcastCheckpoint(str(tmp_path / "broadcasts.sqlite3"))
+    old = [(1, "Старая акция"), (2, "Старая акция")]
+    old_id = checkpoint.start(len(old), message_hash(old))
+    checkpoint.record(old_id, "1", "sent")
+    checkpoint.flush()
+
+    bot = Bot()
+    recipients = [(1, "Новая акция"), (2, "Новая акция")]
+    result = broadcast(checkpoint, bot, recipients)
+    assert result["id"] != old_id
+    assert not result["resumed"] and result["replaced"] == old_id
+    assert sorted(bot.sent) == recipients
+    assert checkpoint.unfinished() is None
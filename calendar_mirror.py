@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time as time_module
+from datetime import datetime, time
+
+from dateutil.parser import isoparse
+
+from metrics import track_dependency
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+# Локальное зеркало Google Calendar: один полный events.list, дальше —
+# только изменения по syncToken. Поиск слотов читает интервалы отсюда
+# без сетевых запросов.
+class CalendarMirror:
+    def __init__(self, get_service, calendar_id: str, tz, poll_interval: float = 30.0):
+        # get_service — функция, возвращающая клиент Calendar API (создаётся лениво)
+        self._get_service = get_service
+        self.calendar_id = calendar_id
+        self.tz = tz
+        self.poll_interval = poll_interval
+        self._events = {}  # event_id -> (start_ts, end_ts)
+        self._sync_token = None
+        self._sync_lock = asyncio.Lock()
+        self.ready = False
+        self.last_sync = None
+        # Растёт при каждом изменении набора событий (для кэша свободного времени)
+        self.version = 0
+
+    # === Запросы к API (выполняются в потоке) ===
+    def _list_events(self, sync_token=None):
+        items = []
+        page_token = None
+        while True:
+            params = {
+                "calendarId": self.calendar_id,
+                "singleEvents": True,
+                "showDeleted": sync_token is not None,
+                "maxResults": 2500,
+            }
+            if sync_token:
+                params["syncToken"] = sync_token
+            if page_token:
+                params["pageToken"] = page_token
+            try:
+                with track_dependency("calendar", "events.list"):
+                    response = self._get_service().events().list(**params).execute()
+            except Exception as e:
+                if getattr(getattr(e, "resp", None), "status", None) == 410:
+                    raise SyncTokenExpired() from e
+                raise
+            items.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return items, response.get("nextSyncToken")
+
+    # === Синхронизация ===
+    async def full_sync(self):
+        items, token = await asyncio.to_thread(self._list_events)
+        self._events = {}
+        self.version += 1
+        self._apply(items)
+        self._sync_token = token
+        self.ready = True
+        self.last_sync = time_module.time()
+        logging.info("📅 Зеркало календаря: полная синхронизация, событий %d", len(self._events))
+
+    async def refresh(self):
+        async with self._sync_lock:
+            if not self._sync_token:
+                await self.full_sync()
+                return
+            try:
+                items, token = await asyncio.to_thread(self._list_events, self._sync_token)
+            except SyncTokenExpired:
+                logging.warning("♻️ syncToken календаря устарел — полная синхронизация")
+                await self.full_sync()
+                return
+            self._apply(items)
+            self._sync_token = token or self._sync_token
+            self.last_sync = time_module.time()
+            if items:
+                logging.info("📅 Зеркало календаря: изменений %d", len(items))
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.warning("⚠️ Ошибка синхронизации календаря: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    # === Локальный индекс ===
+    def _apply(self, items):
+        if items:
+            self.version += 1
+        horizon = time_module.time() - 86400
+        for event in items:
+            event_id = event.get("id")
+            if not event_id:
+                continue
+            interval = self._event_interval(event)
+            if interval is None or interval[1] < horizon:
+                self._events.pop(event_id, None)
+            else:
+                self._events[event_id] = interval
+
+    # Событие, только что созданное ботом, попадает в зеркало сразу
+    def add_event(self, event: dict):
+        self._apply([event])
+
+    def _event_interval(self, event):
+        if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+            return None
+        start, end = event.get("start", {}), event.get("end", {})
+        if "dateTime" in start and "dateTime" in end:
+            return isoparse(start["dateTime"]).timestamp(), isoparse(end["dateTime"]).timestamp()
+        if "date" in start and "date" in end:
+            # Событие на весь день занимает сутки целиком по местному времени
+            start_day = isoparse(start["date"]).date()
+            end_day = isoparse(end["date"]).date()
+            return (
+                self.tz.localize(datetime.combine(start_day, time(0, 0))).timestamp(),
+                self.tz.localize(datetime.combine(end_day, time(0, 0))).timestamp()
+            )
+        return None
+
+    # Занятые интервалы (epoch-секунды), пересекающие [start, end)
+    def busy_intervals(self, start: datetime, end: datetime):
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        return [
+            (event_start, event_end)
+            for event_start, event_end in self._events.values()
+            if event_start < end_ts and event_end > start_ts
+        ]
+
+    def is_stale(self, max_age: float) -> bool:
+        return self.last_sync is None or time_module.time() - self.last_sync > max_age
+
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# calendar_test.py — ручная проверка доступа к живому Google Calendar, не юнит-тест
+collect_ignore = ["calendar_test.py"]
+
+# Заменители Google-сервисов из нагрузочного теста используются и в тестах
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools"))
+
+
+# Модуль бота с фиктивными настройками: сеть при импорте не нужна, данные — во временной папке
+@pytest.fixture(scope="session")
+def bot(tmp_path_factory):
+    os.environ["BOT_DATA_DIR"] = str(tmp_path_factory.mktemp("bot_data"))
+    os.environ["METRICS_PORT"] = "0"
+    for name, value in {
+        "BOT_TOKEN": "123456:TEST",
+        "ADMIN_ID": "1",
+        "ADMIN_CHAT_ID": "1",
+        "CALENDAR_ID": "test-calendar",
+        "GOOGLE_SHEET_NAME": "test",
+        "GOOGLE_SHEET_TAB": "Zlecenia",
+        "OPENAI_API_KEY": "sk-test",
+    }.items():
+        os.environ.setdefault(name, value)
+    import bot
+    return bot
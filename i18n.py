@@ -0,0 +1,226 @@
+import logging
+
+DEFAULT_LANG = "🇷🇺 Русский"
+
+# Поддерживаемые языки: код -> подпись (подпись хранится в сессии и в таблице)
+LANGUAGES = {
+    "ru": "🇷🇺 Русский",
+    "pl": "🇵🇱 Polski",
+    "en": "🇬🇧 English"
+}
+
+# Все тексты интерфейса: ключ -> {код языка: текст}.
+# Новый язык — это новый код в LANGUAGES и строки здесь, обработчики не меняются.
+MESSAGES = {
+    "choose_language": {
+        "ru": "Выберите язык / Choose language / Wybierz język:"
+    },
+    "welcome": {
+        "ru": "Добро пожаловать!",
+        "pl": "Witamy!",
+        "en": "Welcome!"
+    },
+    "promo_fallback": {
+        "ru": "Привет 👋\n\n🔧 Весенние скидки!"
+    },
+
+    # Главное меню
+    "menu_address": {"ru": "📍 Адрес", "pl": "📍 Adres", "en": "📍 Address"},
+    "menu_booking": {"ru": "📝 Запись", "pl": "📝 Rejestracja", "en": "📝 Appointment"},
+    "menu_contacts": {"ru": "📞 Контакты", "pl": "📞 Kontakt", "en": "📞 Contact"},
+    "menu_subscribe": {"ru": "📬 Подписаться", "pl": "📬 Subskrybuj", "en": "📬 Subscribe"},
+    "menu_unsubscribe": {"ru": "📬 Отписаться", "pl": "📬 Wypisz się", "en": "📬 Unsubscribe"},
+    "menu_assistant": {
+        "ru": "🤖 Помощник по неисправностям",
+        "pl": "🤖 Asystent diagnostyczny",
+        "en": "🤖 Assistant"
+    },
+    "menu_change_language": {"ru": "🌍 Сменить язык", "pl": "🌍 Zmień język", "en": "🌍 Change language"},
+    "menu_reload": {"ru": "♻️ Обновить данные", "pl": "♻️ Odśwież dane", "en": "♻️ Reload data"},
+    "menu_send_news": {"ru": "📢 Разослать новость"},
+    "back": {"ru": "🔙 Назад", "pl": "🔙 Wróć", "en": "🔙 Back"},
+
+    # Подписка
+    "subscribed": {
+        "ru": "✅ Вы подписались на новости.",
+        "pl": "✅ Zapisano do newslettera.",
+        "en": "✅ You have subscribed to news."
+    },
+    "unsubscribed": {
+        "ru": "❌ Вы отписались от новостей.",
+        "pl": "❌ Wypisano z newslettera.",
+        "en": "❌ You have unsubscribed from news."
+    },
+    "subscription_error": {
+        "ru": "⚠️ Ошибка. Попробуйте позже.",
+        "pl": "⚠️ Błąd. Spróbuj później.",
+        "en": "⚠️ Error. Please try again later."
+    },
+
+    # Адрес и контакты
+    "route": {"ru": "🗺️ Проложить маршрут", "pl": "🗺️ Wyznacz trasę", "en": "🗺️ Get directions"},
+    "contacts": {
+        "ru": "Наши контакты и соцсети:\n\n📞 Телефон: {phone}",
+        "pl": "Nasze kontakty i media społecznościowe:\n\n📞 Telefon: {phone}",
+        "en": "Our contacts and social media:\n\n📞 Phone: {phone}"
+    },
+
+    # Запись на сервис
+    "auto_format": {
+        "ru": "❌ Введите марку и модель через пробел, например: Audi A4",
+        "pl": "❌ Wprowadź markę i model oddzielone spacją, np. Audi A4",
+        "en": "❌ Enter make and model separated by space, e.g. Audi A4"
+    },
+    "auto_make": {
+        "ru": "❌ Марка должна содержать только буквы.",
+        "pl": "❌ Marka może zawierać tylko litery.",
+        "en": "❌ Make must contain only letters."
+    },
+    "auto_model": {
+        "ru": "❌ Модель должна содержать только буквы и цифры.",
+        "pl": "❌ Model może zawierać tylko litery i cyfry.",
+        "en": "❌ Model can only contain letters and digits."
+    },
+    "ask_year": {"ru": "Год выпуска:", "pl": "Podaj rok produkcji:", "en": "Enter the year of manufacture:"},
+    "bad_year": {
+        "ru": "❌ Введите корректный год (4 цифры, не раньше 1990).",
+        "pl": "❌ Wprowadź poprawny rok (4 cyfry, nie wcześniej niż 1990).",
+        "en": "❌ Enter a valid year (4 digits, not earlier than 1990)."
+    },
+    "ask_vin": {"ru": "VIN код:", "pl": "Kod VIN:", "en": "VIN code:"},
+    "bad_vin": {
+        "ru": "❌ VIN должен содержать ровно 17 символов (без I, O, Q).",
+        "pl": "❌ VIN musi mieć dokładnie 17 znaków (bez I, O, Q).",
+        "en": "❌ VIN must be exactly 17 characters (excluding I, O, Q)."
+    },
+    "ask_phone": {"ru": "Введите номер телефона:", "pl": "Podaj numer telefonu:", "en": "Enter your phone number:"},
+    "bad_phone": {
+        "ru": "❌ Введите корректный номер телефона (9–15 цифр).",
+        "pl": "❌ Wprowadź poprawny numer telefonu (9–15 cyfr).",
+        "en": "❌ Enter a valid phone number (9–15 digits)."
+    },
+    "ask_issue": {"ru": "Опишите проблему:", "pl": "Opisz problem:", "en": "Describe the issue:"},
+    "no_slots": {
+        "ru": "Нет доступных времён. Попробуйте позже.",
+        "pl": "Brak wolnych terminów. Spróbuj później.",
+        "en": "No available times. Please try again later."
+    },
+    "choose_service": {
+        "ru": "Выберите услугу:",
+        "pl": "Wybierz usługę:",
+        "en": "Choose a service:"
+    },
+    "service_unknown": {
+        "ru": "⚠️ Эта услуга больше недоступна. Выберите другую.",
+        "pl": "⚠️ Ta usługa jest już niedostępna. Wybierz inną.",
+        "en": "⚠️ This service is no longer available. Please choose another."
+    },
+    "choose_slot": {
+        "ru": "Выберите удобное время:",
+        "pl": "Wybierz dogodny termin:",
+        "en": "Choose a convenient time:"
+    },
+    "pick_day": {"ru": "📅 День", "pl": "📅 Dzień", "en": "📅 Day"},
+    "choose_day": {
+        "ru": "Выберите день:",
+        "pl": "Wybierz dzień:",
+        "en": "Choose a day:"
+    },
+    "slot_taken": {
+        "ru": "⚠️ Это время уже занято. Пожалуйста, выберите другое.",
+        "pl": "⚠️ Ten termin jest już zajęty. Wybierz inny.",
+        "en": "⚠️ This time slot is already booked. Please choose another."
+    },
+    "booking_failed": {
+        "ru": "⚠️ Не удалось оформить запись. Попробуйте выбрать время ещё раз.",
+        "pl": "⚠️ Nie udało się zarezerwować terminu. Spróbuj wybrać termin ponownie.",
+        "en": "⚠️ Could not book this time. Please try choosing a time again."
+    },
+    "booking_confirmed": {
+        "ru": "✅ Ваша запись подтверждена на {slot}. Спасибо!",
+        "pl": "✅ Twoja rezerwacja została potwierdzona na {slot}. Dziękujemy!",
+        "en": "✅ Your appointment is confirmed for {slot}. Thank you!"
+    },
+    "booking_lost": {
+        "ru": "⚠️ Не удалось внести запись на {slot} в календарь сервиса. Пожалуйста, выберите время ещё раз или позвоните нам.",
+        "pl": "⚠️ Nie udało się wpisać rezerwacji na {slot} do kalendarza serwisu. Wybierz termin ponownie lub zadzwoń do nas.",
+        "en": "⚠️ We could not add your appointment for {slot} to the workshop calendar. Please choose a time again or call us."
+    },
+
+    # Помощник-диагност
+    "assistant_intro": {
+        "ru": "✍️ Опишите вашу проблему с автомобилем. Я помогу диагностировать.",
+        "pl": "✍️ Opisz problem z samochodem. Postaram się pomóc.",
+        "en": "✍️ Describe your car issue. I will help you diagnose it."
+    },
+    "assistant_system_prompt": {
+        "ru": (
+            "Ты — профессиональный автомобильный диагност. \n"
+            "Твоя задача — помочь пользователю определить неисправность машины по его описанию.\n"
+            "Уточняй симптомы, задавай наводящие вопросы, исключай причины.\n"
+            "Давай советы, какие элементы автомобиля проверить. Отвечай на русском языке."
+        ),
+        "pl": (
+            "Jesteś profesjonalnym diagnostą samochodowym.\n"
+            "Twoim zadaniem jest pomóc użytkownikowi zidentyfikować awarię auta na podstawie jego opisu.\n"
+            "Zadawaj pytania uzupełniające, wykluczaj możliwe przyczyny, doradzaj co sprawdzić.\n"
+            "Odpowiadaj po polsku."
+        ),
+        "en": (
+            "You are a professional car diagnostic assistant.\n"
+            "Your goal is to help the user identify the car issue based on their description.\n"
+            "Ask follow-up questions, rule out possible causes, suggest what to check.\n"
+            "Respond in English."
+        )
+    },
+    "assistant_summary_prefix": {
+        "ru": "Краткое содержание предыдущей части разговора:",
+        "pl": "Podsumowanie wcześniejszej części rozmowy:",
+        "en": "Summary of the earlier conversation:"
+    },
+    "assistant_reset": {
+        "ru": "🔁 История сброшена. Опишите новую проблему.",
+        "pl": "🔁 Historia wyczyszczona. Opisz nowy problem.",
+        "en": "🔁 History cleared. Describe the new issue."
+    },
+    "assistant_cancelled": {"ru": "⏹️ Запрос отменён.", "pl": "⏹️ Zapytanie anulowane.", "en": "⏹️ Request cancelled."},
+    "assistant_timeout": {
+        "ru": "⚠️ ИИ не ответил вовремя. Попробуйте позже.",
+        "pl": "⚠️ AI nie odpowiedziała na czas. Spróbuj później.",
+        "en": "⚠️ The AI did not answer in time. Please try again later."
+    },
+    "assistant_error": {
+        "ru": "⚠️ Ошибка при обращении к ИИ. Попробуйте позже.",
+        "pl": "⚠️ Błąd połączenia z AI. Spróbuj później.",
+        "en": "⚠️ Error contacting the AI. Please try again later."
+    }
+}
+
+
+# Каталог собирается один раз при импорте: подпись языка -> {ключ: текст},
+# недостающие переводы берутся из русского
+def _compile(messages: dict) -> dict:
+    catalog = {}
+    for code, label in LANGUAGES.items():
+        catalog[label] = {}
+        for key, translations in messages.items():
+            text = translations.get(code, translations["ru"])
+            catalog[label][key] = text
+    missing = [key for key, translations in messages.items() if set(LANGUAGES) - set(translations)]
+    logging.debug("🌍 Каталог строк: %d ключей, без перевода: %d", len(messages), len(missing))
+    return catalog
+
+CATALOG = _compile(MESSAGES)
+
+# Названия языков в таблице («Русский», «Polski») -> подпись с флагом
+SHEET_LANGS = {label.split(" ", 1)[1]: label for label in LANGUAGES.values()}
+
+
+def normalize_lang(lang: str) -> str:
+    lang = (lang or "").strip()
+    return SHEET_LANGS.get(lang, lang)
+
+
+def t(lang: str, key: str, **params) -> str:
+    text = CATALOG.get(lang, CATALOG[DEFAULT_LANG])[key]
+    return text.format(**params) if params else text
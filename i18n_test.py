@@ -0,0 +1,14 @@
+from i18n import LANGUAGES, MESSAGES, t
+
+
+# Тексты помощника-диагноста есть на всех языках
+def test_assistant_messages_are_translated():
+    keys = [key for key in MESSAGES if key.startswith("assistant_")]
+    assert keys
+    for key in keys:
+        for code, label in LANGUAGES.items():
+            assert t(label, key) == MESSAGES[key][code]
+
+
+def test_unknown_language_falls_back_to_default():
+    assert t("🇩🇪 Deutsch", "assistant_intro") == MESSAGES["assistant_intro"]["ru"]
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import span, trace
+
+MAX_ATTEMPTS = 4
+BASE_DELAY = 2.0
+
+
+# Замер этапов одного запроса: with timer.stage("reserve"): ...
+class StageTimer:
+    def __init__(self, stats=None):
+        self.timings = {}
+        self._stats = stats
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] = elapsed
+            if self._stats is not None:
+                self._stats.record_timing(name, elapsed)
+
+    def total(self) -> float:
+        return time.perf_counter() - self._started
+
+    def summary(self) -> str:
+        parts = [f"{name} {elapsed * 1000:.0f} мс" for name, elapsed in self.timings.items()]
+        return ", ".join(parts) + f" (всего {self.total() * 1000:.0f} мс)"
+
+
+# Фоновые задачи с повторами и журналом неудач (dead letters).
+# Задача сохраняется в SQLite до запуска и удаляется после успеха, поэтому
+# незавершённые задачи переживают перезапуск, а исчерпавшие попытки
+# остаются в журнале со статусом dead и текстом ошибки.
+class BackgroundJobs:
+    def __init__(self, path: str, max_attempts: int = MAX_ATTEMPTS, base_delay: float = BASE_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self._handlers = {}
+        self._on_dead = {}
+        self._tasks = set()
+        self._running = set()  # id задач, которые уже выполняются в этом процессе
+        self._timings = {}  # этап -> (количество, сумма, максимум)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " name TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " created REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._db_lock = threading.Lock()
+
+    # Обработчик задачи: async func(payload); payload должен сериализоваться в JSON.
+    # on_dead(payload) вызывается, когда задача исчерпала попытки и ушла в журнал неудач
+    def register(self, name: str, func, on_dead=None):
+        self._handlers[name] = func
+        if on_dead is not None:
+            self._on_dead[name] = on_dead
+
+    def submit(self, application, name: str, payload: dict):
+        with self._db_lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (name, payload, status, created) VALUES (?, ?, 'pending', ?)",
+                (name, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+            self._db.commit()
+        return self._start(application, cursor.lastrowid, name, payload)
+
+    def _start(self, application, job_id: int, name: str, payload: dict):
+        task = application.create_task(self._run(job_id, name, payload))
+        self._tasks.add(task)
+        self._running.add(job_id)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._running.discard(job_id))
+        return task
+
+    async def _run(self, job_id: int, name: str, payload: dict):
+        handler = self._handlers[name]
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.perf_counter()
+            try:
+                with trace(f"job {name}", detached=True):
+                    await handler(payload)
+                self.record_timing(name, time.perf_counter() - started)
+                logging.info(
+                    "⏱️ Фоновая задача %s #%d: %.0f мс (попытка %d)",
+                    name, job_id, (time.perf_counter() - started) * 1000, attempt
+                )
+                self._finish(job_id, None, attempt)
+                return
+            except Exception as e:
+                error = e
+                logging.warning("⚠️ Фоновая задача %s #%d, попытка %d: %s", name, job_id, attempt, e)
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(self.base_delay * 2 ** (attempt - 1))
+        logging.error("❌ Фоновая задача %s #%d не выполнена, в журнале неудач: %s", name, job_id, error)
+        self._finish(job_id, str(error), self.max_attempts)
+        on_dead = self._on_dead.get(name)
+        if on_dead is not None:
+            try:
+                await on_dead(payload)
+            except Exception as e:
+                logging.error("❌ Ошибка обработки неудачи задачи %s #%d: %s", name, job_id, e)
+
+    def _finish(self, job_id: int, error, attempts: int):
+        with self._db_lock:
+            if error is None:
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            else:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'dead', attempts = ?, error = ? WHERE id = ?",
+                    (attempts, error, job_id)
+                )
+            self._db.commit()
+
+    # Перезапуск задач, прерванных остановкой бота; уже выполняющиеся не трогаем,
+    # иначе одна заявка создала бы событие и уведомление дважды
+    def resume(self, application) -> int:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, name, payload FROM jobs WHERE status = 'pending' ORDER BY id"
+            ).fetchall()
+        rows = [row for row in rows if row[0] not in self._running]
+        for job_id, name, payload in rows:
+            self._start(application, job_id, name, json.loads(payload))
+        if rows:
+            logging.info("🔁 Возобновлено фоновых задач: %d", len(rows))
+        return len(rows)
+
+    # Повторить задачи из журнала неудач — запускаются только они
+    def retry_dead(self, application) -> int:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, name, payload FROM jobs WHERE status = 'dead' ORDER BY id"
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE jobs SET status = 'pending', error = NULL WHERE id = ?",
+                [(job_id,) for job_id, _, _ in rows]
+            )
+            self._db.commit()
+        for job_id, name, payload in rows:
+            self._start(application, job_id, name, json.loads(payload))
+        if rows:
+            logging.info("🔁 Повторено задач из журнала неудач: %d", len(rows))
+        return len(rows)
+
+    def dead_letters(self, limit: int = 10):
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT id, name, error, created FROM jobs WHERE status = 'dead' ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+    # Дождаться текущих задач при остановке
+    async def drain(self, timeout: float = 10.0):
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    def record_timing(self, name: str, elapsed: float):
+        count, total, maximum = self._timings.get(name, (0, 0.0, 0.0))
+        self._timings[name] = (count + 1, total + elapsed, max(maximum, elapsed))
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            dead = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'dead'").fetchone()[0]
+        return {
+            "running": len(self._tasks),
+            "dead": dead,
+            "timings": {
+                name: {"count": count, "avg": total / count, "max": maximum}
+                for name, (count, total, maximum) in self._timings.items()
+            }
+        }
@@ -0,0 +1,100 @@
+import asyncio
+
+from jobs import BackgroundJobs
+
+
+# Вместо telegram Application: задачи запускаются в текущем цикле
+class Application:
+    def create_task(self, coroutine):
+        return asyncio.get_running_loop().create_task(coroutine)
+
+
+def test_resume_skips_running_jobs(tmp_path):
+    async def scenario():
+        jobs = BackgroundJobs(str(tmp_path / "jobs.sqlite3"), base_delay=0)
+        release = asyncio.Event()
+        calls = []
+
+        async def handler(payload):
+            calls.append(payload["n"])
+            await release.wait()
+
+        jobs.register("slow", handler)
+        app = Application()
+        jobs.submit(app, "slow", {"n": 1})
+        await asyncio.sleep(0)
+        assert jobs.resume(app) == 0
+        release.set()
+        await jobs.drain()
+        return calls, jobs.stats()
+
+    calls, stats = asyncio.run(scenario())
+    assert calls == [1]
+    assert stats["running"] == 0
+
+
+def test_resume_restarts_jobs_left_by_previous_process(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def interrupted():
+        jobs = BackgroundJobs(path)
+        jobs.register("never", lambda payload: asyncio.Event().wait())
+        task = jobs.submit(Application(), "never", {"n": 1})
+        await asyncio.sleep(0)
+        task.cancel()
+
+    async def restarted():
+        jobs = BackgroundJobs(path)
+        calls = []
+
+        async def handler(payload):
+            calls.append(payload["n"])
+
+        jobs.register("never", handler)
+        resumed = jobs.resume(Application())
+        await jobs.drain()
+        return resumed, calls
+
+    asyncio.run(interrupted())
+    assert asyncio.run(restarted()) == (1, [1])
+
+
+def test_retry_dead_starts_only_dead_jobs(tmp_path):
+    async def scenario():
+        jobs = BackgroundJobs(str(tmp_path / "jobs.sqlite3"), max_attempts=2, base_delay=0)
+        release = asyncio.Event()
+        calls = []
+        dead = []
+        fail = True
+
+        async def flaky(payload):
+            calls.append(("flaky", payload["n"]))
+            if fail:
+                raise RuntimeError("calendar down")
+
+        async def slow(payload):
+            calls.append(("slow", payload["n"]))
+            await release.wait()
+
+        async def on_dead(payload):
+            dead.append(payload["n"])
+
+        jobs.register("flaky", flaky, on_dead=on_dead)
+        jobs.register("slow", slow)
+        app = Application()
+        await jobs.submit(app, "flaky", {"n": 1})
+        assert [row[1] for row in jobs.dead_letters()] == ["flaky"]
+        assert dead == [1]
+
+        jobs.submit(app, "slow", {"n": 2})
+        await asyncio.sleep(0)
+        fail = False
+        assert jobs.retry_dead(app) == 1
+        await asyncio.sleep(0.05)
+        release.set()
+        await jobs.drain()
+        return calls, jobs.stats()
+
+    calls, stats = asyncio.run(scenario())
+    assert calls == [("flaky", 1), ("flaky", 1), ("slow", 2), ("flaky", 1)]
+    assert stats["dead"] == 0
@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from i18n import LANGUAGES, t
+
+
+# Главное меню. Разметка в PTB неизменяемая, поэтому готовый объект
+# строится один раз на комбинацию (язык, подписка, админ) и переиспользуется
+@lru_cache(maxsize=None)
+def main_menu(lang: str, subscribed: bool, is_admin: bool) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(t(lang, "menu_address"), callback_data="address"),
+         InlineKeyboardButton(t(lang, "menu_booking"), callback_data="zapis")],
+        [InlineKeyboardButton(t(lang, "menu_contacts"), callback_data="contacts"),
+         InlineKeyboardButton(t(lang, "menu_unsubscribe" if subscribed else "menu_subscribe"),
+                              callback_data="subscribe")],
+        [InlineKeyboardButton(t(lang, "menu_assistant"), callback_data="assistant")],
+        [InlineKeyboardButton(t(lang, "menu_change_language"), callback_data="change_language")]
+    ]
+
+    # 👑 Кнопки администратора
+    if is_admin:
+        buttons.append([InlineKeyboardButton(t(lang, "menu_reload"), callback_data="reload_all")])
+        buttons.append([InlineKeyboardButton(t(lang, "menu_send_news"), callback_data="send_news")])
+
+    return InlineKeyboardMarkup(buttons)
+
+
+# Выбор языка
+@lru_cache(maxsize=None)
+def language_menu() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, callback_data=f"lang_{code}")]
+        for code, label in LANGUAGES.items()
+    ])
@@ -0,0 +1,118 @@
+import functools
+import logging
+import time
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, Counter, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+from telegram.request import HTTPXRequest
+
+from tracing import span, trace
+
+# Корзины для внешних вызовов: от быстрых ответов Telegram до долгих ответов OpenAI
+DEPENDENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Время выполнения обработчика обновления", ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ["handler"]
+)
+DEPENDENCY_LATENCY = Histogram(
+    "bot_dependency_seconds", "Время вызова внешнего сервиса",
+    ["dependency", "operation"], buckets=DEPENDENCY_BUCKETS
+)
+DEPENDENCY_ERRORS = Counter(
+    "bot_dependency_errors_total", "Ошибки вызовов внешнего сервиса", ["dependency", "operation"]
+)
+
+# Квоты Google Sheets: kind — read/write, priority — booking/interactive/background
+SHEETS_QUOTA_REQUESTS = Counter(
+    "bot_sheets_quota_requests_total", "Запросы к Google Sheets через планировщик квот", ["kind", "priority"]
+)
+SHEETS_QUOTA_WAIT = Histogram(
+    "bot_sheets_quota_wait_seconds", "Ожидание токена квоты Google Sheets",
+    ["kind", "priority"], buckets=DEPENDENCY_BUCKETS
+)
+SHEETS_THROTTLED = Counter(
+    "bot_sheets_throttled_total", "Ответы 429 (квота исчерпана) от Google Sheets", ["kind"]
+)
+SHEETS_COALESCED = Counter(
+    "bot_sheets_coalesced_total", "Чтения, присоединённые к уже идущему такому же запросу", ["operation"]
+)
+
+
+# Замер вызова внешнего сервиса: with track_dependency("sheets", "values_batch_get"): ...
+# Внутри обновления вызов попадает и в дерево трассировки.
+@contextmanager
+def track_dependency(dependency: str, operation: str):
+    started = time.perf_counter()
+    try:
+        with span(f"{dependency} {operation}"):
+            yield
+    except Exception:
+        DEPENDENCY_ERRORS.labels(dependency, operation).inc()
+        raise
+    finally:
+        DEPENDENCY_LATENCY.labels(dependency, operation).observe(time.perf_counter() - started)
+
+
+def observe_dependency(dependency: str, operation: str, seconds: float):
+    DEPENDENCY_LATENCY.labels(dependency, operation).observe(seconds)
+
+
+# Обёртка обработчика PTB: гистограмма времени, счётчик ошибок и трассировка обновления
+def timed(callback, name: str = None):
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            with trace(name):
+                return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+# HTTP-клиент Bot API с замером каждого метода (sendMessage, getUpdates, ...)
+class InstrumentedRequest(HTTPXRequest):
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        operation = url.rsplit("/", 1)[-1]
+        with track_dependency("telegram", operation):
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        if code >= 400:
+            DEPENDENCY_ERRORS.labels("telegram", operation).inc()
+        return code, payload
+
+
+# Метрика, значения которой вычисляются в момент сбора: func() -> [(значения меток, число)]
+class _CallbackCollector:
+    def __init__(self, name: str, documentation: str, labels, func):
+        self.name = name
+        self.documentation = documentation
+        self.labels = list(labels)
+        self.func = func
+
+    def collect(self):
+        family = GaugeMetricFamily(self.name, self.documentation, labels=self.labels)
+        try:
+            for label_values, value in self.func():
+                family.add_metric(list(label_values), value)
+        except Exception as e:
+            logging.warning("⚠️ Не удалось собрать метрику %s: %s", self.name, e)
+        yield family
+
+
+def gauge_callback(name: str, documentation: str, labels, func):
+    REGISTRY.register(_CallbackCollector(name, documentation, labels, func))
+
+
+def start_metrics_server(port: int, addr: str = "0.0.0.0"):
+    start_http_server(port, addr=addr)
+    logging.info("📈 Метрики Prometheus: http://%s:%d/metrics", addr, port)
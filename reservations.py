@@ -0,0 +1,123 @@
+import logging
+import os
+import sqlite3
+import time
+
+# Сколько держится неподтверждённая бронь (процесс мог упасть до записи в календарь)
+HOLD_SECONDS = 120
+# Сколько держится подтверждённая бронь: дальше слот занят событием в календаре,
+# а зеркала всех экземпляров бота успевают его подтянуть (CALENDAR_MIRROR_MAX_AGE)
+CONFIRMED_SECONDS = 600
+
+
+# Журнал бронирования слотов в локальном файле SQLite, общем для всех процессов бота.
+# Проверка пересечения и вставка идут в одной транзакции BEGIN IMMEDIATE:
+# SQLite пускает в неё только одного писателя, поэтому два пользователя
+# (или два экземпляра бота) не могут занять один и тот же слот.
+class ReservationLedger:
+    def __init__(self, path: str, hold_seconds: float = HOLD_SECONDS, confirmed_seconds: float = CONFIRMED_SECONDS):
+        self.hold_seconds = hold_seconds
+        self.confirmed_seconds = confirmed_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None — транзакции открываются явно
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reservations ("
+            " calendar TEXT NOT NULL,"
+            " slot_start INTEGER NOT NULL,"
+            " slot_end INTEGER NOT NULL,"
+            " owner TEXT NOT NULL,"
+            " expires REAL,"
+            " event_id TEXT,"
+            " PRIMARY KEY (calendar, slot_start))"
+        )
+        # Брони, подтверждённые бессрочно прежними версиями, доживают как подтверждённые
+        self._db.execute(
+            "UPDATE reservations SET expires = ? WHERE expires IS NULL", (time.time() + confirmed_seconds,)
+        )
+        self._writes = 0
+
+    # Меняется при каждом изменении журнала — этим процессом или другим
+    # (PRAGMA data_version растёт после чужих транзакций)
+    def version(self):
+        return self._writes, self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    # Занять слот, если он не пересекается с действующей бронью. True — слот наш.
+    def reserve(self, calendar: str, start, end, owner: str, hold_seconds: float = None) -> bool:
+        start, end = int(start.timestamp()), int(end.timestamp())
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            # Просроченные брони больше не мешают
+            self._db.execute(
+                "DELETE FROM reservations WHERE calendar = ? AND expires < ?",
+                (calendar, now)
+            )
+            taken = self._db.execute(
+                "SELECT owner FROM reservations WHERE calendar = ? AND slot_start < ? AND slot_end > ?",
+                (calendar, end, start)
+            ).fetchone()
+            if taken:
+                self._db.execute("ROLLBACK")
+                return False
+            self._db.execute(
+                "INSERT INTO reservations (calendar, slot_start, slot_end, owner, expires) VALUES (?, ?, ?, ?, ?)",
+                (calendar, start, end, owner, now + (hold_seconds or self.hold_seconds))
+            )
+            self._db.execute("COMMIT")
+            self._writes += 1
+            return True
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    # Продлить свою неподтверждённую бронь (заявка ждёт записи в календарь).
+    # False — брони уже нет: она истекла и удалена или слот подтверждён
+    def extend(self, calendar: str, start, owner: str, seconds: float) -> bool:
+        cursor = self._db.execute(
+            "UPDATE reservations SET expires = ?"
+            " WHERE calendar = ? AND slot_start = ? AND owner = ? AND event_id IS NULL AND expires >= ?",
+            (time.time() + seconds, calendar, int(start.timestamp()), owner, time.time())
+        )
+        self._writes += 1
+        return cursor.rowcount > 0
+
+    # Событие создано — бронь доживает, пока зеркала календаря не увидят событие,
+    # иначе отменённая в календаре запись держала бы слот занятым до самого визита
+    def confirm(self, calendar: str, start, event_id: str = None):
+        self._db.execute(
+            "UPDATE reservations SET expires = ?, event_id = ? WHERE calendar = ? AND slot_start = ?",
+            (time.time() + self.confirmed_seconds, event_id, calendar, int(start.timestamp()))
+        )
+        self._writes += 1
+
+    def release(self, calendar: str, start, owner: str):
+        self._db.execute(
+            "DELETE FROM reservations WHERE calendar = ? AND slot_start = ? AND owner = ?",
+            (calendar, int(start.timestamp()), owner)
+        )
+        self._writes += 1
+
+    # Действующие брони в диапазоне (epoch-секунды) — как занятые интервалы календаря
+    def reserved_intervals(self, calendar: str, time_min, time_max):
+        rows = self._db.execute(
+            "SELECT slot_start, slot_end FROM reservations"
+            " WHERE calendar = ? AND slot_start < ? AND slot_end > ?"
+            " AND expires >= ?",
+            (calendar, time_max.timestamp(), time_min.timestamp(), time.time())
+        ).fetchall()
+        return [(float(start), float(end)) for start, end in rows]
+
+    # Удалить прошедшие и истёкшие брони
+    def purge(self, before=None) -> int:
+        before = before or time.time()
+        cursor = self._db.execute(
+            "DELETE FROM reservations WHERE slot_end < ? OR expires < ?", (before, time.time())
+        )
+        if cursor.rowcount:
+            self._writes += 1
+            logging.info("🧹 Удалено прошедших и истёкших броней: %d", cursor.rowcount)
+        return cursor.rowcount
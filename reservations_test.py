@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from reservations import ReservationLedger
+
+SLOT = pytz.timezone("Europe/Warsaw").localize(datetime(2026, 5, 4, 9, 0))
+SLOT_END = SLOT + timedelta(minutes=30)
+
+
+def ledger(tmp_path, **kwargs):
+    return ReservationLedger(str(tmp_path / "reservations.sqlite3"), **kwargs)
+
+
+def test_second_owner_cannot_take_held_slot(tmp_path):
+    reservations = ledger(tmp_path)
+    assert reservations.reserve("bay", SLOT, SLOT_END, "1")
+    assert not reservations.reserve("bay", SLOT + timedelta(minutes=15), SLOT_END, "2")
+    assert reservations.reserve("other-bay", SLOT, SLOT_END, "2")
+
+
+# Заявка ждёт фоновую запись в календарь дольше обычной брони
+def test_extended_hold_outlives_default_hold(tmp_path, monkeypatch):
+    reservations = ledger(tmp_path, hold_seconds=60)
+    now = 1_000_000.0
+    monkeypatch.setattr("reservations.time.time", lambda: now)
+    reservations.reserve("bay", SLOT, SLOT_END, "1")
+    assert reservations.extend("bay", SLOT, "1", 3600)
+    now += 600
+    assert not reservations.reserve("bay", SLOT, SLOT_END, "2")
+    assert reservations.reserved_intervals("bay", SLOT, SLOT_END) == [(SLOT.timestamp(), SLOT_END.timestamp())]
+
+
+def test_extend_fails_for_expired_or_foreign_hold(tmp_path, monkeypatch):
+    reservations = ledger(tmp_path, hold_seconds=60)
+    now = 1_000_000.0
+    monkeypatch.setattr("reservations.time.time", lambda: now)
+    reservations.reserve("bay", SLOT, SLOT_END, "1")
+    assert not reservations.extend("bay", SLOT, "2", 3600)
+    now += 120
+    assert not reservations.extend("bay", SLOT, "1", 3600)
+    assert reservations.reserve("bay", SLOT, SLOT_END, "2")
+
+
+# Неудавшаяся заявка снимает только свою бронь
+def test_release_frees_only_own_hold(tmp_path):
+    reservations = ledger(tmp_path)
+    reservations.reserve("bay", SLOT, SLOT_END, "1")
+    reservations.release("bay", SLOT, "2")
+    assert not reservations.reserve("bay", SLOT, SLOT_END, "2")
+    reservations.release("bay", SLOT, "1")
+    assert reservations.reserve("bay", SLOT, SLOT_END, "2")
+
+
+# Подтверждённая бронь держит слот, пока зеркало календаря не увидит событие, и не дольше
+def test_confirmed_hold_expires_after_mirror_catches_up(tmp_path, monkeypatch):
+    reservations = ledger(tmp_path, hold_seconds=60, confirmed_seconds=600)
+    now = 1_000_000.0
+    monkeypatch.setattr("reservations.time.time", lambda: now)
+    reservations.reserve("bay", SLOT, SLOT_END, "1")
+    reservations.confirm("bay", SLOT, "event-1")
+    now += 300
+    assert reservations.reserved_intervals("bay", SLOT, SLOT_END)
+    assert not reservations.extend("bay", SLOT, "1", 3600)
+    now += 600
+    assert reservations.reserved_intervals("bay", SLOT, SLOT_END) == []
+    assert reservations.purge(before=now) == 1
+
+
+def test_rows_confirmed_without_expiry_get_one(tmp_path, monkeypatch):
+    path = str(tmp_path / "reservations.sqlite3")
+    reservations = ReservationLedger(path)
+    reservations.reserve("bay", SLOT, SLOT_END, "1")
+    reservations._db.execute("UPDATE reservations SET expires = NULL")
+    now = 1_000_000.0
+    monkeypatch.setattr("reservations.time.time", lambda: now)
+    reopened = ReservationLedger(path, confirmed_seconds=600)
+    assert reopened.reserved_intervals("bay", SLOT, SLOT_END)
+    now += 601
+    assert reopened.reserve("bay", SLOT, SLOT_END, "2")
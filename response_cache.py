@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+
+from i18n import LANGUAGES
+
+# Стоп-слова, которые не меняют смысл жалобы
+STOP_WORDS = {
+    "ru": {"и", "в", "во", "на", "с", "со", "у", "а", "но", "что", "как", "же", "ли", "бы", "по",
+           "к", "о", "об", "от", "до", "за", "из", "для", "то", "это", "мой", "моя", "моей", "моего",
+           "меня", "мне", "я", "при", "очень", "просто", "когда", "уже", "здравствуйте", "привет",
+           "подскажите", "пожалуйста", "машина", "машины", "машине", "авто", "автомобиль"},
+    "pl": {"i", "w", "we", "na", "z", "ze", "a", "ale", "że", "jak", "czy", "po", "do", "od", "o",
+           "dla", "to", "mój", "moja", "mojego", "mi", "mnie", "ja", "przy", "bardzo", "kiedy", "już",
+           "się", "dzień", "dobry", "witam", "proszę", "samochód", "samochodu", "auto", "auta"},
+    "en": {"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "of", "for", "with", "is",
+           "are", "was", "my", "me", "i", "it", "its", "when", "very", "just", "already", "hello",
+           "hi", "please", "car", "vehicle", "have", "has", "there", "this", "that"}
+}
+
+# Подпись языка из сессии -> код
+LANG_CODES = {label: code for code, label in LANGUAGES.items()}
+
+
+def normalize_question(text: str, lang: str) -> str:
+    words = re.sub(r"[^\w\s]", " ", text.lower()).split()
+    stop_words = STOP_WORDS.get(LANG_CODES.get(lang, "ru"), set())
+    return " ".join(word for word in words if word not in stop_words)
+
+# Версия системного промпта: при его изменении старые ответы не используются
+def prompt_version(system_prompt: str) -> str:
+    return hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()[:8]
+
+
+# Кэш ответов ассистента на первый вопрос: LRU + TTL в памяти,
+# по желанию — копия в SQLite, переживающая перезапуск
+class ResponseCache:
+    def __init__(self, max_entries: int = 500, ttl: float = 7 * 86400, path: str = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, question, reply)
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " question TEXT NOT NULL,"
+                " reply TEXT NOT NULL,"
+                " expires REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+            self._db.commit()
+
+    @staticmethod
+    def make_key(question: str, lang: str, system_prompt: str):
+        normalized = normalize_question(question, lang)
+        raw = json.dumps([lang, prompt_version(system_prompt), normalized], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest(), normalized
+
+    def get(self, question: str, lang: str, system_prompt: str):
+        key, _ = self.make_key(question, lang, system_prompt)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is None and self._db:
+            row = self._db.execute(
+                "SELECT expires, question, reply FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                entry = tuple(row)
+                self._entries[key] = entry
+
+        if entry is None or entry[0] < now:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, question: str, lang: str, system_prompt: str, reply: str):
+        key, normalized = self.make_key(question, lang, system_prompt)
+        if not normalized:
+            return
+        entry = (time.time() + self.ttl, normalized, reply)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, question, reply, expires) VALUES (?, ?, ?, ?)",
+                (key, normalized, reply, entry[0])
+            )
+            self._db.commit()
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self._db:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    # Сброс всего кэша или записей, где вопрос содержит подстроку
+    def invalidate(self, contains: str = None) -> int:
+        if not contains:
+            removed = len(self._entries)
+            self._entries.clear()
+            if self._db:
+                removed = max(removed, self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0])
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+            logging.info("🧹 Кэш ответов очищен: %d", removed)
+            return removed
+
+        needle = contains.lower()
+        keys = {key for key, (_, question, _) in self._entries.items() if needle in question}
+        if self._db:
+            rows = self._db.execute("SELECT key, question FROM responses").fetchall()
+            keys.update(key for key, question in rows if needle in question)
+        for key in keys:
+            self._remove(key)
+        logging.info("🧹 Из кэша ответов удалено: %d (\"%s\")", len(keys), contains)
+        return len(keys)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 2) if total else 0.0
+        }
@@ -0,0 +1,30 @@
+# Разбор листа «Услуги»
+def test_parse_services_reads_names_per_language(bot):
+    rows = [
+        ["Код", "Минуты", "Русский", "Polski"],
+        ["oil", "45", "Замена масла", "Wymiana oleju"],
+    ]
+    services = bot.parse_services(rows)
+    assert services == {"oil": {"minutes": 45, "names": {
+        bot.LANGUAGES["ru"]: "Замена масла", bot.LANGUAGES["pl"]: "Wymiana oleju"
+    }}}
+
+
+def test_parse_services_replaces_bad_minutes_with_default(bot):
+    default = bot.SLOT_DURATION.seconds // 60
+    rows = [
+        ["Код", "Минуты", "RU"],
+        ["zero", "0", "Ноль"],
+        ["negative", "-30", "Минус"],
+        ["fraction", "1.5", "Дробь"],
+        ["text", "час", "Текст"],
+    ]
+    services = bot.parse_services(rows)
+    assert {key: service["minutes"] for key, service in services.items()} == {
+        "zero": default, "negative": default, "fraction": default, "text": default
+    }
+
+
+def test_parse_services_skips_long_codes(bot):
+    rows = [["Код", "Минуты"], ["x" * 80, "30"], ["ok", "30"]]
+    assert list(bot.parse_services(rows)) == ["ok"]
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from sheets_quota import BACKGROUND, sheets_priority
+
+
+# Локальная копия листов таблицы в SQLite.
+#
+# Чтение (get_all_values) всегда идёт из SQLite. Фоновая задача раз в
+# pull_interval забирает все листы одним batch_get и заменяет локальную копию.
+# Запись (append_row/append_rows/delete_rows) сначала уходит в таблицу и только
+# после успешного ответа применяется локально.
+#
+# Правило конфликтов: таблица главнее — ручные правки в ней перезаписывают
+# локальную копию при следующем pull. Блокировка держится только на время
+# изменения SQLite, а не на время запроса к Google (с ожиданием токена квоты),
+# иначе фоновая запись или pull задерживали бы запись заявки с высшим приоритетом.
+# Чтобы pull не «потерял» только что записанную строку, лист, в который
+# писали, пока pull читал таблицу, остаётся в прежнем виде до следующего pull.
+# Интерфейс совпадает с AsyncSheets, так что зеркало подставляется вместо него.
+#
+# Необязательные листы (optional_tabs) может не быть в таблице: batch_get с
+# несуществующим листом падает целиком, поэтому в запрос попадают только листы,
+# найденные в метаданных таблицы, а отсутствующий лист читается как пустой.
+class SheetMirror:
+    def __init__(self, sheets, path: str, tabs, pull_interval: float = 60.0, optional_tabs=()):
+        self._sheets = sheets
+        self.tabs = list(tabs)
+        self.optional_tabs = list(optional_tabs)
+        self._present = set()  # необязательные листы, которые есть в таблице
+        self.pull_interval = pull_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sheet_rows ("
+            " tab TEXT NOT NULL,"
+            " row_number INTEGER NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (tab, row_number));"
+            "CREATE TABLE IF NOT EXISTS sheet_tabs ("
+            " tab TEXT PRIMARY KEY,"
+            " pulled REAL NOT NULL);"
+        )
+        self._db.commit()
+        self._lock = asyncio.Lock()  # только на изменение SQLite
+        self._initial_lock = asyncio.Lock()
+        self._writing = {}  # лист -> записей, ещё не применённых локально
+        self._write_generation = {}  # лист -> счётчик начала и окончания записей
+
+    # === Чтение из SQLite ===
+    def has_snapshot(self, tab: str) -> bool:
+        return self._db.execute("SELECT 1 FROM sheet_tabs WHERE tab = ?", (tab,)).fetchone() is not None
+
+    def last_pull(self):
+        row = self._db.execute("SELECT MIN(pulled) FROM sheet_tabs").fetchone()
+        return row[0] if row else None
+
+    def _rows(self, tab: str):
+        cursor = self._db.execute(
+            "SELECT data FROM sheet_rows WHERE tab = ? ORDER BY row_number", (tab,)
+        )
+        return [json.loads(data) for data, in cursor.fetchall()]
+
+    async def get_all_values(self, tab: str):
+        if not self.has_snapshot(tab):
+            # Первый запуск без локальной копии — один раз читаем таблицу
+            async with self._initial_lock:
+                if not self.has_snapshot(tab):
+                    await self.pull()
+        return self._rows(tab)
+
+    # === Синхронизация с таблицей ===
+    async def pull(self):
+        generations = dict(self._write_generation)
+        optional = await self._optional_tabs()
+        try:
+            response = await self._sheets.batch_get([f"'{tab}'" for tab in self.tabs + optional])
+        except Exception:
+            if not optional:
+                raise
+            # Необязательный лист могли удалить — перепроверяем список листов
+            self._present.clear()
+            optional = await self._optional_tabs()
+            response = await self._sheets.batch_get([f"'{tab}'" for tab in self.tabs + optional])
+        tabs = self.tabs + optional
+        value_ranges = response.get("valueRanges", [])
+        values_by_tab = {tab: value_range.get("values", []) for tab, value_range in zip(tabs, value_ranges)}
+        pulled = time.time()
+        async with self._lock:
+            # Запись шла во время чтения — ответ мог её не увидеть
+            busy = [tab for tab in tabs if self._writing.get(tab)
+                    or self._write_generation.get(tab, 0) != generations.get(tab, 0)]
+            if busy:
+                logging.info("ℹ️ Листы менялись во время обновления, обновим позже: %s", ", ".join(busy))
+            with self._db:
+                for tab in tabs + [tab for tab in self.optional_tabs if tab not in optional]:
+                    if tab in busy:
+                        continue
+                    self._db.execute("DELETE FROM sheet_rows WHERE tab = ?", (tab,))
+                    self._db.executemany(
+                        "INSERT INTO sheet_rows (tab, row_number, data) VALUES (?, ?, ?)",
+                        [(tab, number, json.dumps(row, ensure_ascii=False))
+                         for number, row in enumerate(values_by_tab.get(tab, []), start=1)]
+                    )
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO sheet_tabs (tab, pulled) VALUES (?, ?)", (tab, pulled)
+                    )
+        logging.info("🔄 Локальная копия таблицы обновлена (%d листов)", len(tabs))
+
+    # Необязательные листы, которые есть в таблице. Пока какого-то нет,
+    # метаданные перечитываются при каждом pull — лист могут добавить позже.
+    async def _optional_tabs(self):
+        if set(self.optional_tabs) - self._present:
+            titles = set(await self._sheets.worksheet_titles())
+            missing = [tab for tab in self.optional_tabs if tab not in titles]
+            if missing:
+                logging.info("ℹ️ В таблице нет необязательных листов: %s", ", ".join(missing))
+            self._present = {tab for tab in self.optional_tabs if tab in titles}
+        return [tab for tab in self.optional_tabs if tab in self._present]
+
+    # Плановое обновление уступает квоту запросам пользователей
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.pull_interval)
+            try:
+                with sheets_priority(BACKGROUND):
+                    await self.pull()
+            except Exception as e:
+                logging.warning("⚠️ Не удалось обновить локальную копию таблицы: %s", e)
+
+    # === Запись: сначала в таблицу, затем локально ===
+    def _append_local(self, tab: str, rows):
+        last = self._db.execute(
+            "SELECT COALESCE(MAX(row_number), 0) FROM sheet_rows WHERE tab = ?", (tab,)
+        ).fetchone()[0]
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO sheet_rows (tab, row_number, data) VALUES (?, ?, ?)",
+                [(tab, last + offset, json.dumps(row, ensure_ascii=False))
+                 for offset, row in enumerate(rows, start=1)]
+            )
+
+    def _delete_local(self, tab: str, index: int):
+        with self._db:
+            self._db.execute("DELETE FROM sheet_rows WHERE tab = ? AND row_number = ?", (tab, index))
+            # Сдвиг в два шага через отрицательные номера, чтобы не нарушить ключ
+            self._db.execute(
+                "UPDATE sheet_rows SET row_number = -(row_number - 1) WHERE tab = ? AND row_number > ?",
+                (tab, index)
+            )
+            self._db.execute(
+                "UPDATE sheet_rows SET row_number = -row_number WHERE tab = ? AND row_number < 0", (tab,)
+            )
+
+    async def append_row(self, tab: str, row: list):
+        return await self.append_rows(tab, [row])
+
+    def _write_started(self, tab: str):
+        self._writing[tab] = self._writing.get(tab, 0) + 1
+        self._write_generation[tab] = self._write_generation.get(tab, 0) + 1
+
+    def _write_finished(self, tab: str):
+        self._writing[tab] -= 1
+        self._write_generation[tab] += 1
+
+    async def append_rows(self, tab: str, rows: list):
+        self._write_started(tab)
+        try:
+            response = await self._sheets.append_rows(tab, rows)
+            if tab in self.tabs:
+                async with self._lock:
+                    self._append_local(tab, rows)
+            return response
+        finally:
+            self._write_finished(tab)
+
+    async def delete_rows(self, tab: str, index: int):
+        self._write_started(tab)
+        try:
+            response = await self._sheets.delete_rows(tab, index)
+            if tab in self.tabs:
+                async with self._lock:
+                    self._delete_local(tab, index)
+            return response
+        finally:
+            self._write_finished(tab)
+
+    # Остальные вызовы — напрямую в таблицу
+    async def call(self, tab: str, method: str, *args, **kwargs):
+        return await self._sheets.call(tab, method, *args, **kwargs)
+
+    # Столбец читается из самой таблицы: журнал записи сверяется с ней, а не с копией
+    async def col_values(self, tab: str, col: int):
+        return await self._sheets.col_values(tab, col)
+
+    async def run(self, func, *args, **kwargs):
+        return await self._sheets.run(func, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return self._sheets.stats()
@@ -0,0 +1,114 @@
+import asyncio
+
+from fake_services import FakeSpreadsheet
+from sheet_mirror import SheetMirror
+from sheets_async import AsyncSheets
+from sheets_quota import BACKGROUND, BOOKING, QuotaScheduler
+
+
+def make_mirror(tmp_path, spreadsheet):
+    sheets = AsyncSheets(lambda: spreadsheet, max_workers=1, timeout=5)
+    return SheetMirror(sheets, str(tmp_path / "sheets.sqlite3"), tabs=["Заявки", "Контакты"], optional_tabs=["Услуги"])
+
+
+def test_missing_optional_tab_reads_as_empty(tmp_path):
+    spreadsheet = FakeSpreadsheet({"Заявки": [["ID"], ["1"]], "Контакты": [["key", "value"]]})
+    mirror = make_mirror(tmp_path, spreadsheet)
+
+    async def scenario():
+        await mirror.pull()
+        return await mirror.get_all_values("Заявки"), await mirror.get_all_values("Услуги")
+
+    bookings, services = asyncio.run(scenario())
+    assert bookings == [["ID"], ["1"]]
+    assert services == []
+
+
+def test_optional_tab_added_later_is_picked_up(tmp_path):
+    spreadsheet = FakeSpreadsheet({"Заявки": [["ID"]], "Контакты": []})
+    mirror = make_mirror(tmp_path, spreadsheet)
+
+    async def scenario():
+        await mirror.pull()
+        spreadsheet.tabs["Услуги"] = FakeSpreadsheet({"Услуги": [["key", "minutes"], ["oil", "60"]]}).tabs["Услуги"]
+        await mirror.pull()
+        return await mirror.get_all_values("Услуги")
+
+    assert asyncio.run(scenario()) == [["key", "minutes"], ["oil", "60"]]
+
+
+def test_deleted_optional_tab_does_not_break_pull(tmp_path):
+    spreadsheet = FakeSpreadsheet({"Заявки": [["ID"]], "Контакты": [], "Услуги": [["key", "minutes"]]})
+    mirror = make_mirror(tmp_path, spreadsheet)
+
+    async def scenario():
+        await mirror.pull()
+        del spreadsheet.tabs["Услуги"]
+        await mirror.pull()
+        return await mirror.get_all_values("Заявки"), await mirror.get_all_values("Услуги")
+
+    assert asyncio.run(scenario()) == ([["ID"]], [])
+
+
+# Фоновая запись, ждущая токен квоты, не держит копию: заявка уходит раньше неё
+def test_background_write_waiting_for_quota_does_not_block_booking(tmp_path):
+    spreadsheet = FakeSpreadsheet({"Заявки": [["ID"]], "Контакты": [], "Диалоги": []})
+    sheets = AsyncSheets(
+        lambda: spreadsheet, max_workers=2, timeout=5,
+        scheduler=QuotaScheduler(writes_per_minute=600, burst=1),
+        tab_priorities={"Заявки": BOOKING, "Диалоги": BACKGROUND}
+    )
+    mirror = SheetMirror(sheets, str(tmp_path / "sheets.sqlite3"), tabs=["Заявки", "Контакты", "Диалоги"])
+    finished = []
+
+    async def append(tab, row):
+        await mirror.append_row(tab, row)
+        finished.append(tab)
+
+    async def scenario():
+        await mirror.pull()
+        await mirror.append_row("Контакты", ["phone", "1"])  # токен записи израсходован
+        dialog = asyncio.ensure_future(append("Диалоги", ["42", "вопрос"]))
+        await asyncio.sleep(0)
+        await asyncio.gather(dialog, append("Заявки", ["1"]))
+        return await mirror.get_all_values("Заявки")
+
+    assert asyncio.run(scenario()) == [["ID"], ["1"]]
+    assert finished == ["Заявки", "Диалоги"]
+
+
+# Ответ batch_get задерживается, пока тест не отпустит его: запись успевает пройти
+class HeldPull:
+    def __init__(self, sheets):
+        self._sheets = sheets
+        self.release = asyncio.Event()
+
+    async def batch_get(self, ranges):
+        response = await self._sheets.batch_get(ranges)
+        await self.release.wait()
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._sheets, name)
+
+
+# Строка, записанная, пока pull читал таблицу, не пропадает из копии
+def test_pull_keeps_rows_written_while_reading(tmp_path):
+    spreadsheet = FakeSpreadsheet({"Заявки": [["ID"]], "Контакты": []})
+    sheets = HeldPull(AsyncSheets(lambda: spreadsheet, max_workers=2, timeout=5))
+    mirror = SheetMirror(sheets, str(tmp_path / "sheets.sqlite3"), tabs=["Заявки", "Контакты"])
+
+    async def scenario():
+        sheets.release.set()
+        await mirror.pull()
+        sheets.release.clear()
+        pull = asyncio.ensure_future(mirror.pull())
+        await asyncio.sleep(0.05)
+        await mirror.append_row("Заявки", ["1"])
+        sheets.release.set()
+        await pull
+        after_pull = await mirror.get_all_values("Заявки")
+        await mirror.pull()
+        return after_pull, await mirror.get_all_values("Заявки")
+
+    assert asyncio.run(scenario()) == ([["ID"], ["1"]], [["ID"], ["1"]])
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import SHEETS_COALESCED, track_dependency
+from sheets_quota import INTERACTIVE, current_priority, is_quota_error
+
+# Методы gspread, которые расходуют квоту на запись; остальные считаются чтением
+WRITE_METHODS = {
+    "append_row", "append_rows", "delete_rows", "insert_row", "insert_rows",
+    "update", "update_cell", "update_cells", "batch_update", "clear"
+}
+# Повторы после 429 и пауза перед первым из них
+QUOTA_RETRIES = 3
+QUOTA_BACKOFF = 5.0
+
+
+# Асинхронный фасад над gspread: все вызовы идут в ограниченный пул потоков,
+# чтобы HTTP-запросы к Google не блокировали цикл событий бота.
+# С планировщиком квот каждый запрос сначала получает токен чтения или записи
+# (по приоритету), а одинаковые одновременные чтения выполняются один раз.
+class AsyncSheets:
+    def __init__(self, open_spreadsheet, max_workers: int = 4, timeout: float = 20.0,
+                 scheduler=None, tab_priorities: dict = None):
+        # open_spreadsheet — функция, возвращающая gspread.Spreadsheet
+        self._open_spreadsheet = open_spreadsheet
+        self._spreadsheet = None
+        self._worksheets = {}
+        self.max_workers = max_workers
+        self.timeout = timeout
+        # scheduler — QuotaScheduler; tab_priorities — приоритет запросов к листу по умолчанию
+        self.scheduler = scheduler
+        self.tab_priorities = tab_priorities or {}
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets")
+        self._lock = threading.Lock()
+        self._stats = {
+            "queued": 0,
+            "running": 0,
+            "max_queued": 0,
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "coalesced": 0,
+        }
+
+    # Выполнить блокирующую функцию в пуле: сначала токен квоты, после 429 — повтор.
+    # Приоритет из sheets_priority() важнее переданного.
+    async def run(self, func, *args, timeout: float = None, kind: str = "read", priority: int = None, **kwargs):
+        priority = current_priority(INTERACTIVE if priority is None else priority)
+        for attempt in range(QUOTA_RETRIES + 1):
+            if self.scheduler:
+                await self.scheduler.acquire(kind, priority)
+            try:
+                return await self._execute(func, args, kwargs, timeout)
+            except Exception as e:
+                if not self.scheduler or not is_quota_error(e) or attempt == QUOTA_RETRIES:
+                    raise
+                pause = QUOTA_BACKOFF * 2 ** attempt
+                logging.warning("⏳ Квота Google Sheets (%s) исчерпана, повтор через %.0f с", kind, pause)
+                self.scheduler.throttled(kind, pause)
+
+    async def _execute(self, func, args, kwargs, timeout):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats["queued"] += 1
+            self._stats["calls"] += 1
+            self._stats["max_queued"] = max(self._stats["max_queued"], self._stats["queued"])
+
+        def job():
+            with self._lock:
+                self._stats["queued"] -= 1
+                self._stats["running"] += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._stats["running"] -= 1
+
+        future = loop.run_in_executor(self._executor, job)
+        try:
+            with track_dependency("sheets", getattr(func, "__name__", "call")):
+                return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            # Поток продолжит работу, но обработчик больше не ждёт ответа
+            with self._lock:
+                self._stats["timeouts"] += 1
+            logging.warning("⏱️ Таймаут запроса к Google Sheets: %s", getattr(func, "__name__", func))
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+
+    # Лист открывается один раз и кэшируется
+    def _worksheet_sync(self, tab: str):
+        worksheet = self._worksheets.get(tab)
+        if worksheet is None:
+            if self._spreadsheet is None:
+                self._spreadsheet = self._open_spreadsheet()
+            worksheet = self._spreadsheet.worksheet(tab)
+            self._worksheets[tab] = worksheet
+        return worksheet
+
+    async def worksheet(self, tab: str):
+        return await self.run(self._worksheet_sync, tab)
+
+    async def call(self, tab: str, method: str, *args, **kwargs):
+        def job():
+            return getattr(self._worksheet_sync(tab), method)(*args, **kwargs)
+        job.__name__ = f"{tab}.{method}"
+        priority = self.tab_priorities.get(tab)
+        if method in WRITE_METHODS:
+            return await self.run(job, kind="write", priority=priority)
+        return await self._single_flight(
+            (tab, method, repr(args), repr(sorted(kwargs.items()))), method,
+            lambda: self.run(job, priority=priority)
+        )
+
+    # Чтение нескольких диапазонов (листов) одним запросом
+    async def batch_get(self, ranges: list):
+        def job():
+            if self._spreadsheet is None:
+                self._spreadsheet = self._open_spreadsheet()
+            return self._spreadsheet.values_batch_get(ranges)
+        job.__name__ = "values_batch_get"
+        return await self._single_flight(("values_batch_get", tuple(ranges)), "values_batch_get", lambda: self.run(job))
+
+    # Названия листов таблицы — один запрос метаданных
+    async def worksheet_titles(self):
+        def job():
+            if self._spreadsheet is None:
+                self._spreadsheet = self._open_spreadsheet()
+            return [worksheet.title for worksheet in self._spreadsheet.worksheets()]
+        job.__name__ = "worksheets"
+        return await self._single_flight(("worksheets",), "worksheets", lambda: self.run(job))
+
+    # Одинаковые чтения, пришедшие, пока первое ещё выполняется, получают его результат
+    # (один и тот же объект — вызывающие не должны его изменять)
+    async def _single_flight(self, key, operation: str, start):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(start())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            with self._lock:
+                self._stats["coalesced"] += 1
+            SHEETS_COALESCED.labels(operation).inc()
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # ошибку получают ожидающие; здесь — только пометка, что она прочитана
+
+    async def get_all_values(self, tab: str):
+        return await self.call(tab, "get_all_values")
+
+    async def col_values(self, tab: str, col: int):
+        return await self.call(tab, "col_values", col)
+
+    async def append_row(self, tab: str, row: list):
+        return await self.call(tab, "append_row", row)
+
+    async def append_rows(self, tab: str, rows: list):
+        return await self.call(tab, "append_rows", rows)
+
+    async def delete_rows(self, tab: str, index: int):
+        return await self.call(tab, "delete_rows", index)
+
+    # Метрики пула: глубина очереди, загрузка и квоты
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["max_workers"] = self.max_workers
+        stats["saturation"] = round(stats["running"] / self.max_workers, 2)
+        if self.scheduler:
+            stats.update({f"quota_{name}": value for name, value in self.scheduler.stats().items()})
+        return stats
@@ -0,0 +1,148 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+
+from metrics import SHEETS_QUOTA_REQUESTS, SHEETS_QUOTA_WAIT, SHEETS_THROTTLED
+
+# Квоты Google Sheets API на пользователя (сервисный аккаунт): запросов в минуту
+READS_PER_MINUTE = 60
+WRITES_PER_MINUTE = 60
+
+# Классы приоритета: меньше — раньше
+BOOKING, INTERACTIVE, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {BOOKING: "booking", INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority = contextvars.ContextVar("sheets_priority", default=None)
+
+
+# Приоритет всех запросов к таблице внутри блока (рассылка, фоновая синхронизация):
+# with sheets_priority(BACKGROUND): await subscriber_index.unsubscribe(...)
+@contextmanager
+def sheets_priority(priority: int):
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default: int = INTERACTIVE) -> int:
+    priority = _priority.get()
+    return default if priority is None else priority
+
+
+def is_quota_error(error) -> bool:
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status == 429 or getattr(error, "code", None) == 429
+
+
+# Ведро токенов: rate в минуту, запас burst. Квота Google считается по минутам,
+# поэтому запас меньше минутного лимита — иначе два всплеска на стыке минут превысят её.
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: int = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1, int(per_minute) // 4)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    # Через сколько секунд появится токен
+    def delay(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    # После 429 — ни одного запроса ближайшие seconds секунд
+    def drain(self, seconds: float):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return max(self.tokens, 0.0)
+
+
+# Планировщик запросов к таблице: отдельные вёдра на чтение и запись,
+# ожидающие получают токены строго по приоритету, а внутри класса — по очереди
+class QuotaScheduler:
+    def __init__(self, reads_per_minute: float = READS_PER_MINUTE, writes_per_minute: float = WRITES_PER_MINUTE,
+                 burst: int = None):
+        self.buckets = {
+            "read": TokenBucket(reads_per_minute, burst),
+            "write": TokenBucket(writes_per_minute, burst),
+        }
+        self._waiting = {kind: [] for kind in self.buckets}
+        self._timers = {}
+        self._order = itertools.count()
+        self._stats = {"requests": 0, "delayed": 0, "throttled": 0}
+
+    async def acquire(self, kind: str, priority: int):
+        bucket = self.buckets[kind]
+        queue = self._waiting[kind]
+        labels = (kind, PRIORITY_NAMES.get(priority, str(priority)))
+        SHEETS_QUOTA_REQUESTS.labels(*labels).inc()
+        self._stats["requests"] += 1
+        if not queue and bucket.take():
+            SHEETS_QUOTA_WAIT.labels(*labels).observe(0)
+            return
+
+        self._stats["delayed"] += 1
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue, (priority, next(self._order), future))
+        self._schedule(kind)
+        await future
+        SHEETS_QUOTA_WAIT.labels(*labels).observe(time.monotonic() - started)
+
+    def _dispatch(self, kind: str):
+        self._timers.pop(kind, None)
+        bucket = self.buckets[kind]
+        queue = self._waiting[kind]
+        while queue:
+            if queue[0][2].done():
+                # Ожидавший запрос отменён
+                heapq.heappop(queue)
+                continue
+            if not bucket.take():
+                break
+            heapq.heappop(queue)[2].set_result(None)
+        self._schedule(kind)
+
+    def _schedule(self, kind: str):
+        if kind in self._timers or not self._waiting[kind]:
+            return
+        delay = self.buckets[kind].delay()
+        self._timers[kind] = asyncio.get_running_loop().call_later(delay, self._dispatch, kind)
+
+    # Google ответил 429: квота уже исчерпана, ждём без запросов
+    def throttled(self, kind: str, seconds: float):
+        self._stats["throttled"] += 1
+        SHEETS_THROTTLED.labels(kind).inc()
+        self.buckets[kind].drain(seconds)
+        timer = self._timers.pop(kind, None)
+        if timer:
+            timer.cancel()
+        if self._waiting[kind]:
+            self._schedule(kind)
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        for kind, bucket in self.buckets.items():
+            stats[f"{kind}_tokens"] = round(bucket.available, 2)
+            stats[f"{kind}_waiting"] = sum(1 for _, _, future in self._waiting[kind] if not future.done())
+        return stats
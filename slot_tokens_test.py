@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import pytz
+from telegram import CallbackQuery, Update, User
+
+import keyboards
+
+
+def callback_update(data: str) -> Update:
+    user = User(id=42, first_name="Test", is_bot=False)
+    return Update(update_id=1, callback_query=CallbackQuery(id="1", from_user=user, chat_instance="1", data=data))
+
+
+def slot_select_handler(bot, data: str):
+    for handler in bot.conv_handler.states[bot.SLOT_SELECT]:
+        if handler.check_update(callback_update(data)):
+            return handler
+    return None
+
+
+def menu_callbacks(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+# Токен переживает кодирование с точностью до минуты
+def test_moment_round_trip(bot):
+    moment = pytz.timezone("Europe/Warsaw").localize(datetime(2026, 3, 29, 3, 30))
+    action, decoded = bot.parse_slot_token(bot.slot_token("s", moment))
+    assert action == "s"
+    assert decoded == moment
+
+
+# Токены укладываются в лимит Telegram на callback_data
+def test_tokens_fit_callback_data(bot):
+    moment = pytz.timezone("Europe/Warsaw").localize(datetime(2099, 12, 31, 23, 59))
+    for action in "snbd":
+        assert len(bot.slot_token(action, moment).encode()) <= 64
+
+
+# Каждый токен попадает в свой обработчик состояния SLOT_SELECT
+def test_tokens_route_to_their_handlers(bot):
+    moment = pytz.timezone("Europe/Warsaw").localize(datetime(2026, 5, 4, 9, 0))
+    expected = {"s": "slot_selected", "n": "slot_page_selected", "b": "slot_page_selected", "d": "day_picker"}
+    for action, name in expected.items():
+        handler = slot_select_handler(bot, bot.slot_token(action, moment))
+        assert handler is not None
+        assert handler.callback.__name__ == name
+    # Кнопки сообщений, отправленных до токенов
+    assert slot_select_handler(bot, moment.isoformat()).callback.__name__ == "slot_selected"
+
+
+# Кнопки меню не перехватываются обработчиками слотов
+def test_menu_callbacks_bypass_slot_handlers(bot):
+    callbacks = set(menu_callbacks(keyboards.main_menu("ru", subscribed=False, is_admin=True)))
+    callbacks |= set(menu_callbacks(keyboards.main_menu("ru", subscribed=True, is_admin=True)))
+    callbacks |= set(menu_callbacks(keyboards.language_menu()))
+    callbacks.add("back_to_menu")
+    assert "subscribe" in callbacks
+    for data in sorted(callbacks):
+        assert slot_select_handler(bot, data) is None, data
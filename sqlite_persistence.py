@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+# Пауза перед записью: все изменения за цикл сохранения пишутся одной транзакцией
+WRITE_DELAY = 0.5
+
+
+# Хранение user_data, chat_data, bot_data и состояний диалогов в SQLite.
+# Изменения копятся в памяти и сбрасываются пачкой, а не на каждое обновление.
+class SQLitePersistence(BasePersistence):
+    def __init__(self, path: str, update_interval: float = 30):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS bot_data (id INTEGER PRIMARY KEY, data TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " name TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " PRIMARY KEY (name, key));"
+        )
+        self._db.commit()
+
+        self.user_data = None
+        self.chat_data = None
+        self.bot_data = None
+        self.conversations = {}
+        # Грязные ключи: (таблица, id) -> данные или None (удалить)
+        self._dirty = {}
+        self._dirty_conversations = {}
+        self._write_handle = None
+
+    # === Чтение при старте ===
+    def _load_table(self, table: str) -> dict:
+        rows = self._db.execute(f"SELECT id, data FROM {table}").fetchall()
+        return {row_id: json.loads(data) for row_id, data in rows}
+
+    async def get_user_data(self):
+        if self.user_data is None:
+            self.user_data = self._load_table("user_data")
+        return self.user_data
+
+    async def get_chat_data(self):
+        if self.chat_data is None:
+            self.chat_data = self._load_table("chat_data")
+        return self.chat_data
+
+    async def get_bot_data(self):
+        if self.bot_data is None:
+            self.bot_data = self._load_table("bot_data").get(0, {})
+        return self.bot_data
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        if name not in self.conversations:
+            rows = self._db.execute(
+                "SELECT key, state FROM conversations WHERE name = ?", (name,)
+            ).fetchall()
+            self.conversations[name] = {
+                tuple(json.loads(key)): json.loads(state) for key, state in rows
+            }
+        return self.conversations[name].copy()
+
+    # === Изменения (копятся в памяти) ===
+    def _mark(self, table: str, row_id: int, data):
+        self._dirty[(table, row_id)] = data
+        self._schedule_write()
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._mark("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._mark("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data: dict):
+        self._mark("bot_data", 0, data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name: str, key, new_state):
+        conversations = self.conversations.setdefault(name, {})
+        if conversations.get(key) == new_state:
+            return
+        if new_state is None:
+            conversations.pop(key, None)
+        else:
+            conversations[key] = new_state
+        self._dirty_conversations[(name, key)] = new_state
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int):
+        if self.user_data:
+            self.user_data.pop(user_id, None)
+        self._mark("user_data", user_id, None)
+
+    async def drop_chat_data(self, chat_id: int):
+        if self.chat_data:
+            self.chat_data.pop(chat_id, None)
+        self._mark("chat_data", chat_id, None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    # === Запись пачкой ===
+    def _schedule_write(self):
+        if self._write_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._write_handle = loop.call_later(WRITE_DELAY, self._write_dirty)
+
+    def _write_dirty(self):
+        self._write_handle = None
+        dirty, self._dirty = self._dirty, {}
+        dirty_conversations, self._dirty_conversations = self._dirty_conversations, {}
+        if not dirty and not dirty_conversations:
+            return
+        try:
+            with self._db:
+                for (table, row_id), data in dirty.items():
+                    if data is None:
+                        self._db.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+                    else:
+                        self._db.execute(
+                            f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+                            (row_id, json.dumps(data, ensure_ascii=False, default=str))
+                        )
+                for (name, key), state in dirty_conversations.items():
+                    if state is None:
+                        self._db.execute(
+                            "DELETE FROM conversations WHERE name = ? AND key = ?",
+                            (name, json.dumps(key))
+                        )
+                    else:
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                            (name, json.dumps(key), json.dumps(state))
+                        )
+            logging.debug("💾 Сохранено сессий: %d, диалогов: %d", len(dirty), len(dirty_conversations))
+        except Exception as e:
+            # Не потерять изменения: вернуть их в очередь (новые важнее старых)
+            logging.error("❌ Ошибка сохранения сессий: %s", e)
+            self._dirty = {**dirty, **self._dirty}
+            self._dirty_conversations = {**dirty_conversations, **self._dirty_conversations}
+
+    async def flush(self):
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+        self._write_dirty()
+        self._db.close()
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import re
+
+from sheets_quota import BACKGROUND, sheets_priority
+
+SUBSCRIBERS_TAB = "Подписчики"
+
+
+# Индекс подписчиков в памяти: user_id -> (язык, номер строки в листе)
+class SubscriberIndex:
+    def __init__(self, sheets, write_queue=None, reconcile_interval: int = 300):
+        # sheets — AsyncSheets, через который идут все обращения к листу;
+        # write_queue — отложенная запись новых подписчиков (если задана)
+        self._sheets = sheets
+        self._write_queue = write_queue
+        self.reconcile_interval = reconcile_interval
+        self._entries = {}
+        self._last_row = 1
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    # Полная загрузка листа (при старте и при сверке)
+    async def load(self):
+        values = await self._sheets.get_all_values(SUBSCRIBERS_TAB)
+        async with self._lock:
+            self._rebuild(values)
+        logging.info("👥 Индекс подписчиков загружен: %d", len(self._entries))
+
+    def _rebuild(self, values):
+        entries = {}
+        for row_number, row in enumerate(values[1:], start=2):
+            if row and row[0].strip():
+                lang = row[1].strip() if len(row) > 1 else ""
+                entries[row[0].strip()] = (lang, row_number)
+        # Подписки из журнала ещё не в листе — номер строки пока неизвестен
+        if self._write_queue:
+            for row in self._write_queue.pending_rows(SUBSCRIBERS_TAB):
+                if row and row[0] not in entries:
+                    entries[row[0]] = (row[1] if len(row) > 1 else "", None)
+        self._entries = entries
+        self._last_row = max(len(values), 1)
+        self._loaded = True
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    async def get(self, user_id: str):
+        await self._ensure_loaded()
+        return self._entries.get(str(user_id))
+
+    async def get_lang(self, user_id: str):
+        entry = await self.get(user_id)
+        return entry[0] if entry else None
+
+    async def is_subscribed(self, user_id: str) -> bool:
+        return await self.get(user_id) is not None
+
+    async def items(self):
+        await self._ensure_loaded()
+        return [(user_id, lang) for user_id, (lang, _) in self._entries.items()]
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Подписка: запись в лист и обновление индекса
+    async def subscribe(self, user_id: str, lang: str) -> bool:
+        user_id = str(user_id)
+        await self._ensure_loaded()
+        async with self._lock:
+            if user_id in self._entries:
+                return False
+            if self._write_queue:
+                self._write_queue.enqueue(SUBSCRIBERS_TAB, [user_id, lang])
+                self._entries[user_id] = (lang, None)
+                return True
+            response = await self._sheets.append_row(SUBSCRIBERS_TAB, [user_id, lang])
+            row_number = _row_from_append_response(response) or self._last_row + 1
+            self._entries[user_id] = (lang, row_number)
+            self._last_row = max(self._last_row, row_number)
+        return True
+
+    # Отписка: удаление строки из листа и сдвиг номеров строк ниже неё
+    async def unsubscribe(self, user_id: str) -> bool:
+        user_id = str(user_id)
+        await self._ensure_loaded()
+        async with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return False
+
+            row_number = await self._locate_row(user_id, entry[1])
+            if row_number is None:
+                self._entries.pop(user_id, None)
+                return False
+
+            await self._sheets.delete_rows(SUBSCRIBERS_TAB, row_number)
+            self._entries.pop(user_id, None)
+            for other_id, (lang, row) in self._entries.items():
+                if row is not None and row > row_number:
+                    self._entries[other_id] = (lang, row - 1)
+            self._last_row = max(self._last_row - 1, 1)
+        return True
+
+    # Проверяем, что строка не съехала после ручного редактирования листа
+    async def _locate_row(self, user_id: str, row_number: int):
+        if row_number is None:
+            # Подписка ещё в журнале — сначала дописываем её в лист
+            await self._write_queue.flush(SUBSCRIBERS_TAB)
+        else:
+            cell = await self._sheets.call(SUBSCRIBERS_TAB, "cell", row_number, 1)
+            if cell.value == user_id:
+                return row_number
+            logging.warning("⚠️ Строка подписчика %s сместилась, ищем заново", user_id)
+        cell = await self._sheets.call(SUBSCRIBERS_TAB, "find", user_id, in_column=1)
+        return cell.row if cell else None
+
+    # Фоновая сверка с листом — подхватывает ручные правки
+    async def reconcile_forever(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                with sheets_priority(BACKGROUND):
+                    await self.load()
+            except Exception as e:
+                logging.warning("⚠️ Ошибка при сверке индекса подписчиков: %s", e)
+
+
+def _row_from_append_response(response):
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (TypeError, KeyError):
+        return None
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
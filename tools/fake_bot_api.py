@@ -0,0 +1,238 @@
+# Локальная имитация Telegram Bot API для проверки бота без сети.
+#
+# Сервер отвечает на вызовы бота (getMe, setWebhook, sendMessage, ...), а генератор
+# присылает ему обновления: в режиме webhook — POST-запросами на адрес бота с
+# секретным заголовком, в режиме polling — через getUpdates. Для каждого обновления
+# измеряется время до первого ответа бота в этот чат.
+#
+# Пример (webhook):
+#   TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8443 \
+#   WEBHOOK_SECRET=local-secret python bot.py
+#   python tools/fake_bot_api.py --mode webhook --secret local-secret --updates 200 --rate 100
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import statistics
+import time
+
+import httpx
+import tornado.web
+
+BOT_USER = {
+    "id": 100000001,
+    "is_bot": True,
+    "first_name": "Fake Bot",
+    "username": "fake_service_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False
+}
+
+# Методы, которые возвращают отправленное сообщение
+MESSAGE_METHODS = {"sendmessage", "editmessagetext", "sendlocation", "editmessagereplymarkup", "sendphoto"}
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.updates = []
+        self.webhook = None
+        self.calls = {}
+        self._new_update = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        # chat_id -> время отправки обновления, ещё не получившего ответа
+        self._waiting = {}
+        self.latencies = []
+        # chat_id -> Future с параметрами первого ответа бота (для сценариев)
+        self._expected = {}
+
+    # === Ответы на вызовы бота ===
+    async def handle(self, method: str, params: dict):
+        method = method.lower()
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getme":
+            return BOT_USER
+        if method == "getupdates":
+            return await self._get_updates(params)
+        if method == "setwebhook":
+            self.webhook = params.get("url")
+            return True
+        if method == "deletewebhook":
+            self.webhook = None
+            return True
+        if method == "getwebhookinfo":
+            return {"url": self.webhook or "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            started = self._waiting.pop(chat_id, None)
+            if started is not None:
+                self.latencies.append(time.perf_counter() - started)
+            message = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", "")
+            }
+            expected = self._expected.pop(chat_id, None)
+            if expected is not None and not expected.done():
+                expected.set_result((method, params, message))
+            return message
+        return True
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        if offset:
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), float(params.get("timeout") or 0) or 0.1)
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)
+
+    # === Генерация обновлений ===
+    def make_update(self, chat_id: int, text: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+                if text.startswith("/") else []
+            }
+        }
+
+    # Нажатие inline-кнопки под сообщением бота message_id
+    def make_callback(self, chat_id: int, data: str, message_id: int) -> dict:
+        user = {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": user,
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]},
+                    "from": BOT_USER,
+                    "text": ""
+                }
+            }
+        }
+
+    @staticmethod
+    def chat_of(update: dict) -> int:
+        message = update.get("message") or update["callback_query"]["message"]
+        return message["chat"]["id"]
+
+    # Future со следующим сообщением бота в этот чат: (метод, параметры, сообщение)
+    def expect(self, chat_id: int):
+        future = asyncio.get_running_loop().create_future()
+        self._expected[chat_id] = future
+        return future
+
+    async def deliver(self, client, update: dict, secret: str):
+        self._waiting[self.chat_of(update)] = time.perf_counter()
+        if self.webhook:
+            response = await client.post(
+                self.webhook, json=update,
+                headers={"X-Telegram-Bot-Api-Secret-Token": secret or ""}
+            )
+            if response.status_code != 200:
+                logging.warning("⚠️ Webhook ответил %d", response.status_code)
+        else:
+            self.updates.append(update)
+            self._new_update.set()
+
+
+class MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeBotAPI):
+        self.api = api
+
+    async def post(self, token, method):
+        params = {}
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(self.request.body or b"{}")
+        else:
+            for name in self.request.body_arguments:
+                value = self.get_body_argument(name)
+                try:
+                    params[name] = json.loads(value)
+                except ValueError:
+                    params[name] = value
+        result = await self.api.handle(method, params)
+        self.write({"ok": True, "result": result})
+
+    get = post
+
+
+def report(api: FakeBotAPI, total: int, elapsed: float):
+    answered = sorted(api.latencies)
+    if not answered:
+        print("❌ Бот не ответил ни на одно обновление")
+        return
+    p95 = answered[max(int(len(answered) * 0.95) - 1, 0)]
+    print(f"📨 Обновлений: {total}, ответов: {len(answered)} за {elapsed:.1f} с")
+    print(
+        f"⏱️ Задержка ответа: медиана {statistics.median(answered) * 1000:.0f} мс, "
+        f"p95 {p95 * 1000:.0f} мс, макс. {answered[-1] * 1000:.0f} мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--mode", choices=["webhook", "polling"], default="webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=50, help="обновлений в секунду")
+    parser.add_argument("--text", default="/help")
+    parser.add_argument("--wait", type=float, default=30, help="сколько ждать подключения бота")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("tornado.access").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    api = FakeBotAPI()
+    tornado.web.Application([
+        (r"/bot([^/]+)/(\w+)", MethodHandler, {"api": api})
+    ]).listen(args.port, "127.0.0.1")
+    print(f"🤖 Fake Bot API: http://127.0.0.1:{args.port}")
+
+    # Ждём, пока бот запустится (setWebhook или первый getUpdates)
+    deadline = time.monotonic() + args.wait
+    while time.monotonic() < deadline:
+        if (args.mode == "webhook" and api.webhook) or (args.mode == "polling" and api.calls.get("getupdates")):
+            break
+        await asyncio.sleep(0.1)
+    else:
+        print("❌ Бот не подключился")
+        return
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=10) as client:
+        for number in range(args.updates):
+            await api.deliver(client, api.make_update(10_000 + number, args.text), args.secret)
+            await asyncio.sleep(1 / args.rate)
+        # Ждём последние ответы
+        for _ in range(50):
+            if not api._waiting:
+                break
+            await asyncio.sleep(0.1)
+    report(api, args.updates, time.perf_counter() - started)
+    # Отпустить висящий getUpdates бота перед выходом
+    api._new_update.set()
+    await asyncio.sleep(0.1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,284 @@
+# Локальные заменители Google Sheets, Google Calendar и OpenAI для нагрузочного теста.
+#
+# Sheets и Calendar подставляются вместо клиентов gspread и googleapiclient
+# (вызовы идут в потоках, задержка — time.sleep), OpenAI — HTTP-сервер с тем же
+# протоколом /v1/chat/completions, включая потоковые ответы (SSE).
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import tornado.web
+
+
+# === Google Sheets (совместимо с нужной боту частью gspread) ===
+class FakeCell:
+    def __init__(self, row: int, value):
+        self.row = row
+        self.value = value
+
+
+class FakeWorksheet:
+    def __init__(self, title: str, rows, latency: float):
+        self.title = title
+        self.rows = [list(row) for row in rows]
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _append_response(self, first: int, last: int) -> dict:
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:Z{last}"}}
+
+    def get_all_values(self):
+        self._delay()
+        with self._lock:
+            return [list(row) for row in self.rows]
+
+    def col_values(self, col: int):
+        self._delay()
+        with self._lock:
+            return [str(row[col - 1]) if len(row) >= col else "" for row in self.rows]
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row], **kwargs)
+
+    def append_rows(self, rows, **kwargs):
+        self._delay()
+        with self._lock:
+            first = len(self.rows) + 1
+            self.rows.extend(list(row) for row in rows)
+            return self._append_response(first, len(self.rows))
+
+    def delete_rows(self, index: int, end_index: int = None):
+        self._delay()
+        with self._lock:
+            del self.rows[index - 1:(end_index or index)]
+
+    def cell(self, row: int, col: int):
+        self._delay()
+        with self._lock:
+            value = self.rows[row - 1][col - 1] if row <= len(self.rows) and col <= len(self.rows[row - 1]) else None
+        return FakeCell(row, value)
+
+    def find(self, query, in_column: int = None):
+        self._delay()
+        with self._lock:
+            for number, row in enumerate(self.rows, start=1):
+                columns = [row[in_column - 1]] if in_column and len(row) >= in_column else row
+                if query in columns:
+                    return FakeCell(number, query)
+        return None
+
+
+# Ошибки как у gspread: WorksheetNotFound и APIError с кодом 400 для несуществующего диапазона
+class FakeWorksheetNotFound(Exception):
+    pass
+
+
+class FakeAPIError(Exception):
+    def __init__(self, message: str, code: int):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeSpreadsheet:
+    def __init__(self, tabs: dict, latency: float = 0.0):
+        self.latency = latency
+        self.tabs = {title: FakeWorksheet(title, rows, latency) for title, rows in tabs.items()}
+
+    def worksheet(self, title: str):
+        if title not in self.tabs:
+            raise FakeWorksheetNotFound(title)
+        return self.tabs[title]
+
+    def worksheets(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return list(self.tabs.values())
+
+    def values_batch_get(self, ranges, params=None):
+        if self.latency:
+            time.sleep(self.latency)
+        # Как batchGet: один несуществующий лист — ошибка всего запроса
+        for name in ranges:
+            if name.strip("'") not in self.tabs:
+                raise FakeAPIError(f"Unable to parse range: {name}", 400)
+        return {"valueRanges": [
+            {"range": name, "values": self.tabs[name.strip("'")].get_all_values()}
+            for name in ranges
+        ]}
+
+
+# Заменитель gspread.Client: open(name) -> таблица
+class FakeSheetsClient:
+    def __init__(self, spreadsheet: FakeSpreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open(self, name: str):
+        return self.spreadsheet
+
+
+# Таблица с листами, которые читает бот, и заданным числом подписчиков
+def make_spreadsheet(bookings_tab: str, subscribers: int = 0, latency: float = 0.0) -> FakeSpreadsheet:
+    return FakeSpreadsheet({
+        bookings_tab: [["ID", "Дата", "Авто", "Год", "VIN", "Телефон", "Описание", "Визит", "Статус", "Услуга"]],
+        "Подписчики": [["user_id", "lang"]] + [[str(900_000 + i), "Русский"] for i in range(subscribers)],
+        "Акции": [["lang", "text"], ["Русский", "🔧 Весенние скидки!"], ["Polski", "🔧 Wiosenne rabaty!"]],
+        "Контакты": [["key", "value"], ["PHONE", "+48 000 000 000"], ["ADDRESS", "Gdańsk"],
+                     ["LAT", "54.35"], ["LNG", "18.65"]],
+        "Диалоги": [["user_id", "lang", "date", "question", "answer"]],
+        "Услуги": [["key", "minutes", "Русский", "Polski", "English"],
+                   ["diag", "30", "Диагностика", "Diagnostyka", "Diagnostics"],
+                   ["oil", "60", "Замена масла", "Wymiana oleju", "Oil change"],
+                   ["brakes", "120", "Тормозные колодки", "Klocki hamulcowe", "Brake pads"],
+                   ["belt", "240", "Замена ремня ГРМ", "Wymiana rozrządu", "Timing belt"]]
+    }, latency)
+
+
+# === Google Calendar (events.list с syncToken, events.insert, freebusy.query) ===
+class _Call:
+    def __init__(self, func, latency: float):
+        self._func = func
+        self._latency = latency
+
+    def execute(self):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._func()
+
+
+class FakeCalendarService:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._log = []  # (календарь, событие) по порядку; syncToken — позиция в журнале
+        self._events = {}  # календарь -> {id события: событие}
+        self._lock = threading.Lock()
+
+    # Заполнить календари случайными занятыми получасами в рабочие часы (события по очереди в каждый)
+    def populate(self, tz, count: int, days: int, calendars=("primary",), seed: int = 1):
+        rng = random.Random(seed)
+        today = datetime.now(tz).date()
+        for number in range(count):
+            day = today + timedelta(days=rng.randint(1, days))
+            start = tz.localize(datetime.combine(day, datetime.min.time()).replace(hour=rng.randint(9, 17)))
+            start += timedelta(minutes=30 * rng.randint(0, 1))
+            self._store(calendars[number % len(calendars)], {
+                "id": f"seed{number}",
+                "start": {"dateTime": start.isoformat()},
+                "end": {"dateTime": (start + timedelta(minutes=30)).isoformat()}
+            })
+
+    def _store(self, calendar_id: str, event: dict):
+        with self._lock:
+            self._events.setdefault(calendar_id, {})[event["id"]] = event
+            self._log.append((calendar_id, event))
+
+    def events(self):
+        return self
+
+    def freebusy(self):
+        return _FreeBusy(self)
+
+    def list(self, calendarId=None, syncToken=None, pageToken=None, **params):
+        def run():
+            with self._lock:
+                if syncToken:
+                    items = [event for calendar_id, event in self._log[int(syncToken):] if calendar_id == calendarId]
+                else:
+                    items = list(self._events.get(calendarId, {}).values())
+                return {"items": items, "nextSyncToken": str(len(self._log))}
+        return _Call(run, self.latency)
+
+    def insert(self, calendarId=None, body=None, **params):
+        def run():
+            if body["id"] in self._events.get(calendarId, {}):
+                error = Exception("409 duplicate")
+                error.resp = type("Response", (), {"status": 409})()
+                raise error
+            self._store(calendarId, dict(body))
+            return dict(body)
+        return _Call(run, self.latency)
+
+
+class _FreeBusy:
+    def __init__(self, service: FakeCalendarService):
+        self._service = service
+
+    def query(self, body=None):
+        def run():
+            time_min = datetime.fromisoformat(body["timeMin"]).timestamp()
+            time_max = datetime.fromisoformat(body["timeMax"]).timestamp()
+            calendars = {}
+            for item in body["items"]:
+                with self._service._lock:
+                    events = list(self._service._events.get(item["id"], {}).values())
+                calendars[item["id"]] = {"busy": [
+                    {"start": event["start"]["dateTime"], "end": event["end"]["dateTime"]}
+                    for event in events
+                    if datetime.fromisoformat(event["start"]["dateTime"]).timestamp() < time_max
+                    and datetime.fromisoformat(event["end"]["dateTime"]).timestamp() > time_min
+                ]}
+            return {"calendars": calendars}
+        return _Call(run, self._service.latency)
+
+
+# === OpenAI: POST /v1/chat/completions ===
+REPLY_WORDS = (
+    "Проверьте уровень масла и состояние свечей зажигания. Если звук появляется "
+    "при торможении, вероятно, изношены колодки. Рекомендуем диагностику в сервисе."
+).split()
+
+
+class FakeOpenAIHandler(tornado.web.RequestHandler):
+    # first_token — задержка до первого фрагмента, token_interval — между фрагментами
+    def initialize(self, first_token: float = 0.5, token_interval: float = 0.02, stats: dict = None):
+        self.first_token = first_token
+        self.token_interval = token_interval
+        self.stats = stats if stats is not None else {}
+        self._ids = itertools.count(1)
+
+    async def post(self):
+        request = json.loads(self.request.body or b"{}")
+        self.stats["requests"] = self.stats.get("requests", 0) + 1
+        created = int(time.time())
+        await asyncio.sleep(self.first_token)
+
+        if not request.get("stream"):
+            self.write({
+                "id": f"chatcmpl-{next(self._ids)}",
+                "object": "chat.completion",
+                "created": created,
+                "model": request.get("model", "gpt-3.5-turbo"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(REPLY_WORDS[:12])},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 12, "total_tokens": 112}
+            })
+            return
+
+        self.set_header("Content-Type", "text/event-stream")
+        chunk_id = f"chatcmpl-{next(self._ids)}"
+        for number, word in enumerate(REPLY_WORDS):
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.get("model", "gpt-3.5-turbo"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word + " "} if number else {"role": "assistant", "content": word + " "},
+                    "finish_reason": None
+                }]
+            }
+            self.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            await self.flush()
+            await asyncio.sleep(self.token_interval)
+        self.write("data: [DONE]\n\n")
@@ -0,0 +1,330 @@
+# Нагрузочный тест бота без сети: настоящие обработчики app против локальных заменителей.
+#
+# Bot API и OpenAI — HTTP-серверы из tools/fake_bot_api.py и tools/fake_services.py,
+# Google Sheets и Calendar — объекты в памяти вместо клиентов gspread/googleapiclient.
+# У каждого заменителя своя задержка. N пользователей одновременно проходят /start,
+# выбор языка, всю запись (zapis, выбор услуги, листание и выбор слота) и вопрос помощнику; для каждого шага измеряется
+# время до ответа бота, в конце — p50/p95/p99 и обновлений в секунду.
+#
+#   python tools/loadtest.py --users 50
+#   python tools/loadtest.py --users 50 --save-baseline
+#   python tools/loadtest.py --users 50 --sheets-latency 0.3 --openai-first-token 2
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+import tornado.web
+from telegram.warnings import PTBUserWarning
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS)
+sys.path.insert(0, ROOT)
+
+from benchmarks.harness import git_commit
+from fake_bot_api import FakeBotAPI, MethodHandler
+from fake_services import FakeCalendarService, FakeOpenAIHandler, FakeSheetsClient, make_spreadsheet
+
+BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "loadtest.json")
+BOOKING_ANSWERS = ["Audi A4", "2015", "WVWZZZ1JZXW000001", "+48123456789", "Стук в передней подвеске"]
+
+
+QUESTIONS = [
+    "Стучит подвеска на кочках",
+    "Машина плохо заводится утром",
+    "Горит чек двигателя",
+    "Скрипят тормоза при остановке",
+    "Вибрация руля на скорости 100",
+]
+
+
+# Bot API, который дополнительно отмечает окончательный ответ помощника:
+# правку с Markdown после потока или сразу сообщение с Markdown из кэша ответов
+class LoadTestAPI(FakeBotAPI):
+    def __init__(self):
+        super().__init__()
+        self.answers = {}
+
+    def expect_answer(self, chat_id: int):
+        future = asyncio.get_running_loop().create_future()
+        self.answers[chat_id] = future
+        return future
+
+    async def handle(self, method: str, params: dict):
+        result = await super().handle(method, params)
+        if method.lower() in ("editmessagetext", "sendmessage") and params.get("parse_mode") == "Markdown":
+            future = self.answers.pop(int(params.get("chat_id", 0)), None)
+            if future is not None and not future.done():
+                future.set_result(params)
+        return result
+
+
+def buttons(params: dict):
+    keyboard = params.get("reply_markup", {}).get("inline_keyboard", [])
+    return [button["callback_data"] for row in keyboard for button in row]
+
+
+class VirtualUser:
+    def __init__(self, api: LoadTestAPI, chat_id: int, results: dict, timeout: float, think: float):
+        self.api = api
+        self.chat_id = chat_id
+        self.results = results
+        self.timeout = timeout
+        self.think = think
+        self.menu_id = None
+
+    # Отправить обновление и дождаться ответа бота; время пишется в results[step]
+    async def step(self, name: str, update: dict):
+        future = self.api.expect(self.chat_id)
+        started = time.perf_counter()
+        await self.api.deliver(None, update, "")
+        try:
+            method, params, message = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.results["timeouts"][name] = self.results["timeouts"].get(name, 0) + 1
+            raise
+        self.results["steps"].setdefault(name, []).append(time.perf_counter() - started)
+        self.results["updates"] += 1
+        if self.think:
+            await asyncio.sleep(random.uniform(0, self.think))
+        return params, message
+
+    async def start(self):
+        _, message = await self.step("start", self.api.make_update(self.chat_id, "/start"))
+        self.menu_id = message["message_id"]
+        await self.step("language", self.api.make_callback(self.chat_id, "lang_ru", self.menu_id))
+
+    async def booking(self):
+        await self.step("zapis", self.api.make_callback(self.chat_id, "zapis", self.menu_id))
+        for answer in BOOKING_ANSWERS:
+            params, message = await self.step("booking_form", self.api.make_update(self.chat_id, answer))
+
+        choices = buttons(params)
+        if choices and choices[0].startswith("svc:"):
+            # Выбор услуги: слоты приходят правкой того же сообщения
+            params, _ = await self.step("service", self.api.make_callback(self.chat_id, random.choice(choices), message["message_id"]))
+            choices = buttons(params)
+        # Половина пользователей листает вперёд или выбирает день
+        pages = [data for data in choices if data[:2] in ("n:", "d:")]
+        if pages and random.random() < 0.5:
+            data = random.choice(pages)
+            params, _ = await self.step("slot_page", self.api.make_callback(self.chat_id, data, message["message_id"]))
+            if data.startswith("d:"):
+                days = [data for data in buttons(params) if data.startswith("n:")]
+                params, _ = await self.step("slot_page", self.api.make_callback(self.chat_id, random.choice(days), message["message_id"]))
+            choices = buttons(params)
+        choices = [data for data in choices if data.startswith("s:")]
+        random.shuffle(choices)
+        for data in choices[:3]:
+            params, _ = await self.step("slot_selected", self.api.make_callback(self.chat_id, data, message["message_id"]))
+            if params.get("message_id"):
+                # Подтверждение приходит правкой сообщения со слотами
+                self.results["bookings"] += 1
+                return
+        self.results["conflicts"] += 1
+
+    async def assistant(self):
+        await self.step("assistant", self.api.make_callback(self.chat_id, "assistant", self.menu_id))
+        answer = self.api.expect_answer(self.chat_id)
+        started = time.perf_counter()
+        await self.step("assistant_question", self.api.make_update(self.chat_id, random.choice(QUESTIONS)))
+        await asyncio.wait_for(answer, self.timeout)
+        self.results["steps"].setdefault("assistant_answer", []).append(time.perf_counter() - started)
+
+    async def run(self, ramp: float):
+        await asyncio.sleep(random.uniform(0, ramp))
+        try:
+            await self.start()
+            await self.booking()
+            await self.assistant()
+        except asyncio.TimeoutError:
+            self.results["failed_users"] += 1
+
+
+def percentiles(values):
+    values = sorted(values)
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return {"p50": value, "p95": value, "p99": value, "count": len(values)}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "count": len(values)}
+
+
+def configure_env(args, data_dir: str):
+    base = f"http://127.0.0.1:{args.port}"
+    os.environ.update({
+        "TELEGRAM_API_URL": base,
+        "OPENAI_BASE_URL": f"{base}/v1",
+        "BOT_MODE": "polling",
+        "BOT_DATA_DIR": data_dir,
+        "METRICS_PORT": "0",
+    })
+    if args.bays > 1:
+        os.environ["BAY_CALENDARS"] = ",".join(f"Пост {n}=loadtest-bay-{n}" for n in range(1, args.bays + 1))
+    for name, value in {
+        "BOT_TOKEN": "123456:LOADTEST",
+        "ADMIN_ID": "1",
+        "ADMIN_CHAT_ID": "1",
+        "CALENDAR_ID": "loadtest-calendar",
+        "GOOGLE_SHEET_NAME": "loadtest",
+        "GOOGLE_SHEET_TAB": "Zlecenia",
+        "OPENAI_API_KEY": "sk-loadtest",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+async def run(args, data_dir: str):
+    configure_env(args, data_dir)
+    api = LoadTestAPI()
+    openai_stats = {}
+    tornado.web.Application([
+        (r"/bot([^/]+)/(\w+)", MethodHandler, {"api": api}),
+        (r"/v1/chat/completions", FakeOpenAIHandler, {
+            "first_token": args.openai_first_token,
+            "token_interval": args.openai_token_interval,
+            "stats": openai_stats
+        })
+    ]).listen(args.port, "127.0.0.1")
+
+    import bot
+    import pytz
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    calendar = FakeCalendarService(args.calendar_latency)
+    calendar.populate(pytz.timezone("Europe/Warsaw"), args.busy_events, bot.SLOT_HORIZON_DAYS, list(bot.BAYS))
+    bot._clients["sheets"] = FakeSheetsClient(
+        make_spreadsheet(bot.SHEET_TAB, args.subscribers, args.sheets_latency)
+    )
+    bot._clients["calendar"] = calendar
+
+    results = {"steps": {}, "timeouts": {}, "updates": 0, "bookings": 0, "conflicts": 0, "failed_users": 0}
+    async with bot.app:
+        # Тот же порядок, что в run_polling: post_init до start, поэтому фоновые
+        # циклы бота не входят в задачи, которых ждёт app.stop()
+        await bot.on_startup(bot.app)
+        await bot.app.updater.start_polling(poll_interval=0, timeout=5)
+        await bot.app.start()
+        # Дождаться прогрева (локальная копия таблицы и зеркало календаря)
+        for _ in range(100):
+            if all(mirror.ready for mirror in bot.calendar_mirrors.values()) and bot.sheet_mirror.last_pull():
+                break
+            await asyncio.sleep(0.1)
+
+        users = [VirtualUser(api, 10_000 + number, results, args.timeout, args.think) for number in range(args.users)]
+        started = time.perf_counter()
+        await asyncio.gather(*(user.run(args.ramp) for user in users))
+        elapsed = time.perf_counter() - started
+
+        await bot.app.updater.stop()
+        # Отпустить висящий getUpdates
+        api._new_update.set()
+        await bot.on_shutdown(bot.app)
+        await bot.app.stop()
+
+    all_steps = [value for name, values in results["steps"].items() if name != "assistant_answer" for value in values]
+    return {
+        "commit": git_commit(),
+        "users": args.users,
+        "elapsed": elapsed,
+        "updates": results["updates"],
+        "updates_per_second": results["updates"] / elapsed if elapsed else 0.0,
+        "overall": percentiles(all_steps),
+        "steps": {name: percentiles(values) for name, values in results["steps"].items()},
+        "timeouts": results["timeouts"],
+        "bookings": results["bookings"],
+        "conflicts": results["conflicts"],
+        # Заявки по постам — события, созданные ботом (id начинается с bk)
+        "bays": {
+            name: sum(1 for event_id in calendar._events.get(calendar_id, {}) if event_id.startswith("bk"))
+            for calendar_id, name in bot.BAYS.items()
+        },
+        "failed_users": results["failed_users"],
+        "openai_requests": openai_stats.get("requests", 0),
+        "bot_api_calls": api.calls,
+    }
+
+
+def print_report(report: dict):
+    print(f"👥 Пользователей: {report['users']}, обновлений: {report['updates']} за {report['elapsed']:.1f} с "
+          f"({report['updates_per_second']:.1f} в секунду)")
+    print(f"{'шаг':<20}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, stats in list(report["steps"].items()) + [("ВСЕГО", report["overall"])]:
+        print(f"{name:<20}{stats['count']:>8}{stats['p50'] * 1000:>10.0f}{stats['p95'] * 1000:>10.0f}{stats['p99'] * 1000:>10.0f}")
+    print(f"🗓️ Записей: {report['bookings']}, конфликтов слотов: {report['conflicts']}, "
+          f"запросов к OpenAI: {report['openai_requests']}")
+    if len(report.get("bays", {})) > 1:
+        print("🔧 По постам: " + ", ".join(f"{name} — {count}" for name, count in report["bays"].items()))
+    if report["timeouts"] or report["failed_users"]:
+        print(f"❌ Без ответа: {report['timeouts']}, пользователей не прошли сценарий: {report['failed_users']}")
+
+
+def compare(report: dict, threshold: float) -> bool:
+    if not os.path.exists(BASELINE):
+        return True
+    with open(BASELINE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["users"] != report["users"]:
+        print(f"ℹ️ База снята для {baseline['users']} пользователей — сравнение пропущено")
+        return True
+    if len(baseline.get("bays") or [None]) != len(report["bays"]):
+        print("ℹ️ База снята для другого числа постов — сравнение пропущено")
+        return True
+    latency_ratio = report["overall"]["p95"] / baseline["overall"]["p95"]
+    throughput_ratio = baseline["updates_per_second"] / report["updates_per_second"]
+    print(f"📊 Относительно базы: p95 x{latency_ratio:.2f}, пропускная способность x{1 / throughput_ratio:.2f}")
+    if latency_ratio > threshold or throughput_ratio > threshold:
+        print("❌ Производительность хуже допустимого")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--ramp", type=float, default=1.0, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument("--think", type=float, default=0.0, help="максимальная пауза пользователя между шагами, с")
+    parser.add_argument("--timeout", type=float, default=30.0, help="сколько ждать ответа на шаг")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--sheets-latency", type=float, default=0.15)
+    parser.add_argument("--calendar-latency", type=float, default=0.1)
+    parser.add_argument("--openai-first-token", type=float, default=0.5)
+    parser.add_argument("--openai-token-interval", type=float, default=0.02)
+    parser.add_argument("--busy-events", type=int, default=100, help="занятых событий в календаре")
+    parser.add_argument("--bays", type=int, default=1, help="постов (отдельных календарей)")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=1.25, help="допустимое ухудшение относительно базы")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    logging.getLogger("tornado.access").setLevel(logging.WARNING)
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as data_dir:
+        report = asyncio.run(run(args, data_dir))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE), exist_ok=True)
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 База сохранена: {BASELINE}")
+        return
+    if report["failed_users"] or not compare(report, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
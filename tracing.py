@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import cProfile
+import logging
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+SLOW_UPDATE_SECONDS = 2.0
+MAX_CHILDREN = 200
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+# Узел дерева трассировки: обработчик, вызов Sheets/Calendar/OpenAI/Telegram или этап
+class Span:
+    __slots__ = ("name", "start", "end", "children", "dropped")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+        self.dropped = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def add(self, child):
+        if len(self.children) < MAX_CHILDREN:
+            self.children.append(child)
+        else:
+            self.dropped += 1
+
+    # Дерево в виде строк: смещение от начала обновления и длительность
+    def render(self, root_start: float = None, depth: int = 0):
+        root_start = self.start if root_start is None else root_start
+        lines = [
+            f"{'  ' * depth}{'└ ' if depth else ''}{self.name}: {self.duration * 1000:.0f} мс"
+            f"{f' (+{(self.start - root_start) * 1000:.0f} мс)' if depth else ''}"
+        ]
+        for child in self.children:
+            lines.extend(child.render(root_start, depth + 1))
+        if self.dropped:
+            lines.append(f"{'  ' * (depth + 1)}… ещё {self.dropped}")
+        return lines
+
+
+# Вложенный участок текущей трассировки; вне обновления ничего не записывает
+@contextmanager
+def span(name: str):
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name)
+    parent.add(child)
+    token = _current.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        _current.reset(token)
+
+
+# Корень трассировки для одного обновления.
+# Если трассировка уже идёт (обработчик вызван из другого), участок становится вложенным;
+# detached=True — отдельное дерево для фоновой задачи, запущенной из обработчика.
+@contextmanager
+def trace(name: str, detached: bool = False):
+    parent = _current.get()
+    if parent is not None and parent.end is None and not detached:
+        with span(name) as child:
+            yield child
+        return
+
+    root = Span(name)
+    token = _current.set(root)
+    profiling = profiler.start()
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        _current.reset(token)
+        if profiling:
+            profiler.stop()
+        if root.duration >= SLOW_UPDATE_SECONDS:
+            logging.warning("🐢 Медленное обновление:\n%s", "\n".join(root.render()))
+
+
+# Профилирование следующих N обновлений через cProfile.
+# Профиль снимается со всего потока, поэтому параллельные обновления тоже попадают в отчёт.
+class UpdateProfiler:
+    def __init__(self):
+        self.remaining = 0
+        self.profiled = 0
+        self._profile = None
+        self._stats = None
+        self._on_report = None
+
+    @property
+    def armed(self) -> bool:
+        return self.remaining > 0
+
+    # on_report(text) — корутина, получающая отчёт после N обновлений
+    def arm(self, count: int, on_report):
+        self.remaining = count
+        self.profiled = 0
+        self._stats = None
+        self._on_report = on_report
+
+    def disarm(self):
+        self.remaining = 0
+        self._stats = None
+
+    def start(self) -> bool:
+        if not self.armed or self._profile is not None:
+            return False
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Уже работает другой профилировщик
+            return False
+        self._profile = profile
+        return True
+
+    def stop(self):
+        profile, self._profile = self._profile, None
+        profile.disable()
+        if not self.armed:
+            return
+        if self._stats is None:
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+        self.remaining -= 1
+        self.profiled += 1
+        if self.remaining == 0 and self._on_report:
+            asyncio.get_running_loop().create_task(self._on_report(self.report()))
+
+    # Самые затратные функции по собственному времени; ожидание в select цикла событий не считается
+    def report(self, limit: int = 15) -> str:
+        if self._stats is None:
+            return "Профиль пуст"
+        rows = [item for item in self._stats.stats.items() if "of 'select." not in item[0][2]]
+        rows = sorted(rows, key=lambda item: item[1][2], reverse=True)[:limit]
+        lines = [f"🔥 Профиль {self.profiled} обновлений (собств. / общее время, вызовов):"]
+        for (filename, line, function), (_, calls, own, total, _) in rows:
+            location = f" ({os.path.basename(filename)}:{line})" if line else ""
+            lines.append(f"{own * 1000:.0f} / {total * 1000:.0f} мс, {calls}× {function}{location}")
+        return "\n".join(lines)
+
+
+profiler = UpdateProfiler()
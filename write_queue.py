@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sheets_quota import is_quota_error
+
+
+# Отложенная пакетная запись строк в Google Таблицу.
+# Строка сначала сохраняется в локальный журнал SQLite (пользователь сразу
+# получает ответ), затем фоновая задача отправляет накопленные строки
+# одним append_rows на лист — по размеру пачки или по таймеру. Листы отправляются
+# независимо: пачка фонового листа, ждущая квоту, не задерживает лист заявок.
+# В листах keyed_tabs (None — во всех) первая ячейка строки — её ключ (номер заявки,
+# id подписчика): если отправка оборвалась ошибкой, запрос мог всё же выполниться
+# (таймаут), поэтому перед повтором строки, чей ключ уже есть в первом столбце
+# листа, не отправляются. В остальных листах (журнал диалогов) возможен дубль.
+class WriteBehindQueue:
+    def __init__(self, sheets, path: str, batch_size: int = 50,
+                 flush_interval: float = 5.0, max_backoff: float = 300.0, keyed_tabs=None):
+        self._sheets = sheets
+        self.keyed_tabs = None if keyed_tabs is None else set(keyed_tabs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " tab TEXT NOT NULL,"
+            " row TEXT NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        # attempted = 1 — строка была в пачке, отправка которой закончилась ошибкой
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(pending)")]
+        if "attempted" not in columns:
+            self._db.execute("ALTER TABLE pending ADD COLUMN attempted INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self._wake = asyncio.Event()
+        self._flush_locks = {}  # лист -> asyncio.Lock
+        self._stats = {"enqueued": 0, "flushed_rows": 0, "batches": 0, "failures": 0, "skipped_written": 0}
+
+    # Сохранить строку в журнал; запись в таблицу произойдёт позже
+    def enqueue(self, tab: str, row: list):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO pending (tab, row, created) VALUES (?, ?, ?)",
+                (tab, json.dumps(row, ensure_ascii=False), time.time())
+            )
+            self._db.commit()
+        self._stats["enqueued"] += 1
+        if self.pending_count(tab) >= self.batch_size:
+            self._wake.set()
+
+    def pending_count(self, tab: str = None) -> int:
+        with self._db_lock:
+            if tab is None:
+                cursor = self._db.execute("SELECT COUNT(*) FROM pending")
+            else:
+                cursor = self._db.execute("SELECT COUNT(*) FROM pending WHERE tab = ?", (tab,))
+            return cursor.fetchone()[0]
+
+    # Строки, ещё не попавшие в таблицу (для индексов в памяти)
+    def pending_rows(self, tab: str) -> list:
+        with self._db_lock:
+            cursor = self._db.execute("SELECT row FROM pending WHERE tab = ? ORDER BY id", (tab,))
+            return [json.loads(row) for row, in cursor.fetchall()]
+
+    def _next_batch(self, tab: str):
+        with self._db_lock:
+            cursor = self._db.execute(
+                "SELECT id, row, attempted FROM pending WHERE tab = ? ORDER BY id LIMIT ?",
+                (tab, self.batch_size)
+            )
+            return [(row_id, json.loads(row), attempted) for row_id, row, attempted in cursor.fetchall()]
+
+    def _tabs(self):
+        with self._db_lock:
+            cursor = self._db.execute("SELECT DISTINCT tab FROM pending")
+            return [tab for tab, in cursor.fetchall()]
+
+    def _delete(self, ids):
+        with self._db_lock:
+            self._db.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+    def _mark_attempted(self, ids):
+        with self._db_lock:
+            self._db.executemany("UPDATE pending SET attempted = 1 WHERE id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+    # Убрать из пачки строки, которые прошлая оборвавшаяся отправка всё же записала
+    async def _skip_written(self, tab: str, batch):
+        if self.keyed_tabs is not None and tab not in self.keyed_tabs:
+            return batch
+        keys = set(await self._sheets.col_values(tab, 1))
+        written = [row_id for row_id, row, _ in batch if row and str(row[0]) in keys]
+        if written:
+            self._delete(written)
+            self._stats["skipped_written"] += len(written)
+            logging.info("♻️ Уже записаны в \"%s\", не отправляем повторно: %d", tab, len(written))
+        return [item for item in batch if item[0] not in written]
+
+    # Отправить всё накопленное (по одному листу или по всем; листы — параллельно)
+    async def flush(self, tab: str = None):
+        tabs = [tab] if tab else self._tabs()
+        results = await asyncio.gather(*(self._flush_tab(current_tab) for current_tab in tabs),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _flush_tab(self, tab: str):
+        async with self._flush_locks.setdefault(tab, asyncio.Lock()):
+            while True:
+                batch = self._next_batch(tab)
+                if not batch:
+                    break
+                if any(attempted for _, _, attempted in batch):
+                    batch = await self._skip_written(tab, batch)
+                    if not batch:
+                        continue
+                try:
+                    await self._sheets.append_rows(tab, [row for _, row, _ in batch])
+                except Exception as e:
+                    # Отказ по квоте точно ничего не записал, проверять перед повтором нечего
+                    if not is_quota_error(e):
+                        self._mark_attempted([row_id for row_id, _, _ in batch])
+                    raise
+                self._delete([row_id for row_id, _, _ in batch])
+                self._stats["batches"] += 1
+                self._stats["flushed_rows"] += len(batch)
+                logging.info("📤 Записано строк в \"%s\": %d", tab, len(batch))
+
+    # Фоновый цикл: при старте досылает журнал, дальше — по таймеру или размеру
+    async def run_forever(self):
+        backoff = self.flush_interval
+        while True:
+            try:
+                await self.flush()
+                backoff = self.flush_interval
+            except Exception as e:
+                self._stats["failures"] += 1
+                backoff = min(backoff * 2, self.max_backoff)
+                if is_quota_error(e):
+                    logging.warning("⏳ Квота Google Sheets исчерпана, повтор через %.0f с", backoff)
+                else:
+                    logging.error("❌ Ошибка записи в таблицу, повтор через %.0f с: %s", backoff, e)
+                await asyncio.sleep(backoff)
+                continue
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["pending"] = self.pending_count()
+        return stats
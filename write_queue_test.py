@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+from fake_services import FakeAPIError, FakeSpreadsheet, FakeWorksheet
+from sheet_mirror import SheetMirror
+from sheets_async import AsyncSheets
+from write_queue import WriteBehindQueue
+
+
+# Вместо AsyncSheets: один лист в памяти; fail — как оборвётся следующая запись
+class Sheets:
+    def __init__(self):
+        self.worksheet = FakeWorksheet("Zlecenia", [["ID", "Дата"]], latency=0)
+        self.fail = None
+        self.reads = 0
+
+    async def col_values(self, tab, col):
+        self.reads += 1
+        return self.worksheet.col_values(col)
+
+    async def append_rows(self, tab, rows):
+        fail, self.fail = self.fail, None
+        if fail == "before":
+            raise TimeoutError("нет ответа от Google")
+        if fail == "quota":
+            raise FakeAPIError("Quota exceeded", 429)
+        self.worksheet.append_rows(rows)
+        if fail == "after":
+            raise TimeoutError("ответ не дошёл, строки записаны")
+
+
+def booking_ids(sheets):
+    return [row[0] for row in sheets.worksheet.rows[1:]]
+
+
+def flush(queue):
+    asyncio.run(queue.flush())
+
+
+def test_flush_sends_journal_in_one_batch(tmp_path):
+    sheets = Sheets()
+    queue = WriteBehindQueue(sheets, str(tmp_path / "queue.sqlite3"))
+    for booking_id in ("1", "2", "3"):
+        queue.enqueue("Zlecenia", [booking_id, "2026-05-04"])
+    flush(queue)
+    assert booking_ids(sheets) == ["1", "2", "3"]
+    assert queue.stats()["batches"] == 1
+    assert queue.pending_count() == 0
+    assert sheets.reads == 0
+
+
+# Таймаут после фактической записи: повтор не создаёт дублей
+def test_retry_after_timeout_skips_rows_already_written(tmp_path):
+    sheets = Sheets()
+    queue = WriteBehindQueue(sheets, str(tmp_path / "queue.sqlite3"))
+    queue.enqueue("Zlecenia", ["1", "2026-05-04"])
+    queue.enqueue("Zlecenia", ["2", "2026-05-04"])
+    sheets.fail = "after"
+    with pytest.raises(TimeoutError):
+        flush(queue)
+    assert queue.pending_count() == 2
+
+    queue.enqueue("Zlecenia", ["3", "2026-05-04"])
+    flush(queue)
+    assert booking_ids(sheets) == ["1", "2", "3"]
+    assert queue.stats()["skipped_written"] == 2
+    assert queue.pending_count() == 0
+
+
+# Журнал переживает перезапуск вместе с пометкой о неудачной отправке
+def test_rows_lost_by_failed_append_are_resent_after_restart(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    sheets = Sheets()
+    queue = WriteBehindQueue(sheets, path)
+    queue.enqueue("Zlecenia", ["1", "2026-05-04"])
+    sheets.fail = "before"
+    with pytest.raises(TimeoutError):
+        flush(queue)
+
+    flush(WriteBehindQueue(sheets, path))
+    assert booking_ids(sheets) == ["1"]
+    assert sheets.reads == 1
+
+
+def test_quota_error_retries_without_reading_sheet(tmp_path):
+    sheets = Sheets()
+    queue = WriteBehindQueue(sheets, str(tmp_path / "queue.sqlite3"))
+    queue.enqueue("Zlecenia", ["1", "2026-05-04"])
+    sheets.fail = "quota"
+    with pytest.raises(FakeAPIError):
+        flush(queue)
+    flush(queue)
+    assert booking_ids(sheets) == ["1"]
+    assert sheets.reads == 0
+
+
+# Как в боте: журнал пишет через локальную копию таблицы поверх AsyncSheets.
+# Запись отвечает дольше таймаута, но в таблицу попадает
+def test_mirror_backed_queue_skips_rows_written_by_timed_out_append(tmp_path):
+    spreadsheet = FakeSpreadsheet({"Zlecenia": [["ID", "Дата"]]})
+    sheets = AsyncSheets(lambda: spreadsheet, max_workers=1, timeout=0.1)
+    mirror = SheetMirror(sheets, str(tmp_path / "sheets.sqlite3"), tabs=["Zlecenia"])
+    queue = WriteBehindQueue(mirror, str(tmp_path / "queue.sqlite3"))
+    worksheet = spreadsheet.tabs["Zlecenia"]
+
+    async def scenario():
+        queue.enqueue("Zlecenia", ["1", "2026-05-04"])
+        worksheet.latency = 0.3
+        with pytest.raises(asyncio.TimeoutError):
+            await queue.flush()
+        await asyncio.sleep(0.4)
+        worksheet.latency = 0
+        queue.enqueue("Zlecenia", ["2", "2026-05-04"])
+        await queue.flush()
+
+    asyncio.run(scenario())
+    assert [row[0] for row in worksheet.rows[1:]] == ["1", "2"]
+    assert queue.stats()["skipped_written"] == 1
+    assert queue.pending_count() == 0
+
+
+# В листе без ключа (журнал диалогов) первая ячейка — id пользователя, по ней не сверяем
+def test_rows_of_unkeyed_tab_are_resent_without_reading_sheet(tmp_path):
+    sheets = Sheets()
+    queue = WriteBehindQueue(sheets, str(tmp_path / "queue.sqlite3"), keyed_tabs=["Zlecenia"])
+    queue.enqueue("Диалоги", ["42", "вопрос 1"])
+    sheets.fail = "before"
+    with pytest.raises(TimeoutError):
+        flush(queue)
+    queue.enqueue("Диалоги", ["42", "вопрос 2"])
+    flush(queue)
+    assert [row[1] for row in sheets.worksheet.rows[1:]] == ["вопрос 1", "вопрос 2"]
+    assert sheets.reads == 0
+
+
+# Лист, застрявший в ожидании квоты, не задерживает остальные
+def test_tabs_flush_independently(tmp_path):
+    class SlowDialogs(Sheets):
+        def __init__(self):
+            super().__init__()
+            self.release = asyncio.Event()
+
+        async def append_rows(self, tab, rows):
+            if tab == "Диалоги":
+                await self.release.wait()
+            await super().append_rows(tab, rows)
+
+    sheets = SlowDialogs()
+    queue = WriteBehindQueue(sheets, str(tmp_path / "queue.sqlite3"))
+
+    async def scenario():
+        queue.enqueue("Диалоги", ["42", "вопрос"])
+        queue.enqueue("Zlecenia", ["1", "2026-05-04"])
+        background = asyncio.ensure_future(queue.flush())
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(queue.flush("Zlecenia"), timeout=1)
+        written = booking_ids(sheets)
+        sheets.release.set()
+        await background
+        return written
+
+    assert asyncio.run(scenario()) == ["1"]
+    assert queue.pending_count() == 0